@@ -1,7 +1,9 @@
 
 from typing import List
 from schedule import logger
-import os.path, sys, win32com.client,pythoncom, win32com.client, time, subprocess
+import os.path, sys, time
+from backend_sap import obtener_backend
+from tiempos import cronometrar, etapa, anotar_total
 import logging
 import psutil
 
@@ -21,23 +23,36 @@ def kill_zombie_saplogon():
             logger.warning(f"Error matando proceso zombie: {e}")
     return killed
 
+def iniciar_sesion_en(session, u, c):
+    """
+    Completa usuario y clave en la pantalla de login de una sesión ya abierta.
+    """
+    session.findById("wnd[0]/usr/txtRSYST-BNAME").text = u
+    session.findById("wnd[0]/usr/pwdRSYST-BCODE").text = c
+    session.findById("wnd[0]").sendVKey(0)
+    time.sleep(0.5)
+
+@cronometrar("ingresarsap")
 def ingresarsap(amb, u, c, max_retries=10, wait_between=2):
     """
     Abre SAP GUI si no está abierto, espera a que esté listo para scripting y realiza login.
     Mata procesos zombie antes de abrir. Retorna True si tuvo éxito, False si no.
     """
     logger = logging.getLogger(__name__)
+    SapGuiAuto = None
     try:
-        pythoncom.CoInitialize()
-        path = r"C:\Program Files\SAP\FrontEnd\SAPGUI\saplogon.exe" #RISE SAP 800
+        backend = obtener_backend()
+        backend.inicializar_hilo()
         # 1. Matar procesos zombie
         # kill_zombie_saplogon()
         # 2. Intentar obtener objeto COM SAPGUI
         logger.info("Abriendo SAP...")
-        subprocess.Popen(path)
+        etapa("lanzar_saplogon")
+        backend.lanzar_saplogon()
+        etapa("esperar_scripting")
         for i in range(max_retries):
             try:
-                SapGuiAuto = win32com.client.GetObject('SAPGUI')
+                SapGuiAuto = backend.obtener_sapgui()
                 if SapGuiAuto:
                     
                     logger.info("SAP GUI scripting disponible tras lanzar SAP GUI.")
@@ -48,13 +63,14 @@ def ingresarsap(amb, u, c, max_retries=10, wait_between=2):
         if not SapGuiAuto:
             logger.error("No se pudo obtener el objeto SAPGUI para scripting tras varios intentos.")
             return False
-        if not type(SapGuiAuto) == win32com.client.CDispatch:
+        if not backend.es_objeto(SapGuiAuto):
             logger.error("SAPGUI no es un objeto COM válido.")
             return False
         application = SapGuiAuto.GetScriptingEngine
-        if not type(application) == win32com.client.CDispatch:
+        if not backend.es_objeto(application):
             logger.error("No se pudo obtener ScriptingEngine de SAPGUI.")
             return False
+        etapa("abrir_conexion")
         if amb == 'QAS':
             connection = application.OpenConnection("S/4 - QAS", True)
         elif amb == 'PRD':
@@ -62,17 +78,16 @@ def ingresarsap(amb, u, c, max_retries=10, wait_between=2):
         else:
             logger.error(f"Ambiente desconocido: {amb}")
             return False
-        if not type(connection) == win32com.client.CDispatch:
+        if not backend.es_objeto(connection):
             logger.error("No se pudo abrir la conexión SAP.")
             return False
         session = connection.Children(0)
-        if not type(session) == win32com.client.CDispatch:
+        if not backend.es_objeto(session):
             logger.error("No se pudo obtener la sesión SAP.")
             return False
-        session.findById("wnd[0]/usr/txtRSYST-BNAME").text = u
-        session.findById("wnd[0]/usr/pwdRSYST-BCODE").text = c
-        session.findById("wnd[0]").sendVKey(0)
-        time.sleep(0.5)
+        etapa("login")
+        iniciar_sesion_en(session, u, c)
+        anotar_total(resultado="ok")
         logger.info("Login SAP realizado correctamente.")
         return True
     except Exception as e:
@@ -0,0 +1,120 @@
+"""
+Backend de scripting de SAP GUI.
+
+sap.py y abrirsap.py obtienen SAP GUI a través del backend registrado en vez
+de llamar a win32com directamente. En Windows el backend por defecto es COM.
+Fuera de Windows, o para medir rendimiento sin SAP, se registra un
+``BackendSimulado`` sobre el simulador de ZMM_RECEP_DOCU de simulador.py:
+
+    from backend_sap import BackendSimulado, registrar_backend
+    from simulador import SapGuiSimulado
+    registrar_backend(BackendSimulado(SapGuiSimulado(ordenes={...})))
+"""
+
+import logging
+import subprocess  # nosec B404 - solo se lanza saplogon.exe desde una ruta fija
+import threading
+
+try:
+    import pythoncom
+    import win32com.client
+except ImportError:  # Fuera de Windows solo está disponible el backend simulado
+    pythoncom = None
+    win32com = None
+
+logger = logging.getLogger(__name__)
+
+RUTA_SAPLOGON = r"C:\Program Files\SAP\FrontEnd\SAPGUI\saplogon.exe"  # RISE SAP 800
+
+
+class BackendCOM:
+    """SAP GUI real a través de COM (pywin32)."""
+
+    nombre = "com"
+
+    def __init__(self, ruta_saplogon=RUTA_SAPLOGON):
+        if win32com is None:
+            raise RuntimeError("win32com no está disponible: registrar un backend con registrar_backend()")
+        self.ruta_saplogon = ruta_saplogon
+
+    def inicializar_hilo(self):
+        pythoncom.CoInitialize()
+
+    def finalizar_hilo(self):
+        pythoncom.CoUninitialize()
+
+    def lanzar_saplogon(self):
+        subprocess.Popen(self.ruta_saplogon)  # nosec B603 - ruta fija, sin shell
+
+    def obtener_sapgui(self):
+        """Objeto SAPGUI de la tabla de objetos en ejecución (lanza excepción si SAP GUI no está abierto)."""
+        return win32com.client.GetObject('SAPGUI')
+
+    def es_objeto(self, objeto):
+        return isinstance(objeto, win32com.client.CDispatch)
+
+    def contar_llamadas(self, session):
+        """COM no expone un contador de llamadas."""
+        return None
+
+
+class BackendSimulado:
+    """
+    Backend sobre un SAP GUI simulado en memoria.
+
+    Args:
+        sapgui: Objeto con la interfaz de SAPGUI (p.ej. simulador.SapGuiSimulado)
+    """
+
+    nombre = "simulado"
+
+    def __init__(self, sapgui):
+        self.sapgui = sapgui
+
+    def inicializar_hilo(self):
+        pass
+
+    def finalizar_hilo(self):
+        pass
+
+    def lanzar_saplogon(self):
+        logger.info("🧪 SAP GUI simulado: no se lanza saplogon.exe")
+
+    def obtener_sapgui(self):
+        return self.sapgui
+
+    def es_objeto(self, objeto):
+        return objeto is not None
+
+    def contar_llamadas(self, session):
+        """Llamadas COM simuladas hechas sobre la sesión y su grid."""
+        return getattr(session, "total_llamadas", None)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def obtener_backend():
+    """Devuelve el backend registrado; la primera vez crea el de COM."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = BackendCOM()
+        return _backend
+
+
+def registrar_backend(backend):
+    """Reemplaza el backend de SAP GUI (p.ej. por un BackendSimulado en benchmarks y CI)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def inicializar_hilo():
+    """Prepara el hilo actual para usar SAP GUI (CoInitialize con COM)."""
+    obtener_backend().inicializar_hilo()
+
+
+def finalizar_hilo():
+    obtener_backend().finalizar_hilo()
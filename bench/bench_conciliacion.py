@@ -0,0 +1,237 @@
+"""
+Benchmark y verificación de la conciliación de líneas del Excel contra el grid.
+
+Genera una entrega sintética de miles de líneas (EANs con varios lotes y EANs
+que ocupan varias filas del grid), la concilia con el recorrido anterior de
+``process_entrega`` (primera fila de cada EAN, suma de las filas de cada EAN
+repetido y ``planificar_inserciones``, que quedan acá como referencia) y con
+``conciliacion.conciliar``, y comprueba que:
+
+- los conflictos (EANs faltantes y repetidos con sobre-entrega) son los mismos;
+- sin conflictos, cada línea cae después de las inserciones en una fila de su
+  EAN, sin filas repetidas, y coincide con el plan anterior cuando cada EAN
+  tiene una sola fila en el grid.
+
+Uso:
+    python bench/bench_conciliacion.py --lineas 5000 --eans 800
+    python bench/bench_conciliacion.py --lineas 5000 --faltantes 0.01 --sobre-entrega 0.02
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+from collections import Counter
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pandas as pd
+
+from conciliacion import conciliar_entrega, CONFLICTO_EAN_NO_ENCONTRADO
+from grilla import GridSnapshot
+from plan_entrega import preparar_plan_entrega
+from planificador_filas import Insercion, AsignacionLinea, PlanInserciones, verificar_asignaciones
+from simulador import FakeGrid
+
+
+def generar_entrega(lineas, eans, filas_dobles=0.1, faltantes=0.0, sobre_entrega=0.0, semilla=0):
+    """
+    Arma las filas del grid y el DataFrame del Excel de una entrega sintética.
+
+    Args:
+        lineas: Líneas del Excel
+        eans: EANs distintos
+        filas_dobles: Fracción de EANs que ocupan dos filas del grid
+        faltantes: Fracción de EANs del Excel que no están en el grid
+        sobre_entrega: Fracción de EANs repetidos cuya suma supera lo pendiente
+
+    Returns:
+        tuple: (filas del grid, DataFrame con las columnas de leer_entrega_excel)
+    """
+    rnd = random.Random(semilla)
+    codigos = [str(7790000000000 + i) for i in range(eans)]
+    lineas_excel = codigos + [rnd.choice(codigos) for _ in range(max(0, lineas - eans))]
+    rnd.shuffle(lineas_excel)
+    cantidades = [rnd.randint(1, 50) for _ in lineas_excel]
+
+    totales = {}
+    for ean, cantidad in zip(lineas_excel, cantidades):
+        totales[ean] = totales.get(ean, 0) + cantidad
+    repetidos = {ean for ean, veces in Counter(lineas_excel).items() if veces > 1}
+
+    filas_grid = []
+    for ean in codigos:
+        if rnd.random() < faltantes:
+            continue
+        total = totales[ean]
+        if ean in repetidos and rnd.random() < sobre_entrega:
+            total -= 1
+        partes = [total] if rnd.random() >= filas_dobles or total < 2 else [total // 2, total - total // 2]
+        for parte in partes:
+            filas_grid.append({"ZZEAN13": ean, "CANT_PEND": str(parte),
+                               "CANTIDAD": "", "CHARG": "", "VENCIMIENTO": ""})
+    rnd.shuffle(filas_grid)
+
+    hoy = date.today()
+    df = pd.DataFrame({
+        'Remito y Nro. Entrega': ["0114R02179687 0082214777"] * len(lineas_excel),
+        'EAN': lineas_excel,
+        'Cant confirmada': [float(c) for c in cantidades],
+        'Lote estuche': [f"L{i:06d}" for i in range(len(lineas_excel))],
+        'Fecha Vencimiento': [hoy + timedelta(days=rnd.randint(30, 900)) for _ in lineas_excel],
+    })
+    return filas_grid, df
+
+
+def planificar_inserciones(plan, filas_origen):
+    """
+    Calcula las inserciones y la fila final de cada línea de la entrega.
+
+    Cada EAN usa su fila del grid para el primer lote y necesita una fila
+    nueva por cada lote adicional, insertada justo debajo (lo que hace btn[7]).
+    La fila final de una fila original ``x`` es ``x`` más la cantidad de filas
+    insertadas debajo de orígenes anteriores a ``x``.
+
+    Args:
+        plan: {ean: PlanEAN} de preparar_plan_entrega
+        filas_origen: {ean: fila del grid} antes de insertar
+
+    Returns:
+        PlanInserciones: inserciones de abajo hacia arriba, asignaciones ordenadas por fila y total de filas agregadas
+
+    Raises:
+        ValueError: Si dos EANs comparten la misma fila de origen o falta la fila de un EAN
+    """
+    faltantes = [ean for ean in plan if filas_origen.get(ean) is None]
+    if faltantes:
+        raise ValueError(f"EANs sin fila en el grid: {faltantes}")
+    usadas = {}
+    for ean in plan:
+        fila = filas_origen[ean]
+        if fila in usadas:
+            raise ValueError(f"Los EANs {usadas[fila]} y {ean} apuntan a la misma fila {fila} del grid")
+        usadas[fila] = ean
+
+    inserciones = [
+        Insercion(filas_origen[ean], len(plan_ean.filas_excel) - 1, ean)
+        for ean, plan_ean in plan.items()
+        if len(plan_ean.filas_excel) > 1
+    ]
+    inserciones.sort(key=lambda insercion: insercion.fila_origen, reverse=True)
+
+    asignaciones = []
+    agregadas_arriba = 0
+    for fila_origen in sorted(usadas):
+        plan_ean = plan[usadas[fila_origen]]
+        fila_final = fila_origen + agregadas_arriba
+        for i in range(len(plan_ean.filas_excel)):
+            asignaciones.append(AsignacionLinea(
+                fila=fila_final + i,
+                ean=plan_ean.ean,
+                cantidad=str(int(plan_ean.cantidades[i])),
+                lote=str(plan_ean.lotes[i]),
+                vencimiento=plan_ean.vencimientos[i],
+                fila_excel=plan_ean.filas_excel[i],
+            ))
+        agregadas_arriba += len(plan_ean.filas_excel) - 1
+
+    return PlanInserciones(inserciones, asignaciones, agregadas_arriba)
+
+
+def conciliacion_anterior(snapshot, df):
+    """
+    Recorrido EAN por EAN que usaba process_entrega. Devuelve (plan o None, EANs con error).
+
+    Cada EAN tomaba la primera fila del grid con ese EAN y los EANs repetidos se
+    validaban sumando lo pendiente de todas sus filas.
+    """
+    plan = preparar_plan_entrega(df)
+    filas_origen, eans_con_error = {}, []
+    for ean, plan_ean in plan.items():
+        fila = snapshot.indice.primera_fila(ean, 0)
+        if fila is None:
+            eans_con_error.append(ean)
+            continue
+        if len(plan_ean.filas_excel) > 1:
+            pendiente = sum(entrada.cantidad_pendiente for entrada in snapshot.entradas_ean(ean)
+                            if entrada.cantidad_pendiente is not None)
+            if plan_ean.total_cantidad > pendiente:
+                eans_con_error.append(ean)
+                continue
+        filas_origen[ean] = fila
+    if eans_con_error:
+        return None, eans_con_error
+    return planificar_inserciones(plan, filas_origen), []
+
+
+def eans_despues_de_insertar(filas_grid, plan):
+    """EAN de cada fila del grid después de ejecutar las inserciones del plan (lo que hace btn[7])."""
+    eans = [fila["ZZEAN13"] for fila in filas_grid]
+    for insercion in plan.inserciones:
+        eans[insercion.fila_origen + 1:insercion.fila_origen + 1] = [insercion.ean] * insercion.cantidad
+    return eans
+
+
+def medir(funcion, repeticiones):
+    mejor, resultado = float("inf"), None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lineas", type=int, default=5000)
+    parser.add_argument("--eans", type=int, default=800)
+    parser.add_argument("--filas-dobles", type=float, default=0.1, help="Fracción de EANs con dos filas en el grid")
+    parser.add_argument("--faltantes", type=float, default=0.0)
+    parser.add_argument("--sobre-entrega", type=float, default=0.0)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    filas_grid, df = generar_entrega(args.lineas, args.eans, args.filas_dobles, args.faltantes,
+                                     args.sobre_entrega, args.semilla)
+    print(f"Entrega sintética: {len(df)} líneas, {args.eans} EANs, {len(filas_grid)} filas en el grid")
+
+    snapshot = GridSnapshot(FakeGrid(filas_grid))
+    snapshot.refrescar()
+    tiempo_anterior, (plan_anterior, errores_anteriores) = medir(lambda: conciliacion_anterior(snapshot, df),
+                                                                  args.repeticiones)
+    tiempo_nuevo, conciliacion = medir(lambda: conciliar_entrega(snapshot, df), args.repeticiones)
+
+    print(f"{'conciliación':<28}{'tiempo (s)':>12}")
+    print(f"{'anterior (EAN por EAN)':<28}{tiempo_anterior:>12.3f}")
+    print(f"{'vectorizada':<28}{tiempo_nuevo:>12.3f}{tiempo_anterior / tiempo_nuevo:>10.1f}x")
+
+    conflictos = conciliacion.conflictos
+    faltantes = sum(1 for conflicto in conflictos if conflicto.tipo == CONFLICTO_EAN_NO_ENCONTRADO)
+    print(f"Conflictos: {len(conflictos)} ({faltantes} EANs faltantes, {len(conflictos) - faltantes} sobre-entregas)")
+    if sorted(conflicto.ean for conflicto in conflictos) != sorted(errores_anteriores):
+        print("❌ Los conflictos no coinciden con el recorrido anterior")
+        return 1
+    if conflictos:
+        print("✅ Mismos conflictos que el recorrido anterior")
+        return 0
+
+    plan = conciliacion.plan
+    eans = eans_despues_de_insertar(filas_grid, plan)
+    desalineadas = verificar_asignaciones(plan.asignaciones, lambda fila: eans[fila])
+    filas = [asignacion.fila for asignacion in plan.asignaciones]
+    if desalineadas or len(set(filas)) != len(filas) or len(filas) != len(df):
+        print(f"❌ Plan inválido: {len(desalineadas)} líneas desalineadas, {len(filas) - len(set(filas))} filas repetidas")
+        return 1
+    iguales = plan.asignaciones == plan_anterior.asignaciones and plan.inserciones == plan_anterior.inserciones
+    print(f"✅ Plan completo: {len(filas)} líneas, {plan.filas_agregadas} filas de lote"
+          f"{' (igual al anterior)' if iguales else ' (otra fila de origen para EANs con varias filas en el grid)'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
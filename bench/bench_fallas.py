@@ -0,0 +1,173 @@
+"""
+Verificación con el SAP GUI simulado de las fallas alrededor de la generación del remito.
+
+Procesa entregas sintéticas (``bench_pipeline.generar_entregas``) con
+``procesar_excel_files`` haciendo fallar un botón del popup después de su
+efecto (``EntornoSimulado.fallas``, como un timeout de COM cuando SAP ya
+procesó el clic) y comprueba a dónde va cada archivo:
+
+- btn[21] (todavía no se generó nada): falla transitoria, el Excel queda en la
+  cola de reintentos y el reintento genera la entrega una sola vez;
+- BOT_GENERAR (SAP pudo crear la entrega): estado incierto, el Excel va a
+  ``Errores/No_Procesados`` para verificarlo a mano y nunca a la cola de
+  reintentos, que la duplicaría.
+
+Además comprueba que las celdas que SAP devuelve con otro formato
+(``EntornoSimulado.formatos``: cantidad con coma decimal, lote con otras
+mayúsculas, fecha ISO) cuentan como escritas y la entrega se genera, y que
+una celda que SAP muestra con otro valor (lote recortado) va a errores para
+revisar a mano sin pasar por la cola de reintentos.
+
+Uso:
+    python bench/bench_fallas.py
+"""
+
+import os
+import sys
+import shutil
+import logging
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import bot_runner
+import etiquetas_pdf
+from backend_sap import BackendSimulado, registrar_backend
+from bench_pipeline import Escenario, BaseSimulada, generar_entregas
+from cache_oc import cache_datos_oc
+from conn import PoolConexiones, registrar_pool
+from diario_errores import diario_errores, leer_diario
+from estado_entrega import RegistroEstados, registrar_registro_estados
+from huellas import RegistroHuellas, registrar_registro_huellas
+from registro_errores import RegistroErrores, registrar_registro_errores
+from reintentos import ColaReintentos, registrar_cola_reintentos, CLASE_TRANSITORIA
+from sesion_sap import GestorSesionSAP
+from simulador import SapGuiSimulado, ID_BOTON_REMITO, ID_BOTON_GENERAR
+
+
+class RelojManual:
+    """Reloj de la cola de reintentos que solo avanza a pedido."""
+
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+
+# Formato de usuario SAP distinto del que escribe sap.py. Los lotes del bench ya están en
+# mayúsculas, así que se devuelven en minúsculas para que no coincidan como texto.
+FORMATOS_USUARIO = {
+    "CANTIDAD": lambda valor: f"{int(valor):,}".replace(",", ".") + ",000",
+    "CHARG": lambda valor: str(valor).lower(),
+    "VENCIMIENTO": lambda valor: datetime.strptime(str(valor), "%d.%m.%Y").strftime("%Y-%m-%d"),
+}
+
+# SAP recorta el lote: la celda se lee pero con otro valor
+FORMATOS_LOTE_RECORTADO = {"CHARG": lambda valor: str(valor)[:3]}
+
+
+def correr_falla(boton=None, formatos=None):
+    """
+    Procesa una entrega con ``boton`` fallando una vez y después procesa lo que haya quedado en la cola.
+
+    Args:
+        boton: Id del botón que falla una vez (None: ninguno)
+        formatos: ``EntornoSimulado.formatos`` del grid simulado
+
+    Returns:
+        dict: {'entregas', 'reintentos', 'clase', 'en_errores', 'estados', 'tipos'}
+    """
+    directorio_anterior = os.getcwd()
+    trabajo = tempfile.mkdtemp(prefix="bench_fallas_")
+    base = None
+    try:
+        os.chdir(trabajo)
+        no_procesados = Path(trabajo) / "no_procesados"
+        no_procesados.mkdir()
+        ordenes, ekpo, mara = generar_entregas(str(no_procesados), Escenario("falla", 5, 0.2, 1))
+
+        base = BaseSimulada(ekpo, mara)
+        registrar_pool('PRD', PoolConexiones(base.conectar, query_salud="SELECT 1"))
+        cache_datos_oc.invalidar()
+        registrar_registro_huellas(RegistroHuellas(":memory:"))
+        registrar_registro_errores(RegistroErrores(":memory:"))
+        estados = RegistroEstados(":memory:")
+        registrar_registro_estados(estados)
+        reloj = RelojManual()
+        cola = ColaReintentos(":memory:", reloj=reloj)
+        registrar_cola_reintentos(cola)
+        diario_errores.configurar(Path(trabajo) / "Errores")
+        etiquetas_pdf.registrar_recolector(
+            etiquetas_pdf.RecolectorEtiquetas(Path(trabajo) / "etiquetas", usar_watchdog=False).iniciar()
+        )
+
+        sapgui = SapGuiSimulado(ordenes=ordenes, carpeta_etiquetas=str(Path(trabajo) / "etiquetas"),
+                                fallas={boton: RuntimeError(f"Timeout de COM en {boton}")} if boton else None,
+                                formatos=formatos)
+        registrar_backend(BackendSimulado(sapgui))
+        bot_runner.registrar_gestor_sesion_sap(GestorSesionSAP("PRD", "BENCH", "bench"))
+
+        bot_runner.procesar_excel_files(sorted(no_procesados.glob("*.xlsx")))
+        pendientes = cola.pendientes()
+
+        # Pasado cualquier plazo de espera, la cola se procesa como en un ciclo ocioso del bot
+        reloj.ahora = 10 ** 9
+        reintentados = cola.tomar_vencidos()
+        if reintentados:
+            bot_runner.procesar_excel_files([Path(reintento.ruta) for reintento in reintentados])
+
+        diario_errores.vaciar()
+        return {
+            "entregas": sum(len(sesion.entregas) for sesion in sapgui.sesiones()),
+            "reintentos": len(reintentados),
+            "clase": pendientes[0].clase if pendientes else None,
+            "en_errores": len(list((Path(trabajo) / "Errores" / "No_Procesados").glob("*.xlsx"))),
+            "estados": len(estados.en_curso()),
+            "tipos": [registro.get("tipo") for registro in leer_diario(diario_errores.archivos())],
+        }
+    finally:
+        etiquetas_pdf.registrar_recolector(None)
+        diario_errores.configurar(None)
+        os.chdir(directorio_anterior)
+        if base is not None:
+            base.cerrar()
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    fallos = 0
+
+    resultado = correr_falla(ID_BOTON_REMITO)
+    ok = (resultado["clase"] == CLASE_TRANSITORIA and resultado["reintentos"] == 1
+          and resultado["entregas"] == 1 and resultado["en_errores"] == 0 and resultado["estados"] == 0)
+    print(f"{'✅' if ok else '❌'} btn[21] falla antes de generar: {resultado}")
+    fallos += not ok
+
+    resultado = correr_falla(ID_BOTON_GENERAR)
+    ok = (resultado["clase"] is None and resultado["reintentos"] == 0 and resultado["entregas"] == 1
+          and resultado["en_errores"] == 1 and resultado["estados"] == 0
+          and resultado["tipos"] == ["estado_incierto"])
+    print(f"{'✅' if ok else '❌'} BOT_GENERAR falla con la entrega creada: {resultado}")
+    fallos += not ok
+
+    resultado = correr_falla(formatos=FORMATOS_USUARIO)
+    ok = (resultado["clase"] is None and resultado["entregas"] == 1 and resultado["en_errores"] == 0
+          and resultado["tipos"] == [None])
+    print(f"{'✅' if ok else '❌'} SAP devuelve las celdas con otro formato: {resultado}")
+    fallos += not ok
+
+    resultado = correr_falla(formatos=FORMATOS_LOTE_RECORTADO)
+    ok = (resultado["clase"] is None and resultado["reintentos"] == 0 and resultado["entregas"] == 0
+          and resultado["en_errores"] == 1 and resultado["tipos"] == ["escritura_distinta"])
+    print(f"{'✅' if ok else '❌'} SAP muestra otro valor en las celdas: {resultado}")
+    fallos += not ok
+
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
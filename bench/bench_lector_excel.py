@@ -0,0 +1,124 @@
+"""
+Benchmark del lector de Excel de entregas.
+
+Compara tiempo y pico de memoria de la lectura anterior de ``process_entrega``
+(``pd.read_excel`` de la hoja completa y filtro por ``Fecha Vencimiento``)
+contra ``lector_excel`` sobre una planilla sintética de proveedor con muchas
+columnas que el bot no usa.
+
+Uso:
+    python bench/bench_lector_excel.py --filas 50000 --columnas-extra 40
+    python bench/bench_lector_excel.py --archivo "no_procesados/5600025440 0082214777.xlsx"
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pandas as pd
+from openpyxl import Workbook
+
+from lector_excel import COLUMNAS_ENTREGA, iterar_registros_entrega, leer_entrega_excel
+
+
+def generar_planilla(path, filas, columnas_extra, semilla=0):
+    """
+    Escribe una planilla de proveedor con las columnas de entrega mezcladas entre columnas de relleno.
+
+    Un 5% de las filas no tiene vencimiento (subtotales/pie de planilla) para que el filtro trabaje.
+    """
+    rnd = random.Random(semilla)
+    extra = [f"Dato proveedor {i}" for i in range(columnas_extra)]
+    encabezados = extra[: columnas_extra // 2] + COLUMNAS_ENTREGA + extra[columnas_extra // 2:]
+    eans = [str(7790000000000 + rnd.randrange(10 ** 6)) for _ in range(max(1, filas // 20))]
+    hoy = date.today()
+
+    # Sin write_only para que el archivo tenga <dimension>, como los que guarda Excel
+    libro = Workbook()
+    hoja = libro.active
+    hoja.title = "Entrega"
+    hoja.append(encabezados)
+    for _ in range(filas):
+        valores = {
+            'Remito y Nro. Entrega': "0114R02179687 0082214777",
+            'EAN': int(rnd.choice(eans)),
+            'Cant confirmada': rnd.randint(1, 500),
+            'Lote estuche': f"L{rnd.randrange(10 ** 6):06d}",
+            'Fecha Vencimiento': hoy + timedelta(days=rnd.randint(30, 900)) if rnd.random() > 0.05 else None,
+        }
+        hoja.append([valores.get(columna, rnd.random()) for columna in encabezados])
+    libro.save(path)
+
+
+def lectura_anterior(path):
+    df = pd.read_excel(path)
+    return df[df['Fecha Vencimiento'].notna()]
+
+
+def lectura_streaming(path):
+    return sum(1 for _ in iterar_registros_entrega(path))
+
+
+def medir(funcion, path, repeticiones):
+    """
+    Devuelve (mejor tiempo en s, pico de memoria en MB).
+
+    El tiempo se mide sin tracemalloc (que lo distorsiona) y el pico en una ejecución aparte.
+    """
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(path)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    tracemalloc.start()
+    try:
+        funcion(path)
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return mejor, pico / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--archivo", help="Excel a leer (por defecto se genera uno sintético)")
+    parser.add_argument("--filas", type=int, default=20000)
+    parser.add_argument("--columnas-extra", type=int, default=30)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    temporal = None
+    path = args.archivo
+    if path is None:
+        temporal = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
+        temporal.close()
+        path = temporal.name
+        print(f"Generando planilla sintética: {args.filas} filas, {len(COLUMNAS_ENTREGA) + args.columnas_extra} columnas")
+        generar_planilla(path, args.filas, args.columnas_extra)
+
+    try:
+        casos = [
+            ("pd.read_excel + filtro", lectura_anterior),
+            ("leer_entrega_excel", leer_entrega_excel),
+            ("iterar_registros_entrega", lectura_streaming),
+        ]
+        resultados = [(nombre, *medir(funcion, path, args.repeticiones)) for nombre, funcion in casos]
+        base_tiempo, base_memoria = resultados[0][1], resultados[0][2]
+        print(f"{'lector':<28}{'tiempo (s)':>12}{'pico (MB)':>12}{'vs anterior':>22}")
+        for nombre, tiempo, memoria in resultados:
+            print(f"{nombre:<28}{tiempo:>12.3f}{memoria:>12.1f}"
+                  f"{base_tiempo / tiempo:>10.1f}x / {base_memoria / memoria:>6.1f}x mem")
+    finally:
+        if temporal is not None:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
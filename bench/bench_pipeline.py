@@ -0,0 +1,440 @@
+"""
+Benchmark de punta a punta del procesamiento de entregas.
+
+Genera Excel sintéticos con el nombre real de los archivos (``<OC> <entrega>.xlsx``),
+los procesa con ``procesar_excel_files`` -> ``process_entrega`` contra el SAP GUI
+simulado (backend_sap.BackendSimulado + simulador.SapGuiSimulado) y una base
+SQLite en memoria con EKPO/MARA registrada como pool 'PRD', y reporta por
+escenario el tiempo de cada etapa, las llamadas COM, las consultas a la base y
+el pico de RSS.
+
+Con ``--guardar`` escribe una línea base JSON; con ``--comparar`` la compara
+contra la corrida actual y termina con código 1 si alguna etapa empeoró más que
+el umbral.
+
+Uso:
+    python bench/bench_pipeline.py --guardar bench/linea_base.json
+    python bench/bench_pipeline.py --comparar bench/linea_base.json --umbral 0.25
+    python bench/bench_pipeline.py --escenario 200:0.3:2 --latencia-com 0.001
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import logging
+import argparse
+import tempfile
+import threading
+import platform
+from pathlib import Path
+from datetime import date, datetime, timedelta
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import psutil
+from openpyxl import Workbook
+
+import sap
+import bot_runner
+import escritor_grid
+import etiquetas_pdf
+from backend_sap import BackendSimulado, registrar_backend
+from cache_oc import cache_datos_oc
+from conn import PoolConexiones, registrar_pool
+from huellas import RegistroHuellas, registrar_registro_huellas
+from diario_errores import diario_errores
+from estado_entrega import RegistroEstados, registrar_registro_estados
+from reintentos import ColaReintentos, registrar_cola_reintentos
+from lector_excel import COLUMNAS_ENTREGA
+from registro_errores import RegistroErrores, registrar_registro_errores
+from sesion_sap import GestorSesionSAP
+from simulador import SapGuiSimulado, TrazaLlamadas, generar_orden
+
+# lineas: líneas del Excel; repetidos: fracción de líneas que repiten un EAN (lotes extra)
+Escenario = namedtuple("Escenario", ["nombre", "lineas", "repetidos", "archivos"])
+
+ESCENARIOS_POR_DEFECTO = [
+    Escenario("1x0.0", 1, 0.0, 3),
+    Escenario("50x0.1", 50, 0.1, 3),
+    Escenario("200x0.25", 200, 0.25, 2),
+    Escenario("500x0.2", 500, 0.2, 1),
+]
+
+UMBRAL_TIEMPO = 0.20   # fracción de empeoramiento tolerada en tiempos
+MINIMO_SEGUNDOS = 0.05  # diferencias menores se consideran ruido
+UMBRAL_RSS = 0.25
+
+SCHEMA_SQLITE = """
+    CREATE TABLE EKPO (MANDT TEXT, EBELN TEXT, EBELP INTEGER, MATNR TEXT, EAN11 TEXT, MENGE REAL);
+    CREATE TABLE MARA (MANDT TEXT, MATNR TEXT, EAN11 TEXT, ZZCADENA_FRIO TEXT);
+"""
+
+
+def parsear_escenario(texto):
+    """Convierte 'lineas:repetidos:archivos' en un Escenario."""
+    partes = texto.split(":")
+    lineas = int(partes[0])
+    repetidos = float(partes[1]) if len(partes) > 1 else 0.0
+    archivos = int(partes[2]) if len(partes) > 2 else 1
+    if not 1 <= lineas <= 500 or not 0.0 <= repetidos < 1.0 or archivos < 1:
+        raise argparse.ArgumentTypeError(f"Escenario inválido: {texto} (lineas 1-500, repetidos 0-1, archivos >= 1)")
+    return Escenario(f"{lineas}x{repetidos}", lineas, repetidos, archivos)
+
+
+# --- Datos sintéticos ---------------------------------------------------------------------
+
+def generar_entregas(carpeta, escenario, semilla=0):
+    """
+    Escribe los Excel de un escenario y arma los datos de SAP y de la base que les corresponden.
+
+    Cada archivo es una OC distinta. Las primeras líneas usan un EAN nuevo cada una y el
+    resto repite EANs ya usados (un lote más), según ``escenario.repetidos``. La cantidad
+    pendiente de cada posición en el grid es la suma de sus lotes, así la validación de
+    cantidades de EANs repetidos pasa.
+
+    Returns:
+        tuple: (ordenes {oc: filas del grid}, filas EKPO, filas MARA)
+    """
+    rnd = random.Random(semilla)
+    ordenes, ekpo, mara = {}, [], []
+    hoy = date.today()
+    for numero in range(escenario.archivos):
+        oc = str(5600100000 + numero)
+        entrega = str(82200000 + numero).zfill(10)
+        distintos = max(1, round(escenario.lineas * (1 - escenario.repetidos)))
+        eans = [str(7790000000000 + numero * 1000 + i) for i in range(distintos)]
+        lineas = eans + [rnd.choice(eans) for _ in range(escenario.lineas - distintos)]
+        rnd.shuffle(lineas)
+
+        libro = Workbook()
+        hoja = libro.active
+        hoja.append(COLUMNAS_ENTREGA)
+        pendientes = defaultdict(int)
+        for i, ean in enumerate(lineas):
+            cantidad = rnd.randint(1, 50)
+            pendientes[ean] += cantidad
+            hoja.append([f"0114R{numero:08d} {entrega}", int(ean), cantidad, f"L{i:05d}",
+                         hoy + timedelta(days=rnd.randint(60, 900))])
+        libro.save(os.path.join(carpeta, f"{oc} {entrega}.xlsx"))
+
+        orden = generar_orden(eans)
+        for posicion, fila in enumerate(orden):
+            # Materiales distintos por OC: en MARA cada MATNR tiene un solo EAN
+            fila["MATNR"] = str(10000000 + numero * 1000 + posicion)
+            fila["CANT_PEND"] = str(pendientes[fila["ZZEAN13"]])
+        ordenes[oc] = orden
+        frio = "X" if numero % 2 else ""
+        for posicion, fila in enumerate(orden):
+            ekpo.append(("100", oc, (posicion + 1) * 10, fila["MATNR"], fila["ZZEAN13"], float(fila["CANT_PEND"])))
+            mara.append(("100", fila["MATNR"], fila["ZZEAN13"], frio))
+    return ordenes, ekpo, mara
+
+
+class BaseSimulada:
+    """
+    Base SQLite en memoria con EKPO/MARA que cuenta cada sentencia ejecutada (viajes a la base).
+    """
+
+    def __init__(self, ekpo, mara):
+        self.consultas = 0
+        self._lock = threading.Lock()
+        self._uri = f"file:bench_{id(self)}?mode=memory&cache=shared"
+        # Mantener una conexión abierta para que la base en memoria no desaparezca
+        self._raiz = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        self._raiz.executescript(SCHEMA_SQLITE)
+        self._raiz.executemany("INSERT INTO EKPO VALUES (?, ?, ?, ?, ?, ?)", ekpo)
+        self._raiz.executemany("INSERT INTO MARA VALUES (?, ?, ?, ?)", mara)
+        self._raiz.commit()
+
+    def _contar(self, sentencia):
+        with self._lock:
+            self.consultas += 1
+
+    def conectar(self):
+        conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        conn.set_trace_callback(self._contar)
+        return conn
+
+    def cerrar(self):
+        self._raiz.close()
+
+
+# --- Instrumentación ----------------------------------------------------------------------
+
+class Cronometro:
+    """Acumula tiempo y cantidad de llamadas por etapa (seguro entre hilos)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.etapas = defaultdict(lambda: {"segundos": 0.0, "llamadas": 0})
+
+    def registrar(self, etapa, segundos):
+        with self._lock:
+            self.etapas[etapa]["segundos"] += segundos
+            self.etapas[etapa]["llamadas"] += 1
+
+    def envolver(self, etapa, funcion):
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                self.registrar(etapa, time.perf_counter() - inicio)
+        envoltura.__wrapped__ = funcion
+        return envoltura
+
+
+# (módulo u objeto, atributo, etapa). Las etapas anidadas se miden en forma inclusiva.
+PUNTOS_MEDICION = [
+    (bot_runner, "procesar_excel_files", "total"),
+    (bot_runner, "prefetch_ocs_pendientes", "prefetch_db"),
+    (bot_runner, "prevalidar_archivos", "prevalidacion"),
+    (bot_runner, "process_entrega", "process_entrega"),
+    (sap, "leer_entrega_excel", "lectura_excel"),
+    (sap, "conciliar_entrega", "conciliacion"),
+    (sap, "ejecutar_inserciones", "inserciones"),
+    (escritor_grid.EscritorGrid, "aplicar", "escritura_grid"),
+    (sap, "esperar_sesion_libre", "espera_sesion"),
+    (etiquetas_pdf.RecolectorEtiquetas, "esperar", "espera_etiquetas"),
+    (time, "sleep", "sleep"),
+]
+
+
+@contextmanager
+def instrumentar(cronometro, sin_dormir=False):
+    """Reemplaza temporalmente las funciones de PUNTOS_MEDICION por versiones cronometradas."""
+    originales = []
+    try:
+        for objetivo, atributo, etapa in PUNTOS_MEDICION:
+            original = getattr(objetivo, atributo)
+            originales.append((objetivo, atributo, original))
+            funcion = original
+            if objetivo is time and sin_dormir:
+                funcion = lambda segundos: None  # noqa: E731 - se registra la espera pedida sin dormir
+            setattr(objetivo, atributo, cronometro.envolver(etapa, funcion))
+        yield cronometro
+    finally:
+        for objetivo, atributo, original in reversed(originales):
+            setattr(objetivo, atributo, original)
+
+
+class MonitorRSS:
+    """Muestrea el RSS del proceso en un hilo para obtener el pico de un escenario."""
+
+    def __init__(self, intervalo=0.01):
+        self.intervalo = intervalo
+        self.pico = 0
+        self._proceso = psutil.Process()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _muestrear(self):
+        while not self._detener.is_set():
+            self.pico = max(self.pico, self._proceso.memory_info().rss)
+            self._detener.wait(self.intervalo)
+
+    def __enter__(self):
+        self.pico = self._proceso.memory_info().rss
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._detener.set()
+        self._hilo.join()
+        self.pico = max(self.pico, self._proceso.memory_info().rss)
+
+
+# --- Corrida ------------------------------------------------------------------------------
+
+def correr_escenario(escenario, latencia_com=0.0, sin_dormir=False, semilla=0):
+    """
+    Procesa los archivos de un escenario de punta a punta y devuelve sus métricas.
+
+    Returns:
+        dict: {'etapas', 'llamadas_com', 'llamadas_com_por_metodo', 'consultas_db',
+               'pico_rss_mb', 'archivos', 'lineas', 'entregas_generadas', 'etiquetas_renombradas'}
+    """
+    directorio_anterior = os.getcwd()
+    trabajo = tempfile.mkdtemp(prefix="bench_pipeline_")
+    base = None
+    try:
+        # process_entrega escribe Errores/ y Resumenes/ en el directorio actual
+        os.chdir(trabajo)
+        no_procesados = Path(trabajo) / "no_procesados"
+        no_procesados.mkdir()
+        ordenes, ekpo, mara = generar_entregas(str(no_procesados), escenario, semilla)
+
+        base = BaseSimulada(ekpo, mara)
+        registrar_pool('PRD', PoolConexiones(base.conectar, query_salud="SELECT 1"))
+        cache_datos_oc.invalidar()
+        # Registros vacíos en cada corrida: las repeticiones generan las mismas entregas
+        registrar_registro_huellas(RegistroHuellas(":memory:"))
+        registrar_registro_errores(RegistroErrores(":memory:"))
+        registrar_registro_estados(RegistroEstados(":memory:"))
+        registrar_cola_reintentos(ColaReintentos(":memory:"))
+        diario_errores.configurar(Path(trabajo) / "Errores")
+        recolector = etiquetas_pdf.RecolectorEtiquetas(Path(trabajo) / "etiquetas", usar_watchdog=False)
+        etiquetas_pdf.registrar_recolector(recolector.iniciar())
+
+        traza = TrazaLlamadas()
+        sapgui = SapGuiSimulado(ordenes=ordenes, traza=traza, latencias={"*": latencia_com},
+                                carpeta_etiquetas=str(Path(trabajo) / "etiquetas"))
+        registrar_backend(BackendSimulado(sapgui))
+        bot_runner.registrar_gestor_sesion_sap(GestorSesionSAP("PRD", "BENCH", "bench"))
+
+        cronometro = Cronometro()
+        archivos = sorted(no_procesados.glob("*.xlsx"))
+        with MonitorRSS() as monitor, instrumentar(cronometro, sin_dormir):
+            bot_runner.procesar_excel_files(archivos)
+
+        llamadas = traza.contar()
+        return {
+            "archivos": escenario.archivos,
+            "lineas": escenario.lineas,
+            "repetidos": escenario.repetidos,
+            "entregas_generadas": sum(len(sesion.entregas) for sesion in sapgui.sesiones()),
+            "etiquetas_renombradas": sum(1 for ruta in (Path(trabajo) / "etiquetas").glob("R*.pdf")),
+            "etapas": {etapa: dict(datos) for etapa, datos in sorted(cronometro.etapas.items())},
+            "llamadas_com": sum(llamadas.values()),
+            "llamadas_com_por_metodo": dict(llamadas.most_common()),
+            "consultas_db": base.consultas,
+            "pico_rss_mb": round(monitor.pico / (1024 * 1024), 1),
+        }
+    finally:
+        etiquetas_pdf.registrar_recolector(None)
+        diario_errores.configurar(None)
+        os.chdir(directorio_anterior)
+        if base is not None:
+            base.cerrar()
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+
+def correr(escenarios, repeticiones=1, latencia_com=0.0, sin_dormir=False, semilla=0):
+    """
+    Corre todos los escenarios; con varias repeticiones se queda con el mejor tiempo por etapa.
+
+    Returns:
+        dict: Resultado completo, listo para guardar como línea base
+    """
+    resultados = {}
+    for escenario in escenarios:
+        mejor = None
+        for _ in range(repeticiones):
+            medicion = correr_escenario(escenario, latencia_com, sin_dormir, semilla)
+            if mejor is None:
+                mejor = medicion
+                continue
+            for etapa, datos in medicion["etapas"].items():
+                anterior = mejor["etapas"].setdefault(etapa, datos)
+                anterior["segundos"] = min(anterior["segundos"], datos["segundos"])
+            mejor["pico_rss_mb"] = min(mejor["pico_rss_mb"], medicion["pico_rss_mb"])
+        resultados[escenario.nombre] = mejor
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {"repeticiones": repeticiones, "latencia_com": latencia_com,
+                       "sin_dormir": sin_dormir, "semilla": semilla},
+        "escenarios": resultados,
+    }
+
+
+def comparar(base, actual, umbral=UMBRAL_TIEMPO, minimo_segundos=MINIMO_SEGUNDOS, umbral_rss=UMBRAL_RSS):
+    """
+    Compara dos resultados de ``correr``.
+
+    Los tiempos empeoran si superan la base en más de ``umbral`` y en más de ``minimo_segundos``.
+    Llamadas COM y consultas a la base son deterministas: cualquier aumento es una regresión.
+
+    Returns:
+        tuple: (lista de filas (escenario, métrica, base, actual, variación, regresión), hubo_regresion)
+    """
+    filas = []
+    for nombre, medicion in actual["escenarios"].items():
+        anterior = base.get("escenarios", {}).get(nombre)
+        if anterior is None:
+            continue
+        for etapa, datos in medicion["etapas"].items():
+            previo = anterior["etapas"].get(etapa)
+            if previo is None:
+                continue
+            antes, ahora = previo["segundos"], datos["segundos"]
+            regresion = ahora > antes * (1 + umbral) and ahora - antes > minimo_segundos
+            filas.append((nombre, f"{etapa} (s)", antes, ahora, _variacion(antes, ahora), regresion))
+        for metrica in ("llamadas_com", "consultas_db"):
+            antes, ahora = anterior[metrica], medicion[metrica]
+            filas.append((nombre, metrica, antes, ahora, _variacion(antes, ahora), ahora > antes))
+        antes, ahora = anterior["pico_rss_mb"], medicion["pico_rss_mb"]
+        filas.append((nombre, "pico_rss_mb", antes, ahora, _variacion(antes, ahora), ahora > antes * (1 + umbral_rss)))
+    return filas, any(fila[-1] for fila in filas)
+
+
+def _variacion(antes, ahora):
+    return (ahora - antes) / antes if antes else 0.0
+
+
+def imprimir_resultado(resultado):
+    for nombre, medicion in resultado["escenarios"].items():
+        print(f"\n=== {nombre}: {medicion['archivos']} archivos x {medicion['lineas']} líneas, "
+              f"{medicion['entregas_generadas']} entregas generadas, "
+              f"{medicion.get('etiquetas_renombradas', 0)} etiquetas renombradas ===")
+        print(f"{'etapa':<24}{'segundos':>12}{'llamadas':>10}")
+        for etapa, datos in sorted(medicion["etapas"].items(), key=lambda item: -item[1]["segundos"]):
+            print(f"{etapa:<24}{datos['segundos']:>12.3f}{datos['llamadas']:>10}")
+        print(f"llamadas COM: {medicion['llamadas_com']}  consultas DB: {medicion['consultas_db']}  "
+              f"pico RSS: {medicion['pico_rss_mb']} MB")
+
+
+def imprimir_comparacion(filas):
+    print(f"\n{'escenario':<12}{'métrica':<30}{'base':>12}{'actual':>12}{'var':>9}")
+    for nombre, metrica, antes, ahora, variacion, regresion in filas:
+        marca = "  ❌ REGRESIÓN" if regresion else ""
+        print(f"{nombre:<12}{metrica:<30}{antes:>12.3f}{ahora:>12.3f}{variacion:>+9.0%}{marca}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--escenario", action="append", type=parsear_escenario,
+                        help="lineas:repetidos:archivos (se puede repetir); por defecto 1, 50, 200 y 500 líneas")
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--latencia-com", type=float, default=0.0, help="Segundos por llamada COM simulada")
+    parser.add_argument("--sin-dormir", action="store_true", help="Registrar los time.sleep sin dormir")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--guardar", help="Archivo JSON donde guardar el resultado como línea base")
+    parser.add_argument("--comparar", help="Línea base JSON contra la cual comparar")
+    parser.add_argument("--umbral", type=float, default=UMBRAL_TIEMPO, help="Empeoramiento de tiempo tolerado (0.2 = 20%%)")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar el log del bot")
+    args = parser.parse_args()
+
+    # sap.py configura el logging al importarse; sin --verbose se silencia el log del bot
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    resultado = correr(args.escenario or ESCENARIOS_POR_DEFECTO, args.repeticiones,
+                       args.latencia_com, args.sin_dormir, args.semilla)
+    imprimir_resultado(resultado)
+
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Línea base guardada en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        filas, hubo_regresion = comparar(base, resultado, args.umbral)
+        imprimir_comparacion(filas)
+        if hubo_regresion:
+            print("\n❌ Hay etapas que empeoraron más que el umbral")
+            sys.exit(1)
+        print("\n✅ Sin regresiones respecto de la línea base")
+
+
+if __name__ == "__main__":
+    main()
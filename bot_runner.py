@@ -12,6 +12,8 @@ import schedule
 from datetime import datetime
 from pathlib import Path
 import re
+import queue
+import shutil
 from abrirsap import cerrar_sap
 # Agregar el directorio padre al path para importar módulos
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
@@ -21,12 +23,58 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bot_farmanet'))
 
 # Importar módulos del bot
-from sap import process_entrega, get_sap_session
-from utils import setup_logging, ensure_directories
+from backend_sap import inicializar_hilo, finalizar_hilo
+from sap import process_entrega, get_sap_session, abrir_sesiones_sap, rechazar_entrega_prevalidada
+from utils import setup_logging, ensure_directories, prefetch_datos_maestros
+from pool_sesiones import PoolSesionesSAP, MAX_SESIONES
+from esperas import registro_esperas
+from cache_oc import cache_datos_oc
+from vigilante_carpeta import VigilanteCarpeta, listar_excel
+from tiempos import cronometrar, etapa, anotar_total, registro_tiempos
+from log_asincrono import configurar_logging_asincrono
+from huellas import huella_entrega, obtener_registro_huellas, forzar_reproceso_por_entorno
+from diario_errores import diario_errores
+from etiquetas_pdf import obtener_recolector, ESPERA_MAXIMA
+from reintentos import obtener_cola_reintentos
+from prevalidacion import prevalidar_archivo
 
 # Importar módulos de SAP
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bot_farmanet'))
 from abrirsap import ingresarsap
+from sesion_sap import GestorSesionSAP
+
+# Se reemplaza por el logger de setup_logging_sap() al correr como script
+logger = logging.getLogger(__name__)
+
+# Sesión SAP autenticada que se reutiliza entre ciclos del scheduler (ver obtener_gestor_sesion_sap)
+_gestor_sesion_sap = None
+
+# Reprocesar aunque la huella del Excel ya tenga resultado (--forzar o SAP_FORZAR_REPROCESO=1)
+FORZAR_REPROCESO = forzar_reproceso_por_entorno()
+
+# Resultado de procesar_excel_files cuando no se pudo abrir la sesión SAP
+SIN_SESION_SAP = -1
+
+def obtener_gestor_sesion_sap():
+    """
+    Devuelve el gestor de la sesión SAP del bot, creándolo la primera vez.
+
+    El usuario y la clave se leen de USER_SAP y PASS_SAP (.env, lo carga sap.py)
+    y el ambiente de AMBIENTE_SAP (PRD por defecto).
+    """
+    global _gestor_sesion_sap
+    if _gestor_sesion_sap is None:
+        usuario = os.getenv("USER_SAP")
+        clave = os.getenv("PASS_SAP")
+        if not usuario or not clave:
+            logger.error("❌ Faltan USER_SAP y/o PASS_SAP en el entorno (.env): no se podrá ingresar a SAP")
+        _gestor_sesion_sap = GestorSesionSAP(os.getenv("AMBIENTE_SAP", "PRD"), usuario, clave)
+    return _gestor_sesion_sap
+
+def registrar_gestor_sesion_sap(gestor):
+    """Reemplaza el gestor global (p.ej. uno con otras credenciales o sobre un SAP simulado)."""
+    global _gestor_sesion_sap
+    _gestor_sesion_sap = gestor
 
 def extraer_numero_oc(filename):
     """
@@ -65,18 +113,24 @@ def extraer_numero_oc(filename):
         return None
 
 def setup_logging_sap():
-    """Configurar logging específico para el bot SAP"""
+    """
+    Configurar logging específico para el bot SAP.
+    
+    Archivo y consola se escriben desde un hilo aparte (log_asincrono), así el hilo
+    que maneja SAP no espera al disco ni a la consola. El nivel se controla con
+    SAP_LOG_NIVEL (DEBUG muestra el detalle por fila del grid).
+    """
     log_dir = Path(__file__).parent.parent / "Logs"
     log_dir.mkdir(exist_ok=True)
     
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - SAP_PROCESSOR - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_dir / f"sap_processor_{datetime.now().strftime('%Y%m%d')}.log"),
-            logging.StreamHandler()
-        ]
-    )
+    formato = logging.Formatter('%(asctime)s - SAP_PROCESSOR - %(levelname)s - %(message)s')
+    handlers = [
+        logging.FileHandler(log_dir / f"sap_processor_{datetime.now().strftime('%Y%m%d')}.log", encoding="utf-8"),
+        logging.StreamHandler()
+    ]
+    for handler in handlers:
+        handler.setFormatter(formato)
+    configurar_logging_asincrono(handlers)
     return logging.getLogger(__name__)
 
 def ensure_directories_sap():
@@ -94,80 +148,281 @@ def ensure_directories_sap():
         directory.mkdir(parents=True, exist_ok=True)
         logger.info(f"Directorio creado/verificado: {directory}")
 
-def procesar_excel_files():
+def procesar_archivo_excel(sap_session, excel_file, oc_number, errores_dir, datos_maestros=None, huella=None):
+    """
+    Procesa un archivo de entrega en la sesión SAP dada.
+    
+    Args:
+        sap_session: Sesión SAP a utilizar
+        excel_file (Path): Archivo Excel de la entrega
+        oc_number (str): Número de OC extraído del nombre del archivo
+        errores_dir (Path): Carpeta donde mover el archivo si falla el procesamiento
+        datos_maestros: DatosMaestrosOC del prefetch (opcional)
+        huella: Huella de contenido calculada en filtrar_ya_procesados (opcional)
+    """
+    try:
+        logger.info(f"🔄 Procesando: {excel_file.name}")
+        logger.info(f"📋 OC identificada: {oc_number}")
+        
+        # Procesar la entrega usando la sesión de SAP
+        return process_entrega(sap_session, str(excel_file), oc_number, datos_maestros, huella)
+            
+    except Exception as e:
+        logger.error(f"❌ Error procesando {excel_file.name}: {str(e)}")
+        # Verificar si el archivo existe antes de intentar moverlo
+        if excel_file.exists():
+            try:
+                error_path = errores_dir / excel_file.name
+                excel_file.rename(error_path)
+                logger.info(f"📁 Archivo movido a errores: {error_path}")
+            except Exception as move_error:
+                logger.error(f"❌ Error moviendo archivo a errores: {str(move_error)}")
+        else:
+            logger.info(f"ℹ️ Archivo no existe (ya fue movido): {excel_file.name}")
 
-    #logger.info(f"Se cerró SAP.")
-    """Procesar todos los Excel files en la carpeta no_procesados"""
-    logger.info("🔍 Iniciando procesamiento de Excel files...")
+def filtrar_ya_procesados(excel_files, forzar=False):
+    """
+    Descarta, antes de tocar SAP, los Excel cuya huella de contenido ya tiene resultado.
+    
+    Se omiten los ya creados en SAP y los que fallaron por un motivo que depende solo
+    del contenido (ver huellas.py); los que fallaron por SAP se vuelven a intentar.
+    
+    Args:
+        excel_files (list[Path]): Archivos pendientes
+        forzar (bool): Procesar todos igual (se calculan las huellas pero no se consultan)
+        
+    Returns:
+        tuple: (archivos a procesar, {archivo: huella})
+    """
+    registro = obtener_registro_huellas()
+    pendientes = []
+    huellas = {}
+    omitidos = 0
+    for excel_file in excel_files:
+        try:
+            huella = huella_entrega(excel_file, extraer_numero_oc(excel_file.stem))
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo calcular la huella de {excel_file.name}: {e}")
+            pendientes.append(excel_file)
+            continue
+        huellas[excel_file] = huella
+        motivo = None if forzar else registro.motivo_omision(huella)
+        if motivo:
+            omitidos += 1
+            logger.debug(f"⏭️ {excel_file.name}: {motivo}")
+            continue
+        pendientes.append(excel_file)
+    if omitidos:
+        logger.info(f"⏭️ {omitidos} archivos omitidos por huella ya procesada (reprocesar con --forzar)")
+    elif forzar:
+        logger.info("🔁 Reproceso forzado: no se consultan las huellas")
+    return pendientes, huellas
+
+def prefetch_ocs_pendientes(excel_files):
+    """
+    Obtiene en bloque los datos maestros de todas las OCs de los archivos pendientes.
     
-    # PRIMERO: Abrir SAP y autenticarse
-    logger.info("🔧 Abriendo SAP GUI...")
+    Returns:
+        DatosMaestrosOC o None si falla la consulta (cada archivo consulta su OC por separado)
+    """
+    ocs = {extraer_numero_oc(excel_file.stem) for excel_file in excel_files}
+    ocs.discard(None)
     try:
-        ingresarsap("PRD", "cprosianiuk", "Scienza2025Scienza2025#")
-        sap_session = get_sap_session()
-        logger.info("✅ SAP abierto y autenticado correctamente")
+        return prefetch_datos_maestros(ocs)
     except Exception as e:
-        logger.error(f"❌ Error abriendo SAP: {e}")
-        return
+        logger.warning(f"⚠️ No se pudo hacer el prefetch de datos maestros: {e}")
+        return None
+
+def prevalidar_archivos(excel_files, datos_maestros):
+    """
+    Valida cada Excel contra las posiciones de su OC en la base y rechaza, sin tocar SAP,
+    los que no pueden pasar (ver prevalidacion.py).
+    
+    Args:
+        excel_files (list[Path]): Archivos pendientes
+        datos_maestros: DatosMaestrosOC del prefetch (None si falló: no se valida nada)
+        
+    Returns:
+        list[Path]: Archivos que siguen a SAP
+    """
+    if datos_maestros is None:
+        return excel_files
+    pendientes = []
+    for excel_file in excel_files:
+        oc_number = extraer_numero_oc(excel_file.stem)
+        prevalidacion = prevalidar_archivo(excel_file, oc_number, datos_maestros) if oc_number else None
+        if prevalidacion is None or prevalidacion.valida:
+            pendientes.append(excel_file)
+            continue
+        rechazar_entrega_prevalidada(str(excel_file), oc_number, prevalidacion)
+    rechazados = len(excel_files) - len(pendientes)
+    if rechazados:
+        logger.info(f"🚫 {rechazados} archivos rechazados por la validación previa en base (sin abrir SAP)")
+    return pendientes
+
+def configurar_cache_datos_oc():
+    """Persistir el cache de datos maestros en Temp para sobrevivir a los reinicios del bot"""
+    cache_datos_oc.ruta_persistencia = str(Path(__file__).parent.parent / "Temp" / "cache_datos_oc.pkl")
+    cache_datos_oc.cargar()
+
+def log_cache_datos_oc():
+    """Registrar hits/misses del cache de datos maestros y guardarlo a disco"""
+    stats = cache_datos_oc.estadisticas()
+    logger.info(f"📦 Cache datos OC: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entradas']} entradas ({stats['tasa_hits']:.0%} hits)")
+    cache_datos_oc.persistir()
+
+def obtener_cantidad_sesiones():
+    """Cantidad de sesiones SAP en paralelo (variable de entorno SAP_SESIONES, por defecto 1)"""
+    try:
+        return max(1, min(int(os.getenv("SAP_SESIONES", "1")), MAX_SESIONES))
+    except ValueError:
+        logger.warning("⚠️ SAP_SESIONES inválido, se usa 1 sesión")
+        return 1
+
+@cronometrar("procesar_excel_files")
+def procesar_excel_files(excel_files=None, forzar=None):
+
+    #logger.info(f"Se cerró SAP.")
+    """
+    Procesar los Excel files de la carpeta no_procesados
+    
+    Args:
+        excel_files (list[Path]): Archivos a procesar; por defecto todos los de la carpeta
+        forzar (bool): Reprocesar aunque la huella ya tenga resultado (por defecto FORZAR_REPROCESO)
+        
+    Returns:
+        int: Cantidad de archivos que se mandaron a SAP (0 si no había nada nuevo,
+        SIN_SESION_SAP si no se pudo abrir SAP)
+    """
+    logger.info("🔍 Iniciando procesamiento de Excel files...")
     
     base_dir = Path(__file__).parent.parent
     no_procesados_dir = base_dir / "no_procesados"
     errores_dir = base_dir / "Errores" / "SAP_Processor"
     
-    # Verificar que existe la carpeta
-    if not no_procesados_dir.exists():
-        logger.warning("⚠️ Carpeta no_procesados no existe")
-        return
+    # Buscar archivos Excel (el vigilante ya los entrega listos)
+    if excel_files is None:
+        # Verificar que existe la carpeta
+        if not no_procesados_dir.exists():
+            logger.warning("⚠️ Carpeta no_procesados no existe")
+            return 0
+        excel_files = listar_excel(no_procesados_dir)
+    excel_files = [excel_file for excel_file in excel_files if excel_file.exists()]
     
-    # Buscar archivos Excel
-    excel_files = list(no_procesados_dir.glob("*.xlsx")) + list(no_procesados_dir.glob("*.xls"))
+    # Descartar lo ya procesado antes de abrir SAP
+    etapa("huellas")
+    excel_files, huellas = filtrar_ya_procesados(excel_files, FORZAR_REPROCESO if forzar is None else forzar)
     
     if not excel_files:
         logger.info("📭 No hay archivos Excel para procesar")
-        return
+        return 0
     
     logger.info(f"📁 Encontrados {len(excel_files)} archivos Excel para procesar")
+    anotar_total(filas=len(excel_files))
     
-    for excel_file in excel_files:
+    # Prefetch de datos maestros de todas las OCs pendientes en una sola consulta
+    etapa("prefetch_datos_maestros")
+    datos_maestros = prefetch_ocs_pendientes(excel_files)
+    
+    # Rechazar contra la base lo que SAP rechazaría igual, antes de abrir la GUI
+    etapa("prevalidacion", filas=len(excel_files))
+    excel_files = prevalidar_archivos(excel_files, datos_maestros)
+    if not excel_files:
+        logger.info("📭 Ningún archivo pasó la validación previa")
+        return 0
+    
+    # Recién ahora hace falta SAP: reutilizar la sesión autenticada o ingresar
+    etapa("sesion_sap")
+    try:
+        sap_session = obtener_gestor_sesion_sap().obtener_sesion()
+        if sap_session is None:
+            return SIN_SESION_SAP
+        logger.info("✅ SAP abierto y autenticado correctamente")
+    except Exception as e:
+        logger.error(f"❌ Error abriendo SAP: {e}")
+        return SIN_SESION_SAP
+    
+    # Abrir las sesiones adicionales y repartir los archivos entre ellas
+    etapa("procesar_archivos", filas=len(excel_files))
+    obtener_recolector()  # indexar la carpeta de etiquetas antes de imprimir la primera
+    cantidad_sesiones = obtener_cantidad_sesiones()
+    if cantidad_sesiones > 1 and sap_session is not None:
+        # El pool usa solo las sesiones que realmente están abiertas (ni más de las pedidas)
+        cantidad_sesiones = min(cantidad_sesiones, abrir_sesiones_sap(sap_session, cantidad_sesiones))
+    
+    pool = PoolSesionesSAP(
+        fabrica_sesion=get_sap_session,
+        tamano=cantidad_sesiones,
+        inicializar_hilo=inicializar_hilo,
+        finalizar_hilo=finalizar_hilo,
+    )
+    pool.procesar(
+        excel_files,
+        lambda session, excel_file, oc_number: procesar_archivo_excel(session, excel_file, oc_number, errores_dir, datos_maestros,
+                                                                      huellas.get(excel_file)),
+        lambda excel_file: extraer_numero_oc(excel_file.stem),
+    )
+    obtener_gestor_sesion_sap().registrar_actividad()
+    # Las etiquetas se renombran en segundo plano: esperar las que falten antes de cerrar el ciclo
+    etapa("etiquetas_pendientes")
+    if not obtener_recolector().esperar(timeout=ESPERA_MAXIMA):
+        logger.warning("⚠️ Quedaron etiquetas PDF sin renombrar al terminar el ciclo")
+    diario_errores.vaciar()
+    registro_esperas.log_resumen()
+    log_cache_datos_oc()
+    return len(excel_files)
+
+def procesar_reintentos():
+    """
+    Reintenta las entregas de la cola de reintentos cuyo turno ya llegó (ver reintentos.py).
+    
+    Se llama en los ciclos en que no llegaron archivos nuevos: cada Excel vuelve a
+    no_procesados con su nombre original y se procesa como cualquier otro; si vuelve
+    a fallar, mover_archivo_a_errores lo reagenda o, agotados los intentos, lo manda a errores.
+    
+    Returns:
+        int: Cantidad de entregas reintentadas
+    """
+    cola_reintentos = obtener_cola_reintentos()
+    vencidos = cola_reintentos.tomar_vencidos()
+    if not vencidos:
+        return 0
+    
+    no_procesados_dir = Path(__file__).parent.parent / "no_procesados"
+    no_procesados_dir.mkdir(parents=True, exist_ok=True)
+    excel_files = []
+    for reintento in vencidos:
+        origen = Path(reintento.ruta)
+        destino = no_procesados_dir / reintento.nombre
+        if not origen.exists():
+            logger.warning(f"⚠️ El archivo a reintentar ya no está: {origen}")
+            cola_reintentos.quitar(reintento.huella)
+            continue
+        if destino.exists():
+            # Llegó de nuevo a no_procesados: se procesa esa copia y esta queda para revisar
+            logger.warning(f"⚠️ {reintento.nombre} ya está en no_procesados, se descarta el reintento de {origen}")
+            cola_reintentos.quitar(reintento.huella)
+            continue
         try:
-            logger.info(f"🔄 Procesando: {excel_file.name}")
-            
-            # Extraer OC del nombre del archivo (soporta múltiples formatos)
-            filename = excel_file.stem
-            oc_number = extraer_numero_oc(filename)
-            
-            if not oc_number:
-                logger.warning(f"⚠️ No se pudo extraer OC de: {filename}")
-                continue
-            
-            logger.info(f"📋 OC identificada: {oc_number}")
-            
-            # Procesar la entrega usando la sesión de SAP
-            process_entrega(sap_session, str(excel_file), oc_number)
-        
-                
-        except Exception as e:
-            logger.error(f"❌ Error procesando {excel_file.name}: {str(e)}")
-            # Verificar si el archivo existe antes de intentar moverlo
-            if excel_file.exists():
-                try:
-                    error_path = errores_dir / excel_file.name
-                    excel_file.rename(error_path)
-                    logger.info(f"📁 Archivo movido a errores: {error_path}")
-                except Exception as move_error:
-                    logger.error(f"❌ Error moviendo archivo a errores: {str(move_error)}")
-            else:
-                logger.info(f"ℹ️ Archivo no existe (ya fue movido): {excel_file.name}")
-<<<<<<< HEAD
-    cerrar_sap(sap_session)
-=======
->>>>>>> f6cc96365f1ca92d53bdf4ff75d818edcc3dd1b3
+            shutil.move(str(origen), str(destino))
+        except OSError as e:
+            logger.error(f"❌ No se pudo devolver {origen.name} a no_procesados: {e}")
+            continue
+        logger.info(f"🔁 Reintento {reintento.intentos} ({reintento.clase}) de {reintento.nombre}: {reintento.motivo}")
+        excel_files.append(destino)
+    
+    if excel_files and procesar_excel_files(excel_files) == SIN_SESION_SAP:
+        logger.warning(f"⚠️ Sin sesión SAP: {len(excel_files)} reintentos quedan en no_procesados para el próximo ciclo")
+    return len(excel_files)
 
 def job_sap_processor():
     """Job principal del bot SAP Processor"""
     logger.info("🚀 Iniciando Bot SAP Processor")
     try:
-        procesar_excel_files()
+        # Los reintentos usan los ciclos ociosos, sin demorar los archivos nuevos (ni si SAP no abrió)
+        if procesar_excel_files() == 0:
+            procesar_reintentos()
         logger.info("✅ Bot SAP Processor completado")
     except Exception as e:
         logger.error(f"❌ Error en Bot SAP Processor: {str(e)}")
@@ -179,13 +434,59 @@ def schedule_sap_processor():
     
     logger.info("⏰ Bot SAP Processor programado - ejecutándose cada 5 minutos")
     logger.info("🔄 Para detener: Ctrl+C")
+    gestor_sesion_sap = obtener_gestor_sesion_sap()
     
     try:
         while True:
             schedule.run_pending()
+            # Mantener viva la sesión SAP entre ejecuciones
+            gestor_sesion_sap.keepalive()
             time.sleep(30)  # Verificar cada 30 segundos
     except KeyboardInterrupt:
         logger.info("Bot SAP Processor detenido por el usuario")
+        cerrar_sap(gestor_sesion_sap.session)
+
+def vigilar_sap_processor():
+    """Procesar los Excel apenas llegan a no_procesados (eventos de archivo, con sondeo como respaldo)"""
+    no_procesados_dir = Path(__file__).parent.parent / "no_procesados"
+    cola = queue.Queue()
+    vigilante = VigilanteCarpeta(no_procesados_dir, cola)
+    vigilante.iniciar()
+    gestor_sesion_sap = obtener_gestor_sesion_sap()
+    
+    logger.info("🔄 Para detener: Ctrl+C")
+    
+    try:
+        while True:
+            try:
+                excel_file = cola.get(timeout=30)
+            except queue.Empty:
+                # Mantener viva la sesión SAP mientras no llegan archivos y aprovechar para los reintentos
+                gestor_sesion_sap.keepalive()
+                try:
+                    procesar_reintentos()
+                except Exception as e:
+                    logger.error(f"❌ Error procesando reintentos: {str(e)}")
+                continue
+            
+            # Juntar lo que ya esté listo para aprovechar el prefetch y el pool de sesiones
+            lote = [excel_file]
+            while True:
+                try:
+                    lote.append(cola.get_nowait())
+                except queue.Empty:
+                    break
+            
+            logger.info(f"📥 {len(lote)} archivos nuevos en no_procesados")
+            try:
+                procesar_excel_files(lote)
+                logger.info("✅ Bot SAP Processor completado")
+            except Exception as e:
+                logger.error(f"❌ Error en Bot SAP Processor: {str(e)}")
+    except KeyboardInterrupt:
+        logger.info("Bot SAP Processor detenido por el usuario")
+        vigilante.detener()
+        cerrar_sap(gestor_sesion_sap.session)
 
 if __name__ == "__main__":
     # Configurar logging
@@ -193,11 +494,22 @@ if __name__ == "__main__":
     
     # Crear directorios
     ensure_directories_sap()
+    configurar_cache_datos_oc()
+    # Tiempos por etapa en Logs/tiempos_AAAAMMDD.jsonl (resumen: python tiempos.py)
+    if not registro_tiempos.habilitado:
+        registro_tiempos.configurar(Path(__file__).parent.parent / "Logs")
+    
+    # Reprocesar aunque la huella ya tenga resultado: python bot_runner.py --forzar
+    if "--forzar" in sys.argv:
+        FORZAR_REPROCESO = True
+    
+    # Modo vigilante: python bot_runner.py --vigilar
+    if "--vigilar" in sys.argv:
+        vigilar_sap_processor()
+        sys.exit(0)
+    
     job_sap_processor()
-<<<<<<< HEAD
     
-=======
->>>>>>> f6cc96365f1ca92d53bdf4ff75d818edcc3dd1b3
     # Ejecutar automáticamente cada 5 minutos
     # logger.info("Bot SAP Processor iniciado - ejecutándose automáticamente cada 5 minutos")
     # schedule_sap_processor() 
\ No newline at end of file
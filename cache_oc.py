@@ -0,0 +1,163 @@
+"""
+Cache en memoria (LRU + TTL) de los datos maestros consultados por OC.
+
+``job_sap_processor`` corre cada 5 minutos y una misma OC suele tener varias
+entregas, por lo que cadena de frío y mapeos EAN se consultan una y otra vez.
+El cache se puede persistir a disco para sobrevivir a los reinicios del
+proceso que hace BotSap.bat.
+"""
+
+import os
+import copy
+import time
+import pickle  # nosec B403 - solo se lee el archivo de cache que escribe el propio bot
+import logging
+import threading
+from functools import wraps
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CACHE_OC_MAX_ENTRADAS = int(os.getenv("CACHE_OC_MAX_ENTRADAS", "512"))
+CACHE_OC_TTL = float(os.getenv("CACHE_OC_TTL", "1800"))  # segundos
+
+
+class CacheTTL:
+    """
+    Cache acotado con expulsión LRU y vencimiento por TTL, seguro entre hilos.
+
+    Args:
+        max_entradas: Cantidad máxima de entradas; al superarla se expulsa la menos usada
+        ttl: Segundos de validez de cada entrada
+        ruta_persistencia: Archivo donde guardar/cargar el cache (None = solo memoria)
+        reloj: Función de tiempo de pared (se usa time.time para que el TTL valga entre reinicios)
+    """
+
+    def __init__(self, max_entradas=CACHE_OC_MAX_ENTRADAS, ttl=CACHE_OC_TTL, ruta_persistencia=None, reloj=time.time):
+        self.max_entradas = max(1, int(max_entradas))
+        self.ttl = ttl
+        self.ruta_persistencia = ruta_persistencia
+        self.reloj = reloj
+        self._datos = OrderedDict()  # clave -> (vence, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expiradas = 0
+        self.expulsadas = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._datos)
+
+    def obtener(self, clave):
+        """
+        Busca una clave en el cache.
+
+        Returns:
+            tuple: (encontrado, valor)
+        """
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return False, None
+            vence, valor = entrada
+            if vence <= self.reloj():
+                del self._datos[clave]
+                self.expiradas += 1
+                self.misses += 1
+                return False, None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return True, copy.deepcopy(valor)
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (self.reloj() + self.ttl, copy.deepcopy(valor))
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.expulsadas += 1
+
+    def invalidar(self, oc_numero=None):
+        """Elimina las entradas de una OC, o todo el cache si no se indica OC."""
+        with self._lock:
+            if oc_numero is None:
+                self._datos.clear()
+                return
+            for clave in [clave for clave in self._datos if clave[1] == str(oc_numero)]:
+                del self._datos[clave]
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                'entradas': len(self._datos),
+                'hits': self.hits,
+                'misses': self.misses,
+                'expiradas': self.expiradas,
+                'expulsadas': self.expulsadas,
+                'tasa_hits': self.hits / consultas if consultas else 0.0,
+            }
+
+    def persistir(self):
+        """Guarda las entradas vigentes en ``ruta_persistencia`` (escritura atómica)."""
+        if not self.ruta_persistencia:
+            return False
+        try:
+            ahora = self.reloj()
+            with self._lock:
+                vigentes = OrderedDict((k, v) for k, v in self._datos.items() if v[0] > ahora)
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta_persistencia)), exist_ok=True)
+            temporal = f"{self.ruta_persistencia}.tmp"
+            with open(temporal, "wb") as f:
+                pickle.dump(vigentes, f)
+            os.replace(temporal, self.ruta_persistencia)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo persistir el cache de OCs: {e}")
+            return False
+
+    def cargar(self):
+        """Carga las entradas vigentes desde ``ruta_persistencia`` si existe."""
+        if not self.ruta_persistencia or not os.path.exists(self.ruta_persistencia):
+            return 0
+        try:
+            with open(self.ruta_persistencia, "rb") as f:
+                guardadas = pickle.load(f)  # nosec B301 - archivo local escrito por persistir()
+            ahora = self.reloj()
+            with self._lock:
+                for clave, (vence, valor) in guardadas.items():
+                    if vence > ahora:
+                        self._datos[clave] = (vence, valor)
+                while len(self._datos) > self.max_entradas:
+                    self._datos.popitem(last=False)
+                cargadas = len(self._datos)
+            logger.info(f"📦 Cache de OCs cargado: {cargadas} entradas vigentes")
+            return cargadas
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo cargar el cache de OCs: {e}")
+            return 0
+
+
+# Cache compartido por las consultas de utils.py
+cache_datos_oc = CacheTTL()
+
+
+def cache_por_oc(funcion):
+    """
+    Decorador que cachea el resultado de una consulta cuyo primer argumento es la OC.
+
+    La clave es (nombre de la función, OC), de modo que cada consulta tiene su propia entrada.
+    """
+    @wraps(funcion)
+    def envoltura(oc_numero, *args, **kwargs):
+        clave = (funcion.__name__, str(oc_numero))
+        encontrado, valor = cache_datos_oc.obtener(clave)
+        if encontrado:
+            return valor
+        valor = funcion(oc_numero, *args, **kwargs)
+        cache_datos_oc.guardar(clave, valor)
+        return valor
+
+    return envoltura
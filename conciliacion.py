@@ -0,0 +1,171 @@
+"""
+Conciliación vectorizada de las líneas del Excel contra las cantidades pendientes del grid.
+
+``process_entrega`` recorría el plan EAN por EAN: tomaba siempre la primera
+fila del EAN, sumaba las filas de cada EAN repetido por separado y comparaba
+cantidades como texto (``normalize_sap_number``); si ninguna coincidía, usaba
+la primera fila. Cada problema se descubría de a uno (el recorrido anterior
+quedó como referencia en ``bench/bench_conciliacion.py``).
+
+``conciliar`` recibe el grid y las líneas del Excel como dos tablas y en una
+sola pasada de pandas (groupby + merge):
+
+- calcula por EAN la cantidad del Excel, la pendiente en SAP (suma de todas
+  sus filas) y la marca de sobre-entrega;
+- elige la fila de origen de cada EAN comparando números: primero una fila
+  cuya pendiente es igual al total del EAN, después una que lo cubre y si no
+  la primera;
+- asigna cada línea del Excel a su fila final del grid, contando las filas de
+  lote que se insertan debajo de los orígenes anteriores.
+
+El resultado es un plan completo (``PlanInserciones``) o la lista completa de
+conflictos: EANs que no están en el grid y EANs repetidos cuya suma supera lo
+pendiente. Los EANs de una sola línea con sobre-entrega solo se advierten,
+como hasta ahora: SAP decide con su tolerancia.
+"""
+
+import logging
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from grilla import normalizar_ean, cantidad_a_int
+from plan_entrega import preparar_lineas_entrega
+from planificador_filas import Insercion, AsignacionLinea, PlanInserciones
+
+logger = logging.getLogger(__name__)
+
+CONFLICTO_EAN_NO_ENCONTRADO = "ean_no_encontrado"
+CONFLICTO_SOBRE_ENTREGA = "sobre_entrega"
+
+Conflicto = namedtuple("Conflicto", ["tipo", "ean", "cantidad_excel", "cantidad_sap", "filas_excel"])
+# totales: DataFrame por EAN (lineas, cantidad_excel, filas_sap, cantidad_sap, sobre_entrega, fila_origen)
+# plan: PlanInserciones, o None si hay conflictos
+Conciliacion = namedtuple("Conciliacion", ["totales", "plan", "conflictos"])
+
+COLUMNAS_GRID = ["fila", "ean", "pendiente"]
+COLUMNAS_LINEAS = ["fila_excel", "ean", "cantidad", "lote", "vencimiento"]
+
+
+def tabla_grid(snapshot):
+    """Tabla (fila, ean, pendiente) del grid a partir del snapshot; pendiente NaN si no es numérica."""
+    eans = pd.Series(snapshot.columna("ZZEAN13"), dtype=object).map(normalizar_ean)
+    pendientes = pd.Series(snapshot.columna("CANT_PEND"), dtype=object).map(cantidad_a_int)
+    return pd.DataFrame({
+        "fila": np.arange(len(eans)),
+        "ean": eans.values,
+        "pendiente": pd.to_numeric(pendientes, errors="coerce").values,
+    })
+
+
+def tabla_lineas(df_excel):
+    """Tabla (fila_excel, ean, cantidad, lote, vencimiento) del Excel, en el orden del archivo."""
+    lineas = preparar_lineas_entrega(df_excel)
+    return pd.DataFrame({
+        "fila_excel": lineas.index,
+        "ean": lineas["EAN"].values,
+        "cantidad": lineas["Cant confirmada"].values,
+        "lote": lineas["Lote estuche"].values,
+        "vencimiento": lineas["Fecha Vencimiento"].values,
+    })
+
+
+def conciliar(grid, lineas):
+    """
+    Concilia las líneas del Excel con las filas del grid.
+
+    Args:
+        grid: DataFrame con COLUMNAS_GRID (una fila por fila del grid)
+        lineas: DataFrame con COLUMNAS_LINEAS (una fila por línea del Excel, en orden)
+
+    Returns:
+        Conciliacion
+    """
+    grid = grid[grid["ean"] != ""]
+    lineas = lineas[lineas["ean"] != ""].reset_index(drop=True)
+    lineas["orden"] = np.arange(len(lineas))
+
+    # Totales por EAN: Excel en el orden en que aparece cada EAN, SAP sumando todas sus filas
+    totales = lineas.groupby("ean", sort=False).agg(
+        lineas=("orden", "size"), cantidad_excel=("cantidad", "sum"), primera=("orden", "min"),
+    )
+    sap = grid.groupby("ean").agg(filas_sap=("fila", "size"), cantidad_sap=("pendiente", "sum"))
+    totales = totales.join(sap, how="left")
+    totales["filas_sap"] = totales["filas_sap"].fillna(0).astype(int)
+    totales["cantidad_sap"] = totales["cantidad_sap"].fillna(0)
+    totales["sobre_entrega"] = totales["cantidad_excel"] > totales["cantidad_sap"]
+
+    # Fila de origen: pendiente igual al total del EAN, después una que lo cubra, después la primera
+    candidatos = grid.merge(totales[["cantidad_excel"]], left_on="ean", right_index=True)
+    candidatos["prioridad"] = np.select(
+        [candidatos["pendiente"] == candidatos["cantidad_excel"], candidatos["pendiente"] >= candidatos["cantidad_excel"]],
+        [0, 1], default=2,
+    )
+    origenes = candidatos.sort_values(["prioridad", "fila"]).drop_duplicates("ean").set_index("ean")["fila"]
+    totales["fila_origen"] = origenes.reindex(totales.index)
+
+    conflictos = _conflictos(totales, lineas)
+    sueltos = totales[totales["sobre_entrega"] & (totales["lineas"] == 1) & (totales["filas_sap"] > 0)]
+    if len(sueltos):
+        logger.warning(f"⚠️ {len(sueltos)} EANs de una sola línea superan lo pendiente en SAP: {list(sueltos.index)}")
+    totales = totales.drop(columns="primera")
+    if conflictos:
+        return Conciliacion(totales, None, conflictos)
+    return Conciliacion(totales, _plan(totales, lineas), [])
+
+
+def _conflictos(totales, lineas):
+    """Conflictos en el orden del Excel: EANs sin fila en el grid y EANs repetidos con sobre-entrega."""
+    no_encontrados = totales["filas_sap"] == 0
+    sobre_entrega = ~no_encontrados & totales["sobre_entrega"] & (totales["lineas"] > 1)
+    en_conflicto = totales[no_encontrados | sobre_entrega].sort_values("primera")
+    if en_conflicto.empty:
+        return []
+    filas_excel = lineas[lineas["ean"].isin(en_conflicto.index)].groupby("ean")["fila_excel"].agg(list)
+    return [
+        Conflicto(
+            CONFLICTO_EAN_NO_ENCONTRADO if filas_sap == 0 else CONFLICTO_SOBRE_ENTREGA,
+            ean, int(cantidad_excel), int(cantidad_sap), filas_excel[ean],
+        )
+        for ean, filas_sap, cantidad_excel, cantidad_sap in zip(
+            en_conflicto.index, en_conflicto["filas_sap"], en_conflicto["cantidad_excel"], en_conflicto["cantidad_sap"]
+        )
+    ]
+
+
+def _plan(totales, lineas):
+    """Inserciones (de abajo hacia arriba) y fila final de cada línea, sin recorrer EAN por EAN."""
+    por_origen = totales.sort_values("fila_origen")
+    extras = por_origen["lineas"] - 1
+    # Cada origen baja tantas filas como lotes se insertaron debajo de los orígenes anteriores
+    fila_final = por_origen["fila_origen"].astype(int) + extras.cumsum().shift(fill_value=0)
+
+    lineas = lineas.assign(
+        fila=lineas["ean"].map(fila_final) + lineas.groupby("ean").cumcount()
+    ).sort_values("fila")
+    asignaciones = list(map(
+        AsignacionLinea,
+        lineas["fila"].astype(int).tolist(), lineas["ean"].tolist(), lineas["cantidad"].astype(int).astype(str).tolist(),
+        lineas["lote"].astype(str).tolist(), lineas["vencimiento"].tolist(), lineas["fila_excel"].tolist(),
+    ))
+    con_lotes = por_origen[extras > 0].sort_values("fila_origen", ascending=False)
+    inserciones = [
+        Insercion(int(fila_origen), int(lineas_ean - 1), ean)
+        for ean, fila_origen, lineas_ean in zip(con_lotes.index, con_lotes["fila_origen"], con_lotes["lineas"])
+    ]
+    return PlanInserciones(inserciones, asignaciones, int(extras.sum()))
+
+
+def conciliar_entrega(snapshot, df_excel):
+    """
+    Concilia el Excel leído con ``leer_entrega_excel`` contra el snapshot del grid.
+
+    Returns:
+        Conciliacion
+    """
+    conciliacion = conciliar(tabla_grid(snapshot), tabla_lineas(df_excel))
+    totales = conciliacion.totales
+    logger.info(f"🧮 Conciliación: {len(totales)} EANs, {int(totales['lineas'].sum())} líneas, "
+                f"{int((totales['lineas'] > 1).sum())} con varios lotes, {len(conciliacion.conflictos)} conflictos")
+    return conciliacion
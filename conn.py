@@ -1,11 +1,17 @@
 import os
 import time
+import logging
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
-import pandas as pd
-import win32com.client
-from win32com.client import GetObject
 from hdbcli import dbapi
-import pythoncom
+
+logger = logging.getLogger(__name__)
+
+# Configuración del pool de conexiones por ambiente
+POOL_MAX_CONEXIONES = 4
+POOL_MAX_INACTIVIDAD = 300  # segundos que una conexión puede quedar ociosa antes de cerrarla
+QUERY_SALUD_HANA = "SELECT 1 FROM DUMMY"
 
 
 def connection(ambiente):
@@ -25,4 +31,171 @@ def connection(ambiente):
     conn = dbapi.connect(address=host, port=port, user=user, password=password, sslValidateCertificate=False )
     cursor = conn.cursor()
     cursor.execute("SET SCHEMA SAPABAP1")
-    return conn
\ No newline at end of file
+    return conn
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones DB-API reutilizables y seguro entre hilos.
+
+    Args:
+        fabrica: Función sin argumentos que crea una conexión nueva
+        max_conexiones: Cantidad máxima de conexiones abiertas a la vez
+        max_inactividad: Segundos que una conexión puede quedar ociosa antes de cerrarse
+        query_salud: Consulta que se ejecuta al entregar una conexión para verificar que sigue viva
+        reloj: Función de tiempo monotónico (inyectable para pruebas)
+    """
+
+    def __init__(self, fabrica, max_conexiones=POOL_MAX_CONEXIONES, max_inactividad=POOL_MAX_INACTIVIDAD,
+                 query_salud=QUERY_SALUD_HANA, reloj=time.monotonic):
+        self.fabrica = fabrica
+        self.max_conexiones = max(1, int(max_conexiones))
+        self.max_inactividad = max_inactividad
+        self.query_salud = query_salud
+        self.reloj = reloj
+        self._ociosas = []  # [(conexion, momento_devolucion)]
+        self._en_uso = 0
+        self._condicion = threading.Condition()
+        self.estadisticas = {'creadas': 0, 'reutilizadas': 0, 'descartadas': 0, 'expiradas': 0}
+
+    @property
+    def abiertas(self):
+        with self._condicion:
+            return self._en_uso + len(self._ociosas)
+
+    def _cerrar(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug(f"Error cerrando conexión: {e}")
+
+    def _expulsar_ociosas(self):
+        """Cierra las conexiones que superaron el tiempo máximo de inactividad (con el lock tomado)."""
+        limite = self.reloj() - self.max_inactividad
+        vigentes = []
+        for conn, devuelta in self._ociosas:
+            if devuelta < limite:
+                self._cerrar(conn)
+                self.estadisticas['expiradas'] += 1
+            else:
+                vigentes.append((conn, devuelta))
+        self._ociosas = vigentes
+
+    def _esta_sana(self, conn):
+        if not self.query_salud:
+            return True
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.query_salud)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"Conexión descartada por fallar el chequeo de salud: {e}")
+            return False
+
+    def obtener(self, timeout=None):
+        """
+        Entrega una conexión sana del pool, creando una nueva si hace falta.
+
+        Args:
+            timeout: Segundos máximos a esperar si el pool está lleno (None = sin límite)
+
+        Returns:
+            Conexión DB-API
+        """
+        with self._condicion:
+            self._expulsar_ociosas()
+            while not self._ociosas and self._en_uso >= self.max_conexiones:
+                if not self._condicion.wait(timeout):
+                    raise TimeoutError(f"No hay conexiones disponibles en el pool (máximo {self.max_conexiones})")
+                self._expulsar_ociosas()
+            if self._ociosas:
+                conn, _ = self._ociosas.pop()
+                reutilizada = True
+            else:
+                conn = None
+                reutilizada = False
+            self._en_uso += 1
+
+        try:
+            # El chequeo de salud y la creación se hacen fuera del lock
+            if conn is not None and not self._esta_sana(conn):
+                self._cerrar(conn)
+                with self._condicion:
+                    self.estadisticas['descartadas'] += 1
+                conn = None
+            if conn is None:
+                conn = self.fabrica()
+                with self._condicion:
+                    self.estadisticas['creadas'] += 1
+            elif reutilizada:
+                with self._condicion:
+                    self.estadisticas['reutilizadas'] += 1
+            return conn
+        except Exception:
+            with self._condicion:
+                self._en_uso -= 1
+                self._condicion.notify()
+            raise
+
+    def devolver(self, conn, descartar=False):
+        """Devuelve una conexión al pool; si ``descartar`` es True se cierra."""
+        with self._condicion:
+            self._en_uso -= 1
+            if descartar:
+                self.estadisticas['descartadas'] += 1
+            else:
+                self._ociosas.append((conn, self.reloj()))
+            self._condicion.notify()
+        if descartar:
+            self._cerrar(conn)
+
+    @contextmanager
+    def conexion(self, timeout=None):
+        """
+        Context manager que toma una conexión y la devuelve al terminar.
+
+        Si el bloque lanza una excepción la conexión se descarta, por si quedó inutilizable.
+        """
+        conn = self.obtener(timeout)
+        try:
+            yield conn
+        except Exception:
+            self.devolver(conn, descartar=True)
+            raise
+        else:
+            self.devolver(conn)
+
+    def cerrar_todas(self):
+        """Cierra todas las conexiones ociosas del pool."""
+        with self._condicion:
+            ociosas = [conn for conn, _ in self._ociosas]
+            self._ociosas = []
+        for conn in ociosas:
+            self._cerrar(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def obtener_pool(ambiente):
+    """
+    Devuelve el pool de conexiones del ambiente (QAS/PRD), creándolo la primera vez.
+    """
+    with _pools_lock:
+        if ambiente not in _pools:
+            _pools[ambiente] = PoolConexiones(lambda: connection(ambiente))
+        return _pools[ambiente]
+
+
+def registrar_pool(ambiente, pool):
+    """Reemplaza el pool de un ambiente (p.ej. por uno sobre SQLite en pruebas)."""
+    with _pools_lock:
+        anterior = _pools.get(ambiente)
+        _pools[ambiente] = pool
+    if anterior is not None and anterior is not pool:
+        anterior.cerrar_todas()
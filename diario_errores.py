@@ -0,0 +1,443 @@
+"""
+Diario de errores: un único JSON lines, con buffer y rotación, en ``Errores/``.
+
+``registrar_error_ean_no_encontrado``, ``registrar_error_ean_repetido``,
+``mover_archivo_a_errores`` y ``crear_resumen_eans_repetidos`` abrían un .txt
+nuevo con timestamp por cada evento (uno por EAN faltante, y dos veces en los
+caminos de aborto): cientos de archivos chicos por día. Ahora los eventos de
+una entrega se juntan en un ``IntentoEntrega`` y al terminar
+``process_entrega`` se escribe un solo registro por intento de OC, con todos
+los EANs faltantes, los EANs repetidos con error, el motivo y el destino del
+Excel.
+
+Los .txt quedan como vista opcional generada desde el diario: en el momento
+con ``SAP_ERRORES_TXT=1`` (uno por intento fallido) o después con la CLI.
+
+    python diario_errores.py buscar --oc 5100063854 --fecha 2025-08-21
+    python diario_errores.py buscar --tipo ean_no_encontrado --desde 2025-08-01 --json
+    python diario_errores.py txt --oc 5100063854 --carpeta Errores/vistas
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import inspect
+import logging
+import argparse
+import threading
+import contextvars
+from functools import wraps
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_DIARIO = "diario_errores.jsonl"
+TAMANO_MAXIMO = 5 * 1024 * 1024  # bytes antes de rotar
+COPIAS_ROTADAS = 10
+TAMANO_BUFFER = 20  # registros en memoria antes de escribir
+INTERVALO_ESCRITURA = 5.0  # segundos máximos que un registro espera en el buffer
+
+RESULTADO_OK = "ok"
+RESULTADO_ERROR = "error"
+RESULTADO_INCOMPLETO = "incompleto"
+
+# Tipo de error según el comienzo del motivo (mensajes de process_entrega)
+TIPOS_POR_MOTIVO = (
+    ("Excel de entrega inválido", "excel_invalido"),
+    ("El archivo ", "excel_sin_filas"),
+    ("Error en la extracción del remito", "remito_invalido"),
+    ("EANs faltantes en SAP", "ean_no_encontrado"),
+    ("EANs no encontrados en SAP", "ean_no_encontrado"),
+    ("No se pudo procesar ninguna fila del Excel", "sin_filas_procesadas"),
+    ("OC sin posiciones pendientes en SAP", "oc_sin_posiciones"),
+    ("Cantidades del Excel exceden", "cantidad_excedida"),
+    ("SAP no reflejó", "escritura_grid"),
+    ("SAP muestra otro valor", "escritura_distinta"),
+    ("Error al cargar datos en la grilla SAP", "carga_grid"),
+    ("Error crítico en procesamiento de SAP", "sap"),
+    ("Estado incierto", "estado_incierto"),
+    ("Etiqueta pendiente", "etiqueta_pendiente"),
+)
+TIPO_DESCONOCIDO = "otro"
+
+
+def tipo_de_error(motivo):
+    """Tipo de error ('ean_no_encontrado', 'sap'...) a partir del motivo."""
+    texto = str(motivo or "")
+    for prefijo, tipo in TIPOS_POR_MOTIVO:
+        if texto.startswith(prefijo):
+            return tipo
+    return TIPO_DESCONOCIDO
+
+
+def exportar_txt_por_entorno():
+    """True si la variable de entorno SAP_ERRORES_TXT pide generar también los .txt de cada intento fallido."""
+    return os.getenv("SAP_ERRORES_TXT", "0") == "1"
+
+
+class DiarioErrores:
+    """
+    Escribe los registros como JSON lines con buffer en memoria y rotación por tamaño.
+
+    Los registros se vuelcan al juntar ``tamano_buffer``, cuando el más viejo espera más de
+    ``intervalo`` segundos, con ``vaciar()`` o al salir del proceso.
+
+    Args:
+        carpeta: Carpeta del diario; None usa ``Errores`` del directorio actual (como mover_archivo_a_errores)
+        tamano_maximo: Bytes del archivo antes de rotarlo (diario_errores.jsonl.1, .2, ...)
+        copias: Cantidad de archivos rotados que se conservan
+        tamano_buffer: Registros en memoria antes de escribir
+        intervalo: Segundos máximos que un registro queda en memoria
+        exportar_txt: Generar además un .txt por intento fallido (vista opcional)
+    """
+
+    def __init__(self, carpeta=None, tamano_maximo=TAMANO_MAXIMO, copias=COPIAS_ROTADAS,
+                 tamano_buffer=TAMANO_BUFFER, intervalo=INTERVALO_ESCRITURA, exportar_txt=False):
+        self.tamano_maximo = tamano_maximo
+        self.copias = copias
+        self.tamano_buffer = tamano_buffer
+        self.intervalo = intervalo
+        self.exportar_txt = exportar_txt
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._primero_en_buffer = None
+        self._carpeta = str(carpeta) if carpeta else None
+
+    @property
+    def carpeta(self):
+        return self._carpeta or os.path.join(os.getcwd(), "Errores")
+
+    @property
+    def ruta(self):
+        return os.path.join(self.carpeta, NOMBRE_DIARIO)
+
+    def configurar(self, carpeta):
+        """Cambia la carpeta del diario (volcando antes lo pendiente en la anterior)."""
+        self.vaciar()
+        self._carpeta = str(carpeta) if carpeta else None
+
+    def escribir(self, registro):
+        """Agrega un registro al buffer (y lo vuelca si corresponde)."""
+        with self._lock:
+            self._buffer.append(json.dumps(registro, ensure_ascii=False, default=str))
+            if self._primero_en_buffer is None:
+                self._primero_en_buffer = time.monotonic()
+            if (len(self._buffer) >= self.tamano_buffer
+                    or time.monotonic() - self._primero_en_buffer >= self.intervalo):
+                self._volcar()
+        if self.exportar_txt and registro.get("resultado") == RESULTADO_ERROR:
+            try:
+                renderizar_txt(registro, self.carpeta)
+            except OSError as e:
+                logger.warning(f"⚠️ No se pudo generar la vista .txt del error: {e}")
+
+    def vaciar(self):
+        """Escribe lo que quede en el buffer."""
+        with self._lock:
+            self._volcar()
+
+    def _volcar(self):
+        if not self._buffer:
+            return
+        lineas = "".join(linea + "\n" for linea in self._buffer)
+        try:
+            os.makedirs(self.carpeta, exist_ok=True)
+            self._rotar_si_hace_falta(len(lineas.encode("utf-8")))
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                f.write(lineas)
+        except OSError as e:
+            logger.error(f"❌ No se pudo escribir el diario de errores: {e}")
+            return
+        self._buffer = []
+        self._primero_en_buffer = None
+
+    def _rotar_si_hace_falta(self, bytes_nuevos):
+        try:
+            tamano = os.path.getsize(self.ruta)
+        except OSError:
+            return
+        if tamano == 0 or tamano + bytes_nuevos <= self.tamano_maximo:
+            return
+        for numero in range(self.copias - 1, 0, -1):
+            origen = f"{self.ruta}.{numero}"
+            if os.path.exists(origen):
+                os.replace(origen, f"{self.ruta}.{numero + 1}")
+        os.replace(self.ruta, f"{self.ruta}.1")
+
+    def archivos(self):
+        """Archivos del diario del más viejo al más nuevo (rotados primero)."""
+        rotados = [f"{self.ruta}.{numero}" for numero in range(self.copias, 0, -1)]
+        return [ruta for ruta in rotados + [self.ruta] if os.path.exists(ruta)]
+
+
+# Diario global en Errores/ del directorio actual (donde process_entrega ya deja los errores)
+diario_errores = DiarioErrores(os.getenv("DIARIO_ERRORES_DIR") or None, exportar_txt=exportar_txt_por_entorno())
+atexit.register(lambda: diario_errores.vaciar())
+
+# Intento en curso del hilo/contexto actual
+_intento_actual = contextvars.ContextVar("intento_entrega", default=None)
+
+
+class IntentoEntrega:
+    """
+    Junta los eventos de error de un intento de procesar una entrega para escribirlos en un solo registro.
+
+    Args:
+        oc: Número de orden de compra
+        archivo: Ruta del Excel de la entrega
+    """
+
+    def __init__(self, oc, archivo):
+        self.oc = str(oc) if oc is not None else None
+        self.archivo = archivo
+        self.inicio = datetime.now()
+        self._inicio_monotonico = time.perf_counter()
+        self.resultado = None
+        self.motivo = None
+        self.tipo = None
+        self.destino = None
+        self.reintento = None
+        self.eans_no_encontrados = []
+        self.eans_repetidos = []
+        self.resumen_repetidos = None
+
+    def agregar_ean_no_encontrado(self, ean):
+        if ean not in self.eans_no_encontrados:
+            self.eans_no_encontrados.append(ean)
+
+    def agregar_ean_repetido(self, ean, motivo):
+        evento = {"ean": ean, "motivo": motivo}
+        if evento not in self.eans_repetidos:
+            self.eans_repetidos.append(evento)
+
+    def marcar_error(self, motivo, tipo=None, destino=None):
+        self.resultado = RESULTADO_ERROR
+        self.motivo = motivo
+        self.tipo = tipo or tipo_de_error(motivo)
+        if destino:
+            self.destino = destino
+
+    def marcar_ok(self):
+        if self.resultado is None:
+            self.resultado = RESULTADO_OK
+
+    def registro(self, excepcion=None):
+        """Registro del intento listo para el diario."""
+        resultado = self.resultado
+        if excepcion is not None:
+            self.marcar_error(f"{type(excepcion).__name__}: {excepcion}", tipo="excepcion")
+            resultado = RESULTADO_ERROR
+        elif resultado is None:
+            resultado = RESULTADO_ERROR if self.eans_no_encontrados or self.eans_repetidos else RESULTADO_INCOMPLETO
+        archivo = os.path.basename(str(self.archivo)) if self.archivo else None
+        entrega = None
+        if archivo:
+            partes = os.path.splitext(archivo)[0].split()
+            entrega = partes[1] if len(partes) > 1 and partes[1].isdigit() else None
+        return {
+            "ts": self.inicio.isoformat(timespec="seconds"),
+            "oc": self.oc,
+            "entrega": entrega,
+            "archivo": archivo,
+            "resultado": resultado,
+            "tipo": self.tipo,
+            "motivo": self.motivo,
+            "eans_no_encontrados": self.eans_no_encontrados,
+            "eans_repetidos": self.eans_repetidos,
+            "resumen_repetidos": self.resumen_repetidos,
+            "destino": self.destino,
+            "reintento": self.reintento,
+            "duracion": round(time.perf_counter() - self._inicio_monotonico, 3),
+            "hilo": threading.current_thread().name,
+        }
+
+
+def intento_actual():
+    """Intento de entrega en curso, o None fuera de una función decorada con ``registrar_intento``."""
+    return _intento_actual.get()
+
+
+def registrar_intento(**parametros):
+    """
+    Decorador: cada llamada es un intento de entrega y al terminar escribe su registro en el diario.
+
+    Args:
+        **parametros: ``oc`` y ``archivo`` -> nombre del parámetro de la función que los trae
+    """
+    def decorador(funcion):
+        firma = inspect.signature(funcion)
+
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            argumentos = firma.bind_partial(*args, **kwargs).arguments
+            intento = IntentoEntrega(argumentos.get(parametros.get("oc")), argumentos.get(parametros.get("archivo")))
+            token = _intento_actual.set(intento)
+            excepcion = None
+            try:
+                return funcion(*args, **kwargs)
+            except Exception as e:
+                excepcion = e
+                raise
+            finally:
+                _intento_actual.reset(token)
+                diario_errores.escribir(intento.registro(excepcion))
+        return envoltura
+    return decorador
+
+
+def anotar_ok():
+    """Marca como exitoso el intento en curso."""
+    intento = intento_actual()
+    if intento is not None:
+        intento.marcar_ok()
+
+
+def anotar_error(oc, archivo, motivo=None, destino=None, ean_no_encontrado=None, ean_repetido=None, reintento=None):
+    """
+    Anota un evento de error en el intento en curso; sin intento en curso escribe un registro suelto.
+
+    Args:
+        oc: Número de orden de compra
+        archivo: Ruta del Excel
+        motivo: Motivo del error (marca el intento como fallido)
+        destino: Ruta a la que se movió el Excel
+        ean_no_encontrado: EAN del Excel que no está en la OC
+        ean_repetido: EAN repetido que no pasó la validación (con ``motivo`` como detalle)
+        reintento: {"clase", "intento", "proximo"} si el Excel quedó en la cola de reintentos
+    """
+    intento = intento_actual()
+    suelto = intento is None
+    if suelto:
+        intento = IntentoEntrega(oc, archivo)
+    if ean_no_encontrado is not None:
+        intento.agregar_ean_no_encontrado(ean_no_encontrado)
+    if ean_repetido is not None:
+        intento.agregar_ean_repetido(ean_repetido, motivo)
+    elif motivo is not None:
+        intento.marcar_error(motivo, destino=destino)
+    if reintento is not None:
+        intento.reintento = reintento
+    if suelto:
+        diario_errores.escribir(intento.registro())
+
+
+# --- Consulta y vistas --------------------------------------------------------------------
+
+def leer_diario(rutas):
+    """Lee los registros de los archivos del diario, salteando líneas corruptas."""
+    for ruta in rutas:
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    yield json.loads(linea)
+                except json.JSONDecodeError:
+                    logger.debug(f"Línea inválida en {ruta}: {linea[:80]}")
+
+
+def filtrar(registros, oc=None, desde=None, hasta=None, tipo=None, resultado=None):
+    """
+    Filtra registros del diario.
+
+    Args:
+        oc: Número de OC
+        desde, hasta: Fechas AAAA-MM-DD (inclusivas)
+        tipo: Tipo de error (ver TIPOS_POR_MOTIVO); 'ean_no_encontrado' incluye los intentos con EANs faltantes
+        resultado: 'ok', 'error' o 'incompleto'
+    """
+    for registro in registros:
+        dia = str(registro.get("ts", ""))[:10]
+        if oc and str(registro.get("oc")) != str(oc):
+            continue
+        if desde and dia < desde:
+            continue
+        if hasta and dia > hasta:
+            continue
+        if resultado and registro.get("resultado") != resultado:
+            continue
+        if tipo and registro.get("tipo") != tipo and not (
+                tipo == "ean_no_encontrado" and registro.get("eans_no_encontrados")):
+            continue
+        yield registro
+
+
+def texto_registro(registro):
+    """Vista de texto de un intento fallido (mismo contenido que los .txt por evento de antes)."""
+    lineas = [
+        "ERROR EN PROCESAMIENTO DE SAP - ENTREGA NO PROCESADA",
+        "=" * 60,
+        f"OC: {registro.get('oc')}",
+        f"Archivo Original: {registro.get('archivo')}",
+        f"Fecha Error: {registro.get('ts')}",
+        f"Tipo: {registro.get('tipo')}",
+        f"Archivo Movido a: {registro.get('destino') or '-'}",
+        f"Error: {registro.get('motivo') or '-'}",
+    ]
+    if registro.get("eans_no_encontrados"):
+        lineas.append(f"EANs no encontrados en SAP ({len(registro['eans_no_encontrados'])}):")
+        lineas.extend(f"  - {ean}" for ean in registro["eans_no_encontrados"])
+    if registro.get("eans_repetidos"):
+        lineas.append("EANs repetidos con error:")
+        lineas.extend(f"  - {evento['ean']}: {evento['motivo']}" for evento in registro["eans_repetidos"])
+    if registro.get("resumen_repetidos"):
+        lineas.append("Resumen de EANs repetidos:")
+        for ean, info in registro["resumen_repetidos"].items():
+            lineas.append(f"  - {ean}: filas {info.get('filas')}, lotes {info.get('lotes')}, total {info.get('total_cantidad')}")
+    lineas.append("=" * 60)
+    return "\n".join(lineas) + "\n"
+
+
+def renderizar_txt(registro, carpeta):
+    """Escribe la vista .txt de un registro; devuelve la ruta."""
+    os.makedirs(carpeta, exist_ok=True)
+    marca = str(registro.get("ts", "")).replace("-", "").replace(":", "").replace("T", "_")
+    ruta = os.path.join(carpeta, f"error_{registro.get('tipo') or TIPO_DESCONOCIDO}_{registro.get('oc')}_{registro.get('entrega') or ''}_{marca}.txt")
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write(texto_registro(registro))
+    return ruta
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Consulta del diario de errores de entregas")
+    parser.add_argument("--carpeta-diario", default="Errores", help="Carpeta del diario")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    for nombre, ayuda in (("buscar", "Listar intentos"), ("txt", "Generar las vistas .txt de los intentos fallidos")):
+        subcomando = subcomandos.add_parser(nombre, help=ayuda)
+        subcomando.add_argument("--oc")
+        subcomando.add_argument("--fecha", help="Un día (AAAA-MM-DD)")
+        subcomando.add_argument("--desde", help="Desde el día (AAAA-MM-DD)")
+        subcomando.add_argument("--hasta", help="Hasta el día (AAAA-MM-DD)")
+        subcomando.add_argument("--tipo", help="Tipo de error (ean_no_encontrado, excel_invalido, sap...)")
+        subcomando.add_argument("--resultado", choices=[RESULTADO_OK, RESULTADO_ERROR, RESULTADO_INCOMPLETO])
+    subcomandos.choices["buscar"].add_argument("--json", action="store_true", help="Imprimir los registros como JSON lines")
+    subcomandos.choices["txt"].add_argument("--carpeta", default=os.path.join("Errores", "vistas"),
+                                            help="Carpeta donde escribir los .txt")
+    args = parser.parse_args(argumentos)
+
+    diario = DiarioErrores(args.carpeta_diario)
+    registros = filtrar(
+        leer_diario(diario.archivos()), oc=args.oc, desde=args.fecha or args.desde, hasta=args.fecha or args.hasta,
+        tipo=args.tipo, resultado=args.resultado if args.comando == "buscar" else RESULTADO_ERROR,
+    )
+    cantidad = 0
+    for registro in registros:
+        cantidad += 1
+        if args.comando == "txt":
+            renderizar_txt(registro, args.carpeta)
+        elif args.json:
+            print(json.dumps(registro, ensure_ascii=False))
+        else:
+            faltantes = f"  faltantes={len(registro['eans_no_encontrados'])}" if registro.get("eans_no_encontrados") else ""
+            print(f"{registro.get('ts')}  {registro.get('oc')} {registro.get('entrega') or ''}  {registro.get('resultado')}"
+                  f"  {registro.get('tipo') or ''}{faltantes}  {registro.get('motivo') or ''}")
+    if args.comando == "txt":
+        print(f"{cantidad} vistas generadas en {args.carpeta}")
+    return 0 if cantidad else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Escritura en lote de celdas del grid de ZMM_RECEP_DOCU.
+
+Cada línea del Excel escribía ``CANTIDAD``, ``CHARG`` y ``VENCIMIENTO`` con
+tres ``modifyCell`` seguidos, cada uno con su propia espera. ``EscritorGrid``
+junta todas las ediciones de la pantalla, las aplica en un solo bucle sin
+esperas intermedias, espera una única vez a que SAP se asiente y verifica
+cada escritura releyendo las celdas modificadas.
+"""
+
+import logging
+from collections import OrderedDict, namedtuple
+
+from esperas import esperar_hasta, esperar_sesion_libre, valores_equivalentes
+
+logger = logging.getLogger(__name__)
+
+# Celda que no devolvió el valor escrito; ``etiqueta`` identifica a quién pertenece (p.ej. el EAN)
+EscrituraFallida = namedtuple("EscrituraFallida", ["fila", "columna", "esperado", "leido", "etiqueta"])
+ResultadoEscritura = namedtuple("ResultadoEscritura", ["escritas", "fallidas"])
+
+
+class EscritorGrid:
+    """
+    Acumula ediciones de celdas y las aplica juntas.
+
+    Args:
+        grid: Grid de SAP (o FakeGrid)
+        session: Sesión SAP para esperar que deje de estar ocupada (opcional)
+        timeout: Segundos máximos para que todas las celdas reflejen lo escrito
+            (por defecto el del paso "escritura_lote" en esperas.py)
+    """
+
+    def __init__(self, grid, session=None, timeout=None):
+        self.grid = grid
+        self.session = session
+        self.timeout = timeout
+        self._pendientes = OrderedDict()  # (fila, columna) -> (valor, etiqueta)
+
+    def __len__(self):
+        return len(self._pendientes)
+
+    def agregar(self, fila, columna, valor, etiqueta=None):
+        """Agrega una edición; si la celda ya tenía una pendiente, la reemplaza."""
+        self._pendientes.pop((fila, columna), None)
+        self._pendientes[(fila, columna)] = ("" if valor is None else str(valor), etiqueta)
+
+    def agregar_linea(self, fila, cantidad, lote, vencimiento, etiqueta=None):
+        """Agrega las tres celdas de una línea de entrega (cantidad, lote y vencimiento dd.mm.aaaa)."""
+        self.agregar(fila, "CANTIDAD", cantidad, etiqueta)
+        self.agregar(fila, "CHARG", lote, etiqueta)
+        self.agregar(fila, "VENCIMIENTO", vencimiento, etiqueta)
+
+    def registrar_insercion(self, fila):
+        """Desplaza las ediciones pendientes de filas posteriores a una fila insertada después de ``fila``."""
+        self._pendientes = OrderedDict(
+            ((f + 1 if f > fila else f, columna), dato) for (f, columna), dato in self._pendientes.items()
+        )
+
+    def descartar(self):
+        self._pendientes.clear()
+
+    def _leer(self, celdas):
+        """Relee las celdas indicadas, columna por columna; devuelve {celda: valor}."""
+        leidas = {}
+        for fila, columna in sorted(celdas, key=lambda celda: (celda[1], celda[0])):
+            try:
+                leidas[(fila, columna)] = self.grid.getCellValue(fila, columna)
+            except Exception as e:
+                logger.debug(f"No se pudo leer la celda ({fila}, {columna}): {e}")
+                leidas[(fila, columna)] = None
+        return leidas
+
+    def aplicar(self):
+        """
+        Escribe todas las ediciones pendientes y verifica el resultado.
+
+        Las celdas se escriben en un solo bucle. Después se espera a que la
+        sesión quede libre y se releen las celdas escritas; las que todavía no
+        muestran el valor se vuelven a leer con backoff hasta el timeout.
+
+        Returns:
+            ResultadoEscritura: (cantidad de celdas escritas, lista de EscrituraFallida)
+        """
+        pendientes = self._pendientes
+        self._pendientes = OrderedDict()
+        if not pendientes:
+            return ResultadoEscritura(0, [])
+
+        fallidas = []
+        escritas = {}
+        for (fila, columna), (valor, etiqueta) in pendientes.items():
+            try:
+                self.grid.modifyCell(fila, columna, valor)
+                escritas[(fila, columna)] = (valor, etiqueta)
+            except Exception as e:
+                logger.error(f"❌ Error escribiendo celda ({fila}, {columna}): {e}")
+                fallidas.append(EscrituraFallida(fila, columna, valor, None, etiqueta))
+
+        if self.session is not None:
+            esperar_sesion_libre(self.session)
+
+        sin_confirmar = dict(escritas)
+        leidas = {}
+
+        def confirmadas():
+            leidas.update(self._leer(sin_confirmar))
+            for celda in [c for c in sin_confirmar if valores_equivalentes(leidas[c], sin_confirmar[c][0], c[1])]:
+                del sin_confirmar[celda]
+            return not sin_confirmar
+
+        esperar_hasta(confirmadas, "escritura_lote", self.timeout)
+
+        for (fila, columna), (valor, etiqueta) in sin_confirmar.items():
+            logger.warning(f"⚠️ La celda ({fila}, {columna}) muestra '{leidas.get((fila, columna))}' en lugar de '{valor}'")
+            fallidas.append(EscrituraFallida(fila, columna, valor, leidas.get((fila, columna)), etiqueta))
+
+        logger.info(f"✍️ Escritura en lote: {len(escritas)} celdas, {len(fallidas)} sin confirmar")
+        return ResultadoEscritura(len(escritas), fallidas)
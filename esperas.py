@@ -0,0 +1,254 @@
+"""
+Motor de esperas adaptativas para el scripting de SAP GUI.
+
+En lugar de dormir un tiempo fijo después de cada acción (``time.sleep(0.5)``
+tras cada ``modifyCell``, 1 s y 3 s alrededor de btn[7]), se consulta la
+condición observable que indica que SAP terminó: la sesión no está ocupada,
+el grid tiene más filas o la celda devuelve el valor escrito. El sondeo usa
+backoff exponencial con un timeout por paso y registra cuánto tardó cada
+espera para poder ajustar los timeouts con datos reales.
+"""
+
+import re
+import threading
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+logger = logging.getLogger(__name__)
+
+# Timeout (segundos) por tipo de paso
+TIMEOUTS_POR_PASO = {
+    "sesion_libre": 10.0,
+    "celda_escrita": 2.0,
+    "fila_agregada": 6.0,
+    "sesion_creada": 15.0,
+    "escritura_lote": 5.0,
+}
+TIMEOUT_POR_DEFECTO = 5.0
+
+# Formatos en los que SAP GUI puede mostrar una fecha (VENCIMIENTO)
+FORMATOS_FECHA = ("%d.%m.%Y", "%d/%m/%Y", "%Y-%m-%d", "%Y%m%d", "%d.%m.%y", "%d/%m/%y")
+
+INTERVALO_INICIAL = 0.05
+INTERVALO_MAXIMO = 0.5
+FACTOR_BACKOFF = 2.0
+
+
+class RegistroEsperas:
+    """
+    Acumula la duración real de cada espera por paso.
+
+    Es seguro para usar desde varios hilos (una sesión SAP por hilo).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._muestras = defaultdict(list)
+
+    def registrar(self, paso, duracion, exito):
+        with self._lock:
+            self._muestras[paso].append((duracion, exito))
+
+    def reiniciar(self):
+        with self._lock:
+            self._muestras.clear()
+
+    def resumen(self):
+        """
+        Devuelve estadísticas por paso.
+
+        Returns:
+            dict: {paso: {'esperas', 'timeouts', 'media', 'p95', 'maximo', 'total'}}
+        """
+        with self._lock:
+            muestras = {paso: list(valores) for paso, valores in self._muestras.items()}
+
+        resumen = {}
+        for paso, valores in muestras.items():
+            duraciones = sorted(duracion for duracion, _ in valores)
+            total = sum(duraciones)
+            posicion_p95 = min(len(duraciones) - 1, int(round(0.95 * (len(duraciones) - 1))))
+            resumen[paso] = {
+                'esperas': len(duraciones),
+                'timeouts': sum(1 for _, exito in valores if not exito),
+                'media': total / len(duraciones),
+                'p95': duraciones[posicion_p95],
+                'maximo': duraciones[-1],
+                'total': total,
+            }
+        return resumen
+
+    def log_resumen(self):
+        for paso, datos in sorted(self.resumen().items()):
+            logger.info(
+                f"⏱️ Espera '{paso}': {datos['esperas']} esperas, media {datos['media']:.3f}s, "
+                f"p95 {datos['p95']:.3f}s, máx {datos['maximo']:.3f}s, timeouts {datos['timeouts']}"
+            )
+
+
+# Registro global usado por sap.py
+registro_esperas = RegistroEsperas()
+
+
+def esperar_hasta(condicion, paso, timeout=None, intervalo_inicial=INTERVALO_INICIAL,
+                  intervalo_maximo=INTERVALO_MAXIMO, factor=FACTOR_BACKOFF,
+                  registro=None, reloj=time.monotonic, dormir=time.sleep):
+    """
+    Sondea ``condicion()`` con backoff exponencial hasta que sea verdadera o se agote el timeout.
+
+    Args:
+        condicion: Función sin argumentos que devuelve True cuando SAP terminó
+        paso: Nombre del paso (para el timeout por defecto y las estadísticas)
+        timeout: Segundos máximos de espera (por defecto según TIMEOUTS_POR_PASO)
+        intervalo_inicial: Primer intervalo entre sondeos
+        intervalo_maximo: Tope del intervalo entre sondeos
+        factor: Multiplicador del intervalo tras cada sondeo fallido
+        registro: RegistroEsperas donde anotar la duración (por defecto el global)
+        reloj: Función de tiempo monotónico (inyectable para pruebas)
+        dormir: Función de espera (inyectable para pruebas)
+
+    Returns:
+        bool: True si la condición se cumplió, False si se agotó el timeout
+    """
+    if timeout is None:
+        timeout = TIMEOUTS_POR_PASO.get(paso, TIMEOUT_POR_DEFECTO)
+    if registro is None:
+        registro = registro_esperas
+
+    inicio = reloj()
+    intervalo = intervalo_inicial
+    while True:
+        try:
+            cumplida = bool(condicion())
+        except Exception as e:
+            logger.debug(f"Condición de espera '{paso}' falló: {e}")
+            cumplida = False
+
+        transcurrido = reloj() - inicio
+        if cumplida:
+            registro.registrar(paso, transcurrido, True)
+            return True
+        if transcurrido >= timeout:
+            registro.registrar(paso, transcurrido, False)
+            logger.warning(f"⏳ Timeout esperando '{paso}' tras {transcurrido:.2f}s")
+            return False
+
+        dormir(min(intervalo, timeout - transcurrido))
+        intervalo = min(intervalo * factor, intervalo_maximo)
+
+
+def sesion_libre(session):
+    """True si la sesión SAP no está procesando una acción (GuiSession.Busy)."""
+    return not getattr(session, "Busy", False)
+
+
+def _lecturas_numericas(texto):
+    """
+    Devuelve los valores posibles (Decimal) de una cantidad tal como la muestra SAP.
+
+    Según el formato del usuario SAP separa los miles con punto y los decimales
+    con coma o al revés, así que "10,000" puede ser 10 (coma decimal) o 10000
+    (coma de miles). Se toma siempre el último separador como decimal y, si todos
+    los separadores son iguales y van seguidos de tres dígitos, también la lectura
+    como separadores de miles.
+
+    Returns:
+        set: Valores posibles; vacío si el texto no es numérico
+    """
+    texto = texto.replace(' ', '')
+    separadores = set(re.findall(r'[.,]', texto))
+    candidatos = [texto]
+    if separadores:
+        posicion = max(texto.rfind('.'), texto.rfind(','))
+        entero = re.sub(r'[.,]', '', texto[:posicion])
+        candidatos = [f"{entero}.{texto[posicion + 1:]}"]
+        grupos = re.split(r'[.,]', texto)
+        if len(separadores) == 1 and all(len(grupo) == 3 and grupo.isdigit() for grupo in grupos[1:]):
+            candidatos.append(''.join(grupos))
+    lecturas = set()
+    for candidato in candidatos:
+        try:
+            valor = Decimal(candidato)
+        except InvalidOperation:
+            continue
+        if valor.is_finite():
+            lecturas.add(valor)
+    return lecturas
+
+
+def _leer_fecha(texto):
+    """Interpreta una fecha en los formatos que usa SAP GUI; None si no es una fecha."""
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def valores_equivalentes(leido, esperado, columna=None):
+    """
+    Compara el valor leído de una celda con el escrito.
+
+    SAP devuelve los valores con el formato del usuario: las cantidades con
+    separadores y decimales ("10" -> "10,000" o "10.000"), el lote en mayúsculas
+    y la fecha en su propio formato. Si el texto no coincide se compara según la
+    columna: VENCIMIENTO como fecha, CHARG sin distinguir mayúsculas y el resto
+    (CANTIDAD) como número.
+
+    Args:
+        leido: Valor devuelto por getCellValue
+        esperado: Valor escrito con modifyCell
+        columna: Columna del grid; None compara solo como número
+
+    Returns:
+        bool: True si ambos valores representan lo mismo
+    """
+    leido = "" if leido is None else str(leido).strip()
+    esperado = "" if esperado is None else str(esperado).strip()
+    if leido == esperado:
+        return True
+    if not leido or not esperado:
+        return False
+    if columna == "CHARG":
+        return leido.casefold() == esperado.casefold()
+    if columna == "VENCIMIENTO":
+        fecha = _leer_fecha(leido)
+        return fecha is not None and fecha == _leer_fecha(esperado)
+    return bool(_lecturas_numericas(leido) & _lecturas_numericas(esperado))
+
+
+def esperar_sesion_libre(session, timeout=None):
+    """Espera a que la sesión SAP deje de estar ocupada."""
+    return esperar_hasta(lambda: sesion_libre(session), "sesion_libre", timeout)
+
+
+def esperar_filas(grid, filas_antes, timeout=None):
+    """Espera a que el grid tenga más filas que ``filas_antes`` (p.ej. tras btn[7])."""
+    return esperar_hasta(lambda: grid.RowCount > filas_antes, "fila_agregada", timeout)
+
+
+def esperar_valor_celda(grid, fila, columna, valor, timeout=None):
+    """Espera a que la celda devuelva el valor escrito con ``modifyCell``."""
+    return esperar_hasta(
+        lambda: valores_equivalentes(grid.getCellValue(fila, columna), valor, columna),
+        "celda_escrita",
+        timeout,
+    )
+
+
+def modificar_celda(grid, fila, columna, valor, timeout=None):
+    """
+    Escribe una celda del grid y espera a que SAP la refleje.
+
+    Returns:
+        bool: True si la celda devuelve el valor escrito dentro del timeout
+    """
+    grid.modifyCell(fila, columna, valor)
+    confirmada = esperar_valor_celda(grid, fila, columna, valor, timeout)
+    if not confirmada:
+        logger.warning(f"⚠️ La celda ({fila}, {columna}) no reflejó el valor '{valor}' a tiempo")
+    return confirmada
@@ -0,0 +1,267 @@
+"""
+Puntos de control por archivo de entrega, para reanudar después de una caída.
+
+Si ``process_entrega`` se caía a mitad de camino (después de escribir celdas o
+justo antes de btn[21]) el Excel terminaba en ``Errores/No_Procesados`` y había
+que rehacerlo a mano, o se corría de nuevo todo el flujo de SAP, y si la caída
+era después de generar el remito eso duplicaba la entrega.
+
+Cada archivo avanza por una máquina de estados que se guarda en una base
+SQLite chica (``Temp/estado_entregas.sqlite3``) antes y después de cada paso:
+
+    parseado -> navegado -> grid_cargado -> confirmado -> popup_remito -> etiqueta
+
+Los pasos anteriores a generar el remito solo existen en la pantalla de SAP,
+que se pierde al reiniciar; el punto de control seguro es entonces el propio
+Excel y se rehace la carga. Una vez generado el remito la entrega ya existe
+en SAP y nunca se vuelve a cargar: al reanudar solo queda la etiqueta. Si la
+caída fue *durante* la generación del remito no se sabe si SAP la creó, y el
+archivo va a errores para verificarlo a mano en lugar de arriesgar un
+duplicado. Cuando la entrega termina (bien o en errores) su estado se borra.
+
+    python estado_entrega.py          # entregas a medio procesar
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_BASE_DATOS = "estado_entregas.sqlite3"
+
+PARSEADO = "parseado"
+NAVEGADO = "navegado"
+GRID_CARGADO = "grid_cargado"
+CONFIRMADO = "confirmado"
+POPUP_REMITO = "popup_remito"
+ETIQUETA = "etiqueta"
+ESTADOS = (PARSEADO, NAVEGADO, GRID_CARGADO, CONFIRMADO, POPUP_REMITO, ETIQUETA)
+
+# Desde este estado la entrega ya existe en SAP
+ESTADO_GENERADA = POPUP_REMITO
+
+# Qué hacer al encontrar un archivo con estado guardado
+REANUDAR_DESDE_EXCEL = "desde_excel"  # nada quedó en SAP: se rehace la carga
+REANUDAR_ETIQUETA = "etiqueta"  # entrega generada: solo falta la etiqueta
+REANUDAR_INCIERTO = "incierto"  # cayó generando el remito: verificar a mano
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS estados (
+        huella TEXT PRIMARY KEY,
+        archivo TEXT NOT NULL,
+        oc TEXT,
+        estado TEXT,
+        en_curso TEXT,
+        remito TEXT,
+        intentos INTEGER NOT NULL DEFAULT 1,
+        inicio TEXT NOT NULL,
+        actualizado TEXT NOT NULL
+    );
+"""
+
+
+def posicion(estado):
+    """Orden del estado en ESTADOS (-1 si es None)."""
+    return ESTADOS.index(estado) if estado in ESTADOS else -1
+
+
+class RegistroEstados:
+    """
+    Base SQLite con el estado de las entregas en curso, una fila por huella de contenido.
+
+    Es segura entre hilos (una conexión compartida protegida con un lock).
+
+    Args:
+        ruta: Archivo de la base (":memory:" para pruebas)
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        if ruta != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(ESQUEMA)
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
+
+    def consultar(self, huella):
+        with self._lock:
+            fila = self._conn.execute("SELECT * FROM estados WHERE huella = ?", (huella,)).fetchone()
+        return dict(fila) if fila else None
+
+    def guardar(self, huella, archivo, oc, estado, en_curso=None, remito=None):
+        """Guarda el último estado completo y el paso en curso de una entrega."""
+        momento = datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO estados (huella, archivo, oc, estado, en_curso, remito, inicio, actualizado)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (huella) DO UPDATE SET
+                    archivo = excluded.archivo,
+                    estado = excluded.estado,
+                    en_curso = excluded.en_curso,
+                    remito = COALESCE(excluded.remito, remito),
+                    actualizado = excluded.actualizado
+                """,
+                (huella, archivo, oc, estado, en_curso, remito, momento, momento),
+            )
+
+    def sumar_intento(self, huella):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE estados SET intentos = intentos + 1 WHERE huella = ?", (huella,))
+
+    def borrar(self, huella):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM estados WHERE huella = ?", (huella,))
+
+    def en_curso(self):
+        """Entregas con estado guardado (a medio procesar), de la más vieja a la más nueva."""
+        with self._lock:
+            filas = self._conn.execute("SELECT * FROM estados ORDER BY actualizado").fetchall()
+        return [dict(fila) for fila in filas]
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+
+def obtener_registro_estados():
+    """Devuelve el registro global (Temp/estado_entregas.sqlite3, relativo al directorio actual)."""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroEstados(os.path.join(os.getcwd(), "Temp", NOMBRE_BASE_DATOS))
+        return _registro
+
+
+def registrar_registro_estados(registro):
+    """Reemplaza el registro global (p.ej. por uno en memoria o en otra carpeta)."""
+    global _registro
+    with _registro_lock:
+        _registro = registro
+
+
+class AvanceEntrega:
+    """
+    Máquina de estados de un archivo de entrega, persistida en cada transición.
+
+    Los errores al guardar se loguean y no interrumpen el procesamiento.
+
+    Args:
+        huella: Huella de contenido del Excel (ver huellas.py)
+        path_excel: Ruta del Excel
+        oc: Número de orden de compra
+        registro: RegistroEstados (por defecto el global)
+    """
+
+    def __init__(self, huella, path_excel, oc, registro=None):
+        self.huella = huella
+        self.archivo = os.path.basename(str(path_excel))
+        self.oc = str(oc)
+        self.registro = registro if registro is not None else obtener_registro_estados()
+        self.anterior = self._leer()
+        self.estado = None
+        self.en_curso = None
+        self.remito = self.anterior["remito"] if self.anterior else None
+
+    def _leer(self):
+        try:
+            return self.registro.consultar(self.huella)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo leer el estado guardado de {self.archivo}: {e}")
+            return None
+
+    def _guardar(self):
+        try:
+            self.registro.guardar(self.huella, self.archivo, self.oc, self.estado, self.en_curso, self.remito)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar el estado '{self.estado}' de {self.archivo}: {e}")
+
+    def reanudacion(self):
+        """
+        Cómo seguir con un archivo que ya tenía estado guardado.
+
+        Returns:
+            str: REANUDAR_DESDE_EXCEL, REANUDAR_ETIQUETA, REANUDAR_INCIERTO, o None si es la primera vez
+        """
+        if self.anterior is None:
+            return None
+        try:
+            self.registro.sumar_intento(self.huella)
+        except Exception as e:
+            logger.debug(f"No se pudo sumar el intento de {self.archivo}: {e}")
+        estado, en_curso = self.anterior["estado"], self.anterior["en_curso"]
+        if posicion(estado) >= posicion(ESTADO_GENERADA):
+            return REANUDAR_ETIQUETA
+        if en_curso == ESTADO_GENERADA:
+            return REANUDAR_INCIERTO
+        return REANUDAR_DESDE_EXCEL
+
+    def iniciar(self, paso, remito=None):
+        """Marca que empieza un paso (se guarda antes de tocar SAP)."""
+        self.en_curso = paso
+        if remito:
+            self.remito = remito
+        self._guardar()
+
+    def completar(self, estado, remito=None):
+        """Marca un estado como alcanzado."""
+        self.estado = estado
+        self.en_curso = None
+        if remito:
+            self.remito = remito
+        self._guardar()
+
+    @property
+    def generada(self):
+        """True si la entrega ya existe en SAP (no se debe volver a cargar)."""
+        return posicion(self.estado) >= posicion(ESTADO_GENERADA)
+
+    def terminar(self):
+        """La entrega terminó (bien o en errores): se borra su estado."""
+        try:
+            self.registro.borrar(self.huella)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo borrar el estado de {self.archivo}: {e}")
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Entregas a medio procesar (puntos de control)")
+    parser.add_argument("--base", default=os.path.join("Temp", NOMBRE_BASE_DATOS))
+    parser.add_argument("--borrar", metavar="ARCHIVO", help="Olvidar el estado guardado de un archivo (por nombre)")
+    args = parser.parse_args(argumentos)
+
+    registro = RegistroEstados(args.base)
+    try:
+        filas = registro.en_curso()
+        if args.borrar:
+            nombre = os.path.basename(args.borrar)
+            borradas = [fila for fila in filas if fila["archivo"] == nombre]
+            for fila in borradas:
+                registro.borrar(fila["huella"])
+            print(f"{len(borradas)} estados borrados para {nombre}")
+            return 0 if borradas else 1
+        for fila in filas:
+            en_curso = f" (en curso: {fila['en_curso']})" if fila["en_curso"] else ""
+            print(f"{fila['actualizado']}  {fila['archivo']}  OC {fila['oc']}  {fila['estado'] or '-'}{en_curso}"
+                  f"  remito={fila['remito'] or '-'}  intentos={fila['intentos']}")
+        return 0
+    finally:
+        registro.cerrar()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+Recolección en segundo plano de los PDF de etiqueta que imprime SAP (btn[86]).
+
+Después de imprimir, ``process_entrega`` dormía 3 s fijos y
+``renombrar_pdf_etiqueta`` hacía ``glob('*.pdf')`` de toda la carpeta de
+etiquetas buscando el remito en cada nombre: la carpeta crece sin límite, el
+glob es cada día más lento y si el spool tardaba más de 3 s la etiqueta
+quedaba sin renombrar.
+
+``RecolectorEtiquetas`` corre en un hilo propio: ``process_entrega`` solo
+encarga el remito y sigue con la próxima OC. Los PDF nuevos llegan por
+eventos de watchdog (si está instalado) o, sin él, relistando la carpeta solo
+cuando cambia su fecha de modificación. La carpeta se lista completa una sola
+vez al arrancar; después los nombres ya vistos o renombrados quedan en un
+índice en memoria y no se vuelven a revisar. Los PDF viejos que ya estaban en
+la carpeta se buscan en ese índice al encargar un remito (p.ej. al retomar una
+entrega tras un reinicio, con la etiqueta ya impresa), y si ya existe
+``<remito>.pdf`` la etiqueta se da por recolectada. Cada etiqueta encargada tiene un
+tiempo máximo de espera; el resultado queda en el log de tiempos (etapa
+``etiqueta_pdf_recolectada``).
+"""
+
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+
+from vigilante_carpeta import Observer, FileSystemEventHandler, firma_archivo
+from tiempos import Tramo
+
+logger = logging.getLogger(__name__)
+
+# Carpeta donde SAP deja los PDF de etiqueta (variable de entorno SAP_CARPETA_ETIQUETAS)
+CARPETA_ETIQUETAS = os.getenv(
+    "SAP_CARPETA_ETIQUETAS", r"C:\Users\recepcion1\Documents\Etiquetas Entregas Entrantes Farmanet"
+)
+ESPERA_MAXIMA = 60.0  # segundos que se espera el PDF de cada remito
+ESPERA_ESTABLE = 0.5  # segundos con tamaño y mtime sin cambios antes de renombrar
+INTERVALO_REVISION = 0.2  # cada cuánto se revisan los pendientes
+
+
+def es_pdf(ruta):
+    return str(ruta).lower().endswith(".pdf")
+
+
+class _ManejadorEventos(FileSystemEventHandler):
+    """Traduce los eventos de watchdog en PDF nuevos."""
+
+    def __init__(self, recolector):
+        super().__init__()
+        self.recolector = recolector
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.recolector.notificar(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.recolector.notificar(event.dest_path)
+
+
+class RecolectorEtiquetas:
+    """
+    Espera en segundo plano el PDF de cada remito encargado y lo renombra a ``<remito>.pdf``.
+
+    Args:
+        carpeta: Carpeta donde SAP deja los PDF
+        espera_maxima: Segundos que se espera cada PDF antes de darlo por perdido
+        espera_estable: Segundos que el PDF debe mantenerse igual antes de renombrarlo (spool a medio escribir)
+        usar_watchdog: False para forzar el modo sondeo
+        reloj: Función de tiempo monotónico (inyectable para pruebas)
+    """
+
+    def __init__(self, carpeta=CARPETA_ETIQUETAS, espera_maxima=ESPERA_MAXIMA, espera_estable=ESPERA_ESTABLE,
+                 usar_watchdog=True, reloj=time.monotonic):
+        self.carpeta = Path(carpeta)
+        self.espera_maxima = espera_maxima
+        self.espera_estable = espera_estable
+        self.usar_watchdog = usar_watchdog and Observer is not None
+        self.reloj = reloj
+        self._condicion = threading.Condition()
+        self._pendientes = {}  # remito -> (oc, vencimiento, Tramo)
+        self._resultados = {}  # remito -> True/False cuando termina
+        self._conocidos = set()  # nombres ya vistos (renombrados o sin remito encargado)
+        self._antiguos = set()  # nombres indexados al arrancar que todavía no se asignaron a un remito
+        self._nuevos = {}  # nombre -> [ruta, firma, desde] de PDF que todavía no se asignaron
+        self._mtime_carpeta = None
+        self._detener = threading.Event()
+        self._despertar = threading.Event()
+        self._hilo = None
+        self._observer = None
+
+    @property
+    def modo(self):
+        return "eventos" if self.usar_watchdog else "sondeo"
+
+    @property
+    def iniciado(self):
+        return self._hilo is not None
+
+    def iniciar(self):
+        """Indexa la carpeta una vez y arranca el hilo recolector (y watchdog si hay)."""
+        self.carpeta.mkdir(parents=True, exist_ok=True)
+        # Los PDF recientes pueden ser de una etiqueta recién impresa: quedan como candidatos
+        recientes = []
+        desde = time.time() - self.espera_maxima
+        with self._condicion:
+            self._conocidos = set()
+            self._antiguos = set()
+            for nombre in self._listar():
+                try:
+                    reciente = os.stat(self.carpeta / nombre).st_mtime >= desde
+                except OSError:
+                    continue
+                if reciente:
+                    recientes.append(nombre)
+                else:
+                    self._conocidos.add(nombre)
+                    self._antiguos.add(nombre)
+            self._mtime_carpeta = self._mtime()
+        for nombre in recientes:
+            self.notificar(self.carpeta / nombre)
+        if self.usar_watchdog:
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_ManejadorEventos(self), str(self.carpeta), recursive=False)
+                self._observer.start()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo iniciar watchdog para las etiquetas, se usa sondeo: {e}")
+                self._observer = None
+                self.usar_watchdog = False
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="recolector-etiquetas", daemon=True)
+        self._hilo.start()
+        logger.info(f"🏷️ Recolector de etiquetas en {self.carpeta} (modo {self.modo}, {len(self._conocidos)} PDF indexados, "
+                    f"{len(recientes)} recientes)")
+        return self
+
+    def detener(self):
+        self._detener.set()
+        self._despertar.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
+
+    def encargar(self, remito, oc=None):
+        """
+        Pide renombrar el PDF del remito cuando aparezca; vuelve enseguida.
+
+        Si el PDF ya estaba en la carpeta antes de arrancar (o ya se llama
+        ``<remito>.pdf``) se toma del índice, sin esperar un evento nuevo.
+        """
+        if not self.iniciado:
+            self.iniciar()
+        tramo = Tramo("etiqueta_pdf_recolectada", oc=oc, remito=remito).iniciar()
+        with self._condicion:
+            self._resultados.pop(remito, None)
+            for nombre in [nombre for nombre in self._antiguos if remito in nombre]:
+                self._antiguos.discard(nombre)
+                self._nuevos[nombre] = [self.carpeta / nombre, None, None]
+            self._pendientes[remito] = (oc, self.reloj() + self.espera_maxima, tramo)
+        self._despertar.set()
+
+    def esperar(self, remito=None, timeout=None):
+        """
+        Espera a que termine un remito encargado (o todos los pendientes si ``remito`` es None).
+
+        Returns:
+            bool: Con remito, True si se renombró; sin remito, True si no quedaron pendientes
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._condicion:
+            while (remito in self._pendientes) if remito is not None else self._pendientes:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    break
+                self._condicion.wait(restante)
+            if remito is not None:
+                return self._resultados.get(remito, False)
+            return not self._pendientes
+
+    def pendientes(self):
+        with self._condicion:
+            return list(self._pendientes)
+
+    def notificar(self, ruta):
+        """Registra un PDF nuevo (llamado por watchdog o por el relistado)."""
+        nombre = os.path.basename(str(ruta))
+        if not es_pdf(nombre):
+            return
+        with self._condicion:
+            if nombre in self._conocidos or nombre in self._nuevos:
+                return
+            self._nuevos[nombre] = [Path(ruta), None, None]
+        self._despertar.set()
+
+    def _listar(self):
+        try:
+            with os.scandir(self.carpeta) as entradas:
+                return [e.name for e in entradas if e.is_file() and es_pdf(e.name)]
+        except FileNotFoundError:
+            return []
+
+    def _mtime(self):
+        try:
+            return os.stat(self.carpeta).st_mtime_ns
+        except OSError:
+            return None
+
+    def _relistar_si_cambio(self):
+        """Sin watchdog: relista la carpeta solo si cambió su fecha de modificación (hubo altas o renombres)."""
+        mtime = self._mtime()
+        if mtime == self._mtime_carpeta:
+            return
+        self._mtime_carpeta = mtime
+        for nombre in self._listar():
+            self.notificar(self.carpeta / nombre)
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            self._despertar.wait(INTERVALO_REVISION)
+            self._despertar.clear()
+            if not self._pendientes:
+                continue
+            try:
+                if not self.usar_watchdog:
+                    self._relistar_si_cambio()
+                self._revisar()
+            except Exception as e:
+                logger.error(f"❌ Error recolectando etiquetas en {self.carpeta}: {e}")
+
+    def _revisar(self):
+        """Asigna los PDF nuevos a los remitos pendientes, renombra los estables y vence los demorados."""
+        ahora = self.reloj()
+        terminados = []
+        with self._condicion:
+            pendientes = dict(self._pendientes)
+            nuevos = list(self._nuevos.items())
+        for remito, (oc, vencimiento, tramo) in pendientes.items():
+            candidatos = [(nombre, datos) for nombre, datos in nuevos if remito in nombre]
+            renombrada = next((nombre for nombre, _ in candidatos if os.path.splitext(nombre)[0] == remito), None)
+            if renombrada is not None:
+                logger.info(f"🏷️ La etiqueta {remito} ya estaba renombrada: {renombrada}")
+                terminados.append((remito, renombrada, True))
+                continue
+            if candidatos:
+                nombre, datos = candidatos[0]
+                if self._estable(datos, ahora):
+                    terminados.append((remito, nombre, self._renombrar(remito, datos[0])))
+                    continue
+            if ahora >= vencimiento:
+                logger.warning(f"⚠️ No apareció el PDF de la etiqueta {remito} (OC {oc}) en {self.espera_maxima:.0f} s")
+                terminados.append((remito, None, False))
+
+        if not terminados:
+            return
+        with self._condicion:
+            for remito, nombre, exito in terminados:
+                oc, _, tramo = self._pendientes.pop(remito)
+                self._resultados[remito] = exito
+                if nombre is not None:
+                    self._nuevos.pop(nombre, None)
+                    self._conocidos.add(nombre)
+                tramo.terminar(ok=exito)
+            self._condicion.notify_all()
+
+    def _estable(self, datos, ahora):
+        ruta, firma_anterior, desde = datos
+        firma = firma_archivo(ruta)
+        if firma is None:
+            return False
+        if firma != firma_anterior:
+            datos[1], datos[2] = firma, ahora
+            return False
+        return firma[0] > 0 and ahora - desde >= self.espera_estable
+
+    def _renombrar(self, remito, ruta):
+        destino = self.carpeta / f"{remito}{os.path.splitext(str(ruta))[1]}"
+        if destino.exists():
+            logger.warning(f"⚠️ El archivo de destino ya existe: {destino.name}")
+            return False
+        # El renombre genera su propio evento: el nombre nuevo no es una etiqueta a asignar
+        with self._condicion:
+            self._conocidos.add(destino.name)
+        try:
+            os.rename(ruta, destino)
+        except OSError as e:
+            logger.error(f"❌ Error renombrando {ruta.name} a {destino.name}: {e}")
+            with self._condicion:
+                self._conocidos.discard(destino.name)
+            return False
+        logger.info(f"🏷️ Etiqueta renombrada: {ruta.name} -> {destino.name}")
+        return True
+
+
+_recolector = None
+_recolector_lock = threading.Lock()
+
+
+def obtener_recolector():
+    """Devuelve el recolector global (CARPETA_ETIQUETAS), arrancándolo la primera vez."""
+    global _recolector
+    with _recolector_lock:
+        if _recolector is None:
+            _recolector = RecolectorEtiquetas(CARPETA_ETIQUETAS)
+        if not _recolector.iniciado:
+            _recolector.iniciar()
+        return _recolector
+
+
+def registrar_recolector(recolector):
+    """Reemplaza el recolector global (p.ej. por uno sobre otra carpeta); detiene el anterior."""
+    global _recolector
+    with _recolector_lock:
+        if _recolector is not None and _recolector is not recolector:
+            _recolector.detener()
+        _recolector = recolector
@@ -0,0 +1,353 @@
+"""
+Utilidades para trabajar con el grid (GuiGridView) de ZMM_RECEP_DOCU.
+
+Cada llamada a ``grid.getCellValue`` es una llamada COM entre procesos, por lo
+que recorrer el grid fila por fila para cada línea del Excel resulta muy caro.
+``GridSnapshot`` lee una sola vez las columnas relevantes de la pantalla y
+responde todas las búsquedas desde memoria hasta que el grid cambia.
+"""
+
+import bisect
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Columnas del grid que usan las búsquedas y validaciones de sap.py
+COLUMNAS_SNAPSHOT = ("ZZEAN13", "CANT_PEND", "CANTIDAD", "CHARG", "VENCIMIENTO")
+
+# Entrada del índice: fila del grid y cantidad pendiente (int, o None si no se conoce)
+EntradaIndice = namedtuple("EntradaIndice", ["fila", "cantidad_pendiente"])
+
+
+def normalize_sap_number(value):
+    """
+    Normaliza valores numéricos devueltos por SAP que pueden venir en formato científico o decimal.
+    Maneja números con formato europeo (punto como separador de miles).
+    
+    Args:
+        value: Valor devuelto por SAP (puede ser string, float, int, etc.)
+        
+    Returns:
+        str: Valor normalizado como string entero
+    """
+    try:
+        # Convertir a string primero
+        str_value = str(value).strip()
+        
+        # Si está vacío, retornar "0"
+        if not str_value:
+            return "0"
+
+        # Si es un número en formato científico (ej: "1.0E+3")
+        if 'E' in str_value.upper() or 'e' in str_value:
+            try:
+                float_val = float(str_value)
+                return str(int(float_val))
+            except:
+                return str_value
+        
+        # Manejar formato europeo (punto como separador de miles)
+        # Ejemplo: "1.000" -> 1000, "1.500" -> 1500
+        if '.' in str_value and ',' not in str_value:
+            # Verificar si es formato europeo (punto como separador de miles)
+            # Si tiene más de 3 dígitos después del punto, es formato europeo
+            parts = str_value.split('.')
+            if len(parts) == 2 and len(parts[1]) == 3:
+                # Es formato europeo: "1.000" -> 1000
+                try:
+                    # Remover el punto y convertir a entero
+                    clean_value = str_value.replace('.', '')
+                    int_val = int(clean_value)
+                    return str(int_val)
+                except:
+                    pass
+        
+        # Si es un float con decimales (ej: "1000.0")
+        if '.' in str_value:
+            try:
+                float_val = float(str_value)
+                return str(int(float_val))
+            except:
+                return str_value
+        
+        # Si es un entero normal
+        try:
+            int_val = int(float(str_value))
+            return str(int_val)
+        except:
+            return str_value
+            
+    except Exception as e:
+        logger.warning(f"Error normalizando valor SAP '{value}': {e}")
+        return str(value)
+
+
+def normalizar_ean(valor):
+    """
+    Normaliza un EAN leído del Excel o de SAP para poder compararlo.
+
+    Quita espacios y el sufijo ".0" que agrega pandas cuando la columna se lee
+    como número (ej: 7791234567890.0 -> "7791234567890").
+    """
+    if valor is None:
+        return ""
+    ean = str(valor).strip()
+    if ean.endswith(".0") and ean[:-2].isdigit():
+        ean = ean[:-2]
+    return ean
+
+
+def cantidad_a_int(valor):
+    """Convierte una cantidad de SAP a int usando normalize_sap_number; None si no es numérica."""
+    if valor is None or not str(valor).strip():
+        return None
+    try:
+        return int(normalize_sap_number(valor))
+    except (TypeError, ValueError):
+        return None
+
+
+class IndiceEAN:
+    """
+    Índice EAN -> filas del grid, con soporte para EANs en varias filas.
+
+    Cada EAN normalizado apunta a una lista ordenada de ``EntradaIndice``
+    (fila, cantidad pendiente), y cada fila a su EAN. Al insertar una fila de
+    lote después de la fila k, ``insertar_despues`` desplaza los índices de las
+    filas siguientes sin volver a leer el grid.
+    """
+
+    def __init__(self):
+        self._entradas = {}
+        self._ean_por_fila = {}
+
+    @classmethod
+    def desde_columnas(cls, eans, cantidades):
+        """Construye el índice a partir de las columnas ZZEAN13 y CANT_PEND."""
+        indice = cls()
+        for fila, (ean, cantidad) in enumerate(zip(eans, cantidades)):
+            clave = normalizar_ean(ean)
+            if clave:
+                indice._entradas.setdefault(clave, []).append(EntradaIndice(fila, cantidad_a_int(cantidad)))
+                indice._ean_por_fila[fila] = clave
+        return indice
+
+    def __contains__(self, ean):
+        return normalizar_ean(ean) in self._entradas
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def eans(self):
+        """Devuelve el conjunto de EANs indexados."""
+        return set(self._entradas)
+
+    def entradas(self, ean):
+        """Devuelve las entradas (fila, cantidad pendiente) de un EAN, ordenadas por fila."""
+        return list(self._entradas.get(normalizar_ean(ean), []))
+
+    def filas(self, ean):
+        return [entrada.fila for entrada in self._entradas.get(normalizar_ean(ean), [])]
+
+    def primera_fila(self, ean, desde=0):
+        """Devuelve la primera fila >= desde que contiene el EAN, o None."""
+        filas = self.filas(ean)
+        posicion = bisect.bisect_left(filas, desde)
+        return filas[posicion] if posicion < len(filas) else None
+
+    def ean_de_fila(self, fila):
+        """Devuelve el EAN indexado en una fila, o None si la fila no tiene EAN."""
+        return self._ean_por_fila.get(fila)
+
+    def actualizar_cantidad(self, ean, fila, cantidad):
+        """Reemplaza la cantidad pendiente registrada para una fila del EAN."""
+        entradas = self._entradas.get(normalizar_ean(ean), [])
+        for posicion, entrada in enumerate(entradas):
+            if entrada.fila == fila:
+                entradas[posicion] = EntradaIndice(fila, cantidad)
+                return True
+        return False
+
+    def insertar_despues(self, fila, ean=None, cantidad=None):
+        """
+        Registra una fila nueva insertada inmediatamente después de ``fila``.
+
+        Todas las filas con índice mayor a ``fila`` se desplazan en uno. La fila
+        nueva (fila + 1) se asocia al EAN indicado o, si no se indica, al EAN de
+        la fila de origen (es lo que hace btn[7] al partir un lote).
+
+        Returns:
+            int: Índice de la fila insertada
+        """
+        if ean is None:
+            ean = self.ean_de_fila(fila)
+        nueva_fila = fila + 1
+        for clave, entradas in self._entradas.items():
+            self._entradas[clave] = [
+                EntradaIndice(e.fila + 1, e.cantidad_pendiente) if e.fila > fila else e
+                for e in entradas
+            ]
+        self._ean_por_fila = {
+            (fila_ean + 1 if fila_ean > fila else fila_ean): clave for fila_ean, clave in self._ean_por_fila.items()
+        }
+        clave = normalizar_ean(ean)
+        if clave:
+            entradas = self._entradas.setdefault(clave, [])
+            posicion = bisect.bisect_left([e.fila for e in entradas], nueva_fila)
+            entradas.insert(posicion, EntradaIndice(nueva_fila, cantidad))
+            self._ean_por_fila[nueva_fila] = clave
+        return nueva_fila
+
+
+class GridSnapshot:
+    """
+    Copia en memoria, orientada a columnas, del contenido del grid de SAP.
+
+    La lectura se hace de forma perezosa la primera vez que se consulta un valor
+    y se repite solo después de llamar a ``invalidar()`` (al presionar Enter
+    sobre el grid). Las filas agregadas con btn[7] se reflejan con
+    ``registrar_insercion()`` sin releer la pantalla.
+    """
+
+    def __init__(self, grid, columnas=COLUMNAS_SNAPSHOT):
+        self.grid = grid
+        self.columnas = tuple(columnas)
+        self._datos = None
+        self._indice = None
+        self._total_filas = 0
+        self.lecturas = 0
+
+    def refrescar(self):
+        """Lee todas las columnas del grid en una sola pasada."""
+        total = self.grid.RowCount
+        datos = {columna: [""] * total for columna in self.columnas}
+        for columna in self.columnas:
+            valores = datos[columna]
+            for fila in range(total):
+                try:
+                    valor = self.grid.getCellValue(fila, columna)
+                except Exception:
+                    continue
+                valores[fila] = "" if valor is None else str(valor)
+        self._datos = datos
+        self._indice = None
+        self._total_filas = total
+        self.lecturas += 1
+        logger.debug(f"Snapshot del grid leído: {total} filas, columnas {list(self.columnas)}")
+        return self
+
+    def invalidar(self):
+        """Marca el snapshot como desactualizado; se releerá en el próximo acceso."""
+        self._datos = None
+        self._indice = None
+
+    def registrar_insercion(self, fila):
+        """
+        Refleja en memoria una fila de lote insertada después de ``fila`` (btn[7]).
+
+        En lugar de releer todo el grid, se inserta la fila nueva en las columnas
+        copiando el EAN de la fila de origen, se desplaza el índice y se marcan
+        como desconocidos los valores de ambas filas, que se leen del grid
+        celda por celda solo si alguien los consulta.
+
+        Returns:
+            int: Índice de la fila insertada
+        """
+        if self._datos is None:
+            return fila + 1
+        datos = self._datos
+        nueva_fila = fila + 1
+        for columna, valores in datos.items():
+            if columna == "ZZEAN13":
+                valores.insert(nueva_fila, valores[fila])
+            else:
+                valores[fila] = None
+                valores.insert(nueva_fila, None)
+        self._total_filas += 1
+        if self._indice is not None:
+            ean = normalizar_ean(datos["ZZEAN13"][fila]) if "ZZEAN13" in datos else None
+            self._indice.insertar_despues(fila, ean)
+            if ean:
+                self._indice.actualizar_cantidad(ean, fila, None)
+        return nueva_fila
+
+    @property
+    def vigente(self):
+        return self._datos is not None
+
+    def _asegurar(self):
+        if self._datos is None:
+            self.refrescar()
+        return self._datos
+
+    @property
+    def RowCount(self):
+        self._asegurar()
+        return self._total_filas
+
+    def __len__(self):
+        return self.RowCount
+
+    def columna(self, nombre):
+        """Devuelve la lista de valores de una columna del snapshot."""
+        return self._asegurar()[nombre]
+
+    def valor(self, fila, columna):
+        """Devuelve el valor de una celda como string (vacío si no se pudo leer)."""
+        valores = self._asegurar()[columna]
+        if valores[fila] is None:
+            # Celda marcada como desconocida tras una inserción: se lee solo esta celda
+            try:
+                valor = self.grid.getCellValue(fila, columna)
+            except Exception:
+                valor = ""
+            valores[fila] = "" if valor is None else str(valor)
+        return valores[fila]
+
+    def ean(self, fila):
+        return normalizar_ean(self.valor(fila, "ZZEAN13"))
+
+    @property
+    def indice(self):
+        """Índice EAN -> filas construido a partir del snapshot (una sola vez por pantalla)."""
+        datos = self._asegurar()
+        if self._indice is None:
+            self._indice = IndiceEAN.desde_columnas(datos["ZZEAN13"], datos["CANT_PEND"])
+        return self._indice
+
+    def entradas_ean(self, ean):
+        """
+        Devuelve las entradas (fila, cantidad pendiente) de un EAN.
+
+        Las cantidades que quedaron desconocidas después de una inserción se
+        leen del grid en ese momento y se actualizan en el índice.
+        """
+        entradas = []
+        for entrada in self.indice.entradas(ean):
+            if entrada.cantidad_pendiente is None and self._datos["CANT_PEND"][entrada.fila] is None:
+                cantidad = cantidad_a_int(self.valor(entrada.fila, "CANT_PEND"))
+                self.indice.actualizar_cantidad(ean, entrada.fila, cantidad)
+                entrada = EntradaIndice(entrada.fila, cantidad)
+            entradas.append(entrada)
+        return entradas
+
+    def filas_con_ean(self, ean):
+        """Devuelve, en orden, todas las filas cuyo ZZEAN13 coincide con el EAN dado."""
+        return self.indice.filas(ean)
+
+    def eans(self):
+        """Devuelve el conjunto de EANs no vacíos presentes en el grid."""
+        return self.indice.eans()
+
+
+def asegurar_snapshot(grid, snapshot=None):
+    """
+    Devuelve el snapshot recibido o crea uno nuevo para el grid.
+
+    Permite que las funciones de búsqueda sigan aceptando solo el grid, pero que
+    ``process_entrega`` comparta un único snapshot entre todas ellas.
+    """
+    if snapshot is not None:
+        return snapshot
+    return GridSnapshot(grid)
@@ -0,0 +1,308 @@
+"""
+Huella de contenido de cada entrega para no reprocesar entradas idénticas.
+
+En ``Errores/No_Procesados`` la misma entrega aparece fallando una y otra vez
+(p.ej. ``5100063854 0082209666`` a las 05:30 y otra vez a las 09:21), y cada
+reintento cuesta una navegación completa en SAP. Además los Excel procesados
+bien quedan en ``no_procesados`` y el scheduler los volvía a levantar.
+
+Antes de tocar SAP se calcula una huella (SHA-256 de las filas normalizadas
+del Excel más OC y número de entrega, así un Excel re-exportado con el mismo
+contenido da la misma huella) y se consulta el resultado anterior:
+
+- ``ok``: la entrega ya se creó en SAP, se omite.
+- ``error`` con un motivo que depende solo del contenido (clase ``datos`` en
+  reintentos.py: Excel inválido, EANs que no están en la OC, remito mal
+  formado...): fallaría igual, se omite.
+- ``error`` por SAP o por datos maestros demorados: se reintenta.
+
+Para forzar el reproceso: ``python bot_runner.py --forzar`` (o
+``SAP_FORZAR_REPROCESO=1``), o borrar la huella de un archivo:
+
+    python huellas.py olvidar --archivo "no_procesados/5100063854 0082209666.xlsx"
+    python huellas.py consultar --archivo "no_procesados/5100063854 0082209666.xlsx"
+"""
+
+import os
+import sys
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+from lector_excel import iterar_registros_entrega
+from registro_errores import hash_archivo, separar_nombre_entrega
+from reintentos import clasificar_falla, CLASE_DATOS
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_BASE_DATOS = "huellas_entregas.sqlite3"
+VERSION_HUELLA = "1"
+
+RESULTADO_OK = "ok"
+RESULTADO_ERROR = "error"
+
+# Huellas calculadas en este proceso por (ruta, tamaño, mtime, OC)
+MAXIMO_CACHE_HUELLAS = 5000
+_cache_huellas = {}
+_cache_lock = threading.Lock()
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS huellas (
+        huella TEXT PRIMARY KEY,
+        oc TEXT NOT NULL,
+        entrega TEXT NOT NULL DEFAULT '',
+        archivo TEXT,
+        resultado TEXT NOT NULL,
+        motivo TEXT,
+        primera_vez TEXT NOT NULL,
+        ultima_vez TEXT NOT NULL,
+        intentos INTEGER NOT NULL DEFAULT 1
+    );
+    CREATE INDEX IF NOT EXISTS ix_huellas_entrega ON huellas (oc, entrega);
+"""
+
+
+def forzar_reproceso_por_entorno():
+    """True si la variable de entorno SAP_FORZAR_REPROCESO pide ignorar las huellas."""
+    return os.getenv("SAP_FORZAR_REPROCESO", "0") == "1"
+
+
+def _texto_valor(valor):
+    if valor is None:
+        return ""
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()[:10]
+    return str(valor).strip()
+
+
+def huella_filas(filas, oc, entrega):
+    """
+    Huella de una entrega a partir de sus filas (remito, EAN, cantidad, lote, vencimiento).
+
+    Las filas se ordenan, así el orden en que el proveedor exportó el Excel no cambia la huella.
+
+    Args:
+        filas: Iterable de tuplas con los valores de COLUMNAS_ENTREGA
+        oc: Número de orden de compra
+        entrega: Número de entrega ('' si el nombre del archivo no lo trae)
+
+    Returns:
+        str: SHA-256 en hexadecimal
+    """
+    lineas = sorted("\x1f".join(_texto_valor(valor) for valor in fila) for fila in filas)
+    digest = hashlib.sha256(f"v{VERSION_HUELLA}|{oc}|{entrega}".encode("utf-8"))
+    for linea in lineas:
+        digest.update(b"\x1e")
+        digest.update(linea.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _oc_entrega(path_excel, oc):
+    oc_nombre, entrega = separar_nombre_entrega(str(path_excel))
+    return str(oc or oc_nombre or ""), entrega or ""
+
+
+def huella_dataframe(df, path_excel, oc=None):
+    """Huella de la entrega ya leída con ``leer_entrega_excel`` (igual a la de ``huella_entrega``)."""
+    oc, entrega = _oc_entrega(path_excel, oc)
+    return huella_filas(df.itertuples(index=False, name=None), oc, entrega)
+
+
+def huella_entrega(path_excel, oc=None):
+    """
+    Huella de un Excel de entrega.
+
+    Si el Excel no se puede interpretar (columnas faltantes, filas inválidas) la huella
+    se calcula sobre los bytes del archivo, así un Excel roto reenviado tal cual también se reconoce.
+
+    Args:
+        path_excel: Ruta del Excel
+        oc: Número de OC (por defecto el del nombre del archivo)
+
+    Returns:
+        str: SHA-256 en hexadecimal
+    """
+    oc, entrega = _oc_entrega(path_excel, oc)
+    # Los Excel que quedan en no_procesados se revisan en cada ciclo: no releerlos si no cambiaron
+    estado = os.stat(path_excel)
+    clave = (os.path.abspath(str(path_excel)), estado.st_size, estado.st_mtime_ns, oc)
+    with _cache_lock:
+        if clave in _cache_huellas:
+            return _cache_huellas[clave]
+    try:
+        registros = iterar_registros_entrega(path_excel)
+        huella = huella_filas(((r.remito, r.ean, r.cantidad, r.lote, r.vencimiento) for r in registros), oc, entrega)
+    except ValueError:
+        huella = huella_filas([("archivo", hash_archivo(path_excel))], oc, entrega)
+    with _cache_lock:
+        if len(_cache_huellas) >= MAXIMO_CACHE_HUELLAS:
+            _cache_huellas.clear()
+        _cache_huellas[clave] = huella
+    return huella
+
+
+def es_motivo_definitivo(motivo):
+    """True si el motivo de error depende solo del contenido del Excel."""
+    return bool(motivo) and clasificar_falla(motivo) == CLASE_DATOS
+
+
+class RegistroHuellas:
+    """
+    Base SQLite con el último resultado de cada huella de entrega.
+
+    Es segura entre hilos (una conexión compartida protegida con un lock).
+
+    Args:
+        ruta: Archivo de la base (":memory:" para pruebas)
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        if ruta != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(ESQUEMA)
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
+
+    def registrar(self, huella, resultado, motivo=None, oc=None, entrega=None, archivo=None, fecha=None):
+        """
+        Guarda el resultado de procesar una entrega; si la huella ya existía lo reemplaza y suma un intento.
+
+        Returns:
+            int: Cantidad de veces que se procesó esa huella
+        """
+        momento = (fecha or datetime.now()).isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO huellas (huella, oc, entrega, archivo, resultado, motivo, primera_vez, ultima_vez, intentos)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+                ON CONFLICT (huella) DO UPDATE SET
+                    archivo = excluded.archivo,
+                    resultado = excluded.resultado,
+                    motivo = excluded.motivo,
+                    ultima_vez = excluded.ultima_vez,
+                    intentos = intentos + 1
+                """,
+                (huella, str(oc or ""), str(entrega or ""), archivo, resultado, motivo, momento, momento),
+            )
+            fila = self._conn.execute("SELECT intentos FROM huellas WHERE huella = ?", (huella,)).fetchone()
+        return fila["intentos"]
+
+    def consultar(self, huella):
+        """Último resultado de la huella como dict, o None si nunca se procesó."""
+        with self._lock:
+            fila = self._conn.execute("SELECT * FROM huellas WHERE huella = ?", (huella,)).fetchone()
+        return dict(fila) if fila else None
+
+    def olvidar(self, huella):
+        """Borra la huella para que la entrega se vuelva a procesar. Devuelve True si existía."""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM huellas WHERE huella = ?", (huella,)).rowcount > 0
+
+    def motivo_omision(self, huella):
+        """
+        Indica si una entrega con esa huella debe omitirse antes de tocar SAP.
+
+        Returns:
+            str: Motivo de la omisión, o None si hay que procesarla
+        """
+        anterior = self.consultar(huella)
+        if anterior is None:
+            return None
+        if anterior["resultado"] == RESULTADO_OK:
+            return f"ya procesada correctamente el {anterior['ultima_vez']}"
+        if es_motivo_definitivo(anterior["motivo"]):
+            return f"ya falló el {anterior['ultima_vez']} por el mismo contenido: {anterior['motivo']}"
+        return None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM huellas").fetchone()[0]
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+
+def obtener_registro_huellas():
+    """Devuelve el registro global (Temp/huellas_entregas.sqlite3, relativo al directorio actual)."""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroHuellas(os.path.join(os.getcwd(), "Temp", NOMBRE_BASE_DATOS))
+        return _registro
+
+
+def registrar_registro_huellas(registro):
+    """Reemplaza el registro global (p.ej. por uno en memoria o en otra carpeta)."""
+    global _registro
+    with _registro_lock:
+        _registro = registro
+
+
+def registrar_resultado(path_excel, resultado, motivo=None, oc=None, huella=None):
+    """
+    Guarda el resultado de una entrega en el registro global sin interrumpir el procesamiento si falla.
+
+    Args:
+        path_excel: Ruta del Excel procesado (debe existir si no se pasa ``huella``)
+        resultado: RESULTADO_OK o RESULTADO_ERROR
+        motivo: Descripción del error
+        oc: Número de orden de compra
+        huella: Huella ya calculada (evita releer el Excel)
+
+    Returns:
+        str: La huella registrada, o None si no se pudo calcular
+    """
+    try:
+        huella = huella or huella_entrega(path_excel, oc)
+        oc, entrega = _oc_entrega(path_excel, oc)
+        obtener_registro_huellas().registrar(
+            huella, resultado, motivo, oc=oc, entrega=entrega, archivo=os.path.basename(str(path_excel)),
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo registrar la huella de {path_excel}: {e}")
+    return huella
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Huellas de las entregas ya procesadas")
+    parser.add_argument("--base", default=os.path.join("Temp", NOMBRE_BASE_DATOS))
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    for nombre, ayuda in (("consultar", "Mostrar el último resultado del Excel"),
+                          ("olvidar", "Borrar la huella para forzar el reproceso del Excel")):
+        subcomando = subcomandos.add_parser(nombre, help=ayuda)
+        subcomando.add_argument("--archivo", required=True, help="Excel de la entrega")
+    args = parser.parse_args(argumentos)
+
+    registro = RegistroHuellas(args.base)
+    try:
+        huella = huella_entrega(args.archivo)
+        if args.comando == "olvidar":
+            borrada = registro.olvidar(huella)
+            print(f"Huella {huella[:12]} {'borrada' if borrada else 'no registrada'}")
+            return 0 if borrada else 1
+        anterior = registro.consultar(huella)
+        if anterior is None:
+            print(f"Huella {huella[:12]} no registrada")
+            return 1
+        print(f"Huella {huella[:12]}  {anterior['resultado']}  intentos={anterior['intentos']}  "
+              f"primera={anterior['primera_vez']}  última={anterior['ultima_vez']}  {anterior['motivo'] or ''}")
+        return 0
+    finally:
+        registro.cerrar()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
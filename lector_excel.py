@@ -0,0 +1,168 @@
+"""
+Lectura de los Excel de entrega de los proveedores.
+
+``process_entrega`` solo usa cinco columnas, pero ``pd.read_excel`` cargaba la
+hoja completa (todas las columnas y todas las filas) antes de filtrar por
+``Fecha Vencimiento``. Este lector abre el .xlsx con openpyxl en modo
+read-only, lee únicamente esas columnas fila por fila, valida los
+encabezados antes de leer datos y devuelve registros ya tipados.
+"""
+
+import os
+import logging
+from collections import namedtuple
+from datetime import date, datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from grilla import normalizar_ean, cantidad_a_int
+from utils import validar_estructura_excel
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS_ENTREGA = [
+    'Remito y Nro. Entrega',
+    'EAN',
+    'Cant confirmada',
+    'Lote estuche',
+    'Fecha Vencimiento',
+]
+
+# Una fila válida del Excel; ``fila`` es la posición entre las filas de datos (como el índice de pandas)
+RegistroEntrega = namedtuple("RegistroEntrega", ["fila", "remito", "ean", "cantidad", "lote", "vencimiento"])
+
+
+def _vacio(valor):
+    if valor is None:
+        return True
+    if isinstance(valor, float) and valor != valor:  # NaN de pandas
+        return True
+    return isinstance(valor, str) and not valor.strip()
+
+
+def a_fecha(valor):
+    """Convierte la fecha de vencimiento (celda fecha o texto dd/mm/aaaa) a ``date``."""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return pd.to_datetime(str(valor).strip(), dayfirst=True).date()
+
+
+def a_cantidad(valor):
+    """Convierte la cantidad confirmada a int (celda numérica o texto)."""
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return int(valor)
+    cantidad = cantidad_a_int(valor)
+    if cantidad is None:
+        raise ValueError(f"Cantidad inválida: {valor!r}")
+    return cantidad
+
+
+def a_texto(valor):
+    """Texto de una celda; los números enteros leídos como float pierden el '.0' (lotes numéricos)."""
+    if _vacio(valor):
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+
+def _registro(fila, valores):
+    remito, ean, cantidad, lote, vencimiento = valores
+    try:
+        return RegistroEntrega(
+            fila=fila,
+            remito=a_texto(remito),
+            ean=normalizar_ean(a_texto(ean)),
+            cantidad=a_cantidad(cantidad),
+            lote=a_texto(lote),
+            vencimiento=a_fecha(vencimiento),
+        )
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Fila {fila + 2} del Excel inválida: {e}") from e
+
+
+def _filas_xlsx(path_excel):
+    """Filas de las columnas de entrega de la primera hoja, en streaming (.xlsx)."""
+    libro = load_workbook(path_excel, read_only=True, data_only=True)
+    try:
+        hoja = libro.worksheets[0]
+        encabezados = [a_texto(valor) for valor in next(hoja.iter_rows(max_row=1, values_only=True), ())]
+        es_valido, mensaje = validar_estructura_excel(encabezados)
+        if not es_valido:
+            raise ValueError(mensaje)
+        posiciones = [encabezados.index(columna) for columna in COLUMNAS_ENTREGA]
+        # Solo el rango de columnas que contiene las cinco de entrega
+        desde, hasta = min(posiciones), max(posiciones)
+        posiciones = [i - desde for i in posiciones]
+        for fila in hoja.iter_rows(min_row=2, min_col=desde + 1, max_col=hasta + 1, values_only=True):
+            yield [fila[i] if i < len(fila) else None for i in posiciones]
+    finally:
+        libro.close()
+
+
+def _filas_xls(path_excel):
+    """Filas de las columnas de entrega para el formato .xls (openpyxl no lo soporta)."""
+    encabezados = pd.read_excel(path_excel, nrows=0).columns
+    es_valido, mensaje = validar_estructura_excel(encabezados)
+    if not es_valido:
+        raise ValueError(mensaje)
+    df = pd.read_excel(path_excel, usecols=COLUMNAS_ENTREGA)[COLUMNAS_ENTREGA]
+    for valores in df.itertuples(index=False, name=None):
+        yield [None if _vacio(valor) else valor for valor in valores]
+
+
+def iterar_registros_entrega(path_excel):
+    """
+    Recorre las filas válidas de un Excel de entrega.
+
+    Las filas sin ``Fecha Vencimiento`` se descartan, igual que el filtro que
+    hacía ``process_entrega`` sobre el DataFrame completo.
+
+    Args:
+        path_excel: Ruta del Excel (.xlsx o .xls)
+
+    Yields:
+        RegistroEntrega: EAN normalizado como texto, cantidad como int y vencimiento como date
+
+    Raises:
+        ValueError: Si faltan columnas requeridas o una fila tiene datos inválidos
+    """
+    if str(path_excel).lower().endswith(".xls"):
+        filas = _filas_xls(path_excel)
+    else:
+        filas = _filas_xlsx(path_excel)
+    for fila, valores in enumerate(filas):
+        if _vacio(valores[4]):
+            continue
+        yield _registro(fila, valores)
+
+
+def leer_entrega_excel(path_excel):
+    """
+    Lee un Excel de entrega como DataFrame con las cinco columnas que usa ``process_entrega``.
+
+    El índice conserva la posición de cada fila en el Excel original.
+
+    Args:
+        path_excel: Ruta del Excel (.xlsx o .xls)
+
+    Returns:
+        DataFrame con las columnas de COLUMNAS_ENTREGA ya tipadas
+    """
+    registros = list(iterar_registros_entrega(path_excel))
+    df = pd.DataFrame(
+        {
+            'Remito y Nro. Entrega': [r.remito for r in registros],
+            'EAN': [r.ean for r in registros],
+            'Cant confirmada': [r.cantidad for r in registros],
+            'Lote estuche': [r.lote for r in registros],
+            'Fecha Vencimiento': [r.vencimiento for r in registros],
+        },
+        index=[r.fila for r in registros],
+        columns=COLUMNAS_ENTREGA,
+    )
+    logger.info(f"📄 {os.path.basename(str(path_excel))}: {len(df)} filas válidas")
+    return df
@@ -0,0 +1,123 @@
+"""
+Logging asincrónico para el bot SAP.
+
+El hilo que maneja SAP GUI por COM escribía cada ``logger.info`` directamente
+en un FileHandler y un StreamHandler (consola de Windows, lenta). Acá los
+registros se encolan con un ``QueueHandler`` y un ``QueueListener`` los
+escribe desde un hilo propio, así el logging no agrega latencia entre
+llamadas COM.
+
+Además:
+- El detalle por fila/EAN se loguea en DEBUG; se ve con ``SAP_LOG_NIVEL=DEBUG``.
+- ``FiltroRepeticiones`` limita los warnings que se repiten desde la misma
+  línea de código (p.ej. uno por EAN) y al reanudar informa cuántos omitió.
+"""
+
+import os
+import queue
+import atexit
+import logging
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Nivel del log del bot (INFO por defecto; DEBUG muestra el detalle por fila)
+NIVEL_LOG = os.getenv("SAP_LOG_NIVEL", "INFO").upper()
+
+# Warnings repetidos desde una misma línea: como máximo MAXIMO_REPETICIONES cada VENTANA_REPETICIONES segundos
+MAXIMO_REPETICIONES = 5
+VENTANA_REPETICIONES = 60.0
+
+_listener = None
+_lock = threading.Lock()
+
+
+class FiltroRepeticiones(logging.Filter):
+    """
+    Deja pasar como máximo ``maximo`` registros por ventana desde cada línea de código.
+
+    Solo aplica a los niveles entre WARNING y ``nivel_maximo``; errores y críticos pasan siempre.
+
+    Args:
+        maximo: Registros permitidos por ventana y por línea de código
+        ventana: Segundos de la ventana
+        nivel_maximo: Nivel más alto al que se aplica el límite
+        reloj: Función de tiempo monotónico (inyectable para pruebas)
+    """
+
+    def __init__(self, maximo=MAXIMO_REPETICIONES, ventana=VENTANA_REPETICIONES,
+                 nivel_maximo=logging.WARNING, reloj=time.monotonic):
+        super().__init__()
+        self.maximo = maximo
+        self.ventana = ventana
+        self.nivel_maximo = nivel_maximo
+        self.reloj = reloj
+        self._lock = threading.Lock()
+        self._origenes = {}  # (logger, archivo, línea) -> [inicio ventana, emitidos, omitidos]
+
+    def filter(self, record):
+        if not logging.WARNING <= record.levelno <= self.nivel_maximo:
+            return True
+        clave = (record.name, record.pathname, record.lineno)
+        ahora = self.reloj()
+        with self._lock:
+            estado = self._origenes.get(clave)
+            if estado is None or ahora - estado[0] >= self.ventana:
+                omitidos = estado[2] if estado is not None else 0
+                self._origenes[clave] = [ahora, 1, 0]
+            elif estado[1] < self.maximo:
+                estado[1] += 1
+                omitidos = 0
+            else:
+                estado[2] += 1
+                return False
+        if omitidos:
+            record.msg = f"{record.msg} (se omitieron {omitidos} avisos similares)"
+        return True
+
+
+def configurar_logging_asincrono(handlers, nivel=None, filtro=None):
+    """
+    Envía todo el logging de la raíz a través de una cola atendida por un hilo escritor.
+
+    Los handlers actuales de la raíz (p.ej. el StreamHandler del ``basicConfig`` de sap.py)
+    se reemplazan por un único QueueHandler.
+
+    Args:
+        handlers: Handlers reales (archivo, consola) que escribe el hilo de fondo
+        nivel: Nivel de la raíz (por defecto SAP_LOG_NIVEL)
+        filtro: Filtro aplicado antes de encolar (por defecto un FiltroRepeticiones)
+
+    Returns:
+        QueueListener: El listener en marcha (se detiene solo al salir del proceso)
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+
+        cola = queue.SimpleQueue()
+        handler_cola = QueueHandler(cola)
+        handler_cola.addFilter(filtro if filtro is not None else FiltroRepeticiones())
+
+        raiz = logging.getLogger()
+        for handler in list(raiz.handlers):
+            raiz.removeHandler(handler)
+        raiz.addHandler(handler_cola)
+        raiz.setLevel(nivel if nivel is not None else NIVEL_LOG)
+
+        _listener = QueueListener(cola, *handlers, respect_handler_level=True)
+        _listener.start()
+        return _listener
+
+
+def detener_logging_asincrono():
+    """Vacía la cola y detiene el hilo escritor."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(detener_logging_asincrono)
@@ -0,0 +1,82 @@
+"""
+Preparación vectorizada de los datos del Excel de entrega.
+
+``process_entrega`` filtraba el DataFrame completo por cada fila del Excel
+(``df[df['EAN'].astype(str).str.strip() == ean]``, O(N²)) y convertía cada
+fecha con ``pd.to_datetime`` dentro del bucle. Acá se normaliza la columna
+EAN y se formatean los vencimientos una sola vez, y un único ``groupby``
+arma el plan por EAN que después consume la carga en SAP.
+"""
+
+import logging
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+from grilla import normalizar_ean
+
+logger = logging.getLogger(__name__)
+
+FORMATO_FECHA_SAP = "%d.%m.%Y"
+
+# Datos de un EAN del Excel listos para escribir en el grid.
+# ``vencimientos`` ya viene formateado como dd.mm.aaaa y ``cantidades`` como int.
+PlanEAN = namedtuple("PlanEAN", ["ean", "filas_excel", "cantidades", "lotes", "vencimientos", "total_cantidad"])
+
+
+def formatear_vencimientos(columna):
+    """
+    Convierte la columna de vencimientos a texto dd.mm.aaaa en una sola operación.
+
+    Acepta fechas (``date``/``datetime``) o texto con el día primero, como los Excel de los proveedores.
+    """
+    return pd.to_datetime(columna, dayfirst=True).dt.strftime(FORMATO_FECHA_SAP)
+
+
+def preparar_lineas_entrega(df_excel):
+    """
+    Normaliza las columnas del Excel de una sola vez: EAN normalizado, cantidad int,
+    lote sin espacios y vencimiento dd.mm.aaaa. Conserva el índice (fila del Excel).
+    """
+    return pd.DataFrame(
+        {
+            'EAN': df_excel['EAN'].map(normalizar_ean),
+            'Cant confirmada': df_excel['Cant confirmada'].astype(float).astype(int),
+            'Lote estuche': df_excel['Lote estuche'].astype(str).str.strip(),
+            'Fecha Vencimiento': formatear_vencimientos(df_excel['Fecha Vencimiento']),
+        },
+        index=df_excel.index,
+    )
+
+
+def preparar_plan_entrega(df_excel):
+    """
+    Agrupa las filas del Excel por EAN normalizado.
+
+    Args:
+        df_excel: DataFrame con las columnas 'EAN', 'Cant confirmada', 'Lote estuche' y 'Fecha Vencimiento'
+
+    Returns:
+        OrderedDict: {ean: PlanEAN} en el orden en que cada EAN aparece por primera vez en el Excel
+    """
+    if df_excel.empty:
+        return OrderedDict()
+
+    preparado = preparar_lineas_entrega(df_excel)
+
+    # Una sola agregación arma las listas de todos los EANs a la vez
+    agrupado = preparado.rename_axis('fila').reset_index().groupby('EAN', sort=False).agg(
+        filas_excel=('fila', list),
+        cantidades=('Cant confirmada', list),
+        lotes=('Lote estuche', list),
+        vencimientos=('Fecha Vencimiento', list),
+        total_cantidad=('Cant confirmada', 'sum'),
+    )
+
+    plan = OrderedDict()
+    for ean, filas, cantidades, lotes, vencimientos, total in agrupado.itertuples(name=None):
+        plan[ean] = PlanEAN(ean, filas, cantidades, lotes, vencimientos, int(total))
+
+    repetidos = [ean for ean, plan_ean in plan.items() if len(plan_ean.filas_excel) > 1]
+    logger.info(f"📋 Plan de entrega: {len(df_excel)} filas, {len(plan)} EANs ({len(repetidos)} con varios lotes)")
+    return plan
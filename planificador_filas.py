@@ -0,0 +1,57 @@
+"""
+Plan de inserción de filas de lote para los EANs repetidos de una entrega.
+
+Antes cada lote adicional se agregaba con btn[7] en medio de la carga y se
+asumía que la fila nueva quedaba en ``fila_actual + 1``; cuando varios EANs
+necesitaban filas extra, los índices de las filas de más abajo se corrían.
+El plan (``PlanInserciones``, armado por ``conciliacion.conciliar``) tiene de
+antemano todas las inserciones de la entrega y la fila final de cada línea del
+Excel. Las inserciones se ejecutan de abajo hacia arriba, así las filas de
+arriba no se mueven, y recién después se cargan todas las celdas en una sola
+pasada.
+"""
+
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Filas de lote a agregar debajo de ``fila_origen`` (fila del grid antes de insertar)
+Insercion = namedtuple("Insercion", ["fila_origen", "cantidad", "ean"])
+# Línea del Excel y fila del grid (después de todas las inserciones) donde se carga
+AsignacionLinea = namedtuple("AsignacionLinea", ["fila", "ean", "cantidad", "lote", "vencimiento", "fila_excel"])
+PlanInserciones = namedtuple("PlanInserciones", ["inserciones", "asignaciones", "filas_agregadas"])
+
+
+def ejecutar_inserciones(inserciones, agregar_fila):
+    """
+    Ejecuta las inserciones de abajo hacia arriba.
+
+    Args:
+        inserciones: Lista de Insercion (se ordena por fila de origen descendente)
+        agregar_fila: Función (fila_origen) -> bool que agrega una fila de lote debajo de la fila
+
+    Returns:
+        tuple: (True, None) si se agregaron todas, (False, Insercion que falló) en caso contrario
+    """
+    for insercion in sorted(inserciones, key=lambda i: i.fila_origen, reverse=True):
+        for numero in range(insercion.cantidad):
+            if not agregar_fila(insercion.fila_origen):
+                logger.error(f"❌ No se pudo agregar el lote {numero + 2} del EAN {insercion.ean} "
+                             f"debajo de la fila {insercion.fila_origen}")
+                return False, insercion
+    return True, None
+
+
+def verificar_asignaciones(asignaciones, ean_de_fila):
+    """
+    Comprueba que cada fila asignada tenga el EAN esperado después de insertar.
+
+    Args:
+        asignaciones: Lista de AsignacionLinea
+        ean_de_fila: Función (fila) -> EAN normalizado leído del grid
+
+    Returns:
+        list: Asignaciones cuya fila no tiene el EAN esperado
+    """
+    return [asignacion for asignacion in asignaciones if ean_de_fila(asignacion.fila) != asignacion.ean]
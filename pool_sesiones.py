@@ -0,0 +1,138 @@
+"""
+Pool de sesiones SAP para procesar la cola de no_procesados en paralelo.
+
+SAP GUI permite hasta 6 sesiones por conexión. Cada trabajador es un hilo con
+su propia sesión (los objetos COM no se comparten entre hilos), inicializa
+COM al arrancar y toma trabajos de una cola compartida. Los archivos se
+agrupan por OC y cada grupo lo procesa un solo trabajador, de modo que dos
+entregas de la misma OC nunca se cargan al mismo tiempo.
+"""
+
+import queue
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Máximo de sesiones por conexión permitido por SAP GUI
+MAX_SESIONES = 6
+
+ResultadoArchivo = namedtuple("ResultadoArchivo", ["archivo", "oc", "sesion", "resultado", "error"])
+
+
+def agrupar_por_oc(archivos, obtener_oc):
+    """
+    Agrupa los archivos por número de OC conservando el orden de llegada.
+
+    Args:
+        archivos: Lista de archivos a procesar
+        obtener_oc: Función que devuelve la OC de un archivo (o None)
+
+    Returns:
+        tuple: (OrderedDict {oc: [archivos]}, lista de archivos sin OC)
+    """
+    grupos = OrderedDict()
+    sin_oc = []
+    for archivo in archivos:
+        oc = obtener_oc(archivo)
+        if not oc:
+            sin_oc.append(archivo)
+            continue
+        grupos.setdefault(oc, []).append(archivo)
+    return grupos, sin_oc
+
+
+class PoolSesionesSAP:
+    """
+    Procesa archivos en paralelo, un hilo por sesión SAP.
+
+    Args:
+        fabrica_sesion: Función (indice) -> sesión SAP. Se llama dentro del hilo
+            del trabajador, después de ``inicializar_hilo``.
+        tamano: Cantidad de sesiones/hilos (entre 1 y MAX_SESIONES)
+        inicializar_hilo: Función a ejecutar al iniciar cada hilo (p.ej. pythoncom.CoInitialize)
+        finalizar_hilo: Función a ejecutar al terminar cada hilo (p.ej. pythoncom.CoUninitialize)
+    """
+
+    def __init__(self, fabrica_sesion, tamano=1, inicializar_hilo=None, finalizar_hilo=None):
+        self.fabrica_sesion = fabrica_sesion
+        self.tamano = max(1, min(int(tamano), MAX_SESIONES))
+        self.inicializar_hilo = inicializar_hilo
+        self.finalizar_hilo = finalizar_hilo
+
+    def procesar(self, archivos, procesar_archivo, obtener_oc):
+        """
+        Procesa todos los archivos y espera a que terminen los trabajadores.
+
+        Args:
+            archivos: Archivos a procesar
+            procesar_archivo: Función (sesion, archivo, oc) que procesa un archivo
+            obtener_oc: Función que devuelve la OC de un archivo
+
+        Returns:
+            list: ResultadoArchivo por cada archivo procesado
+        """
+        grupos, sin_oc = agrupar_por_oc(archivos, obtener_oc)
+        for archivo in sin_oc:
+            logger.warning(f"⚠️ No se pudo extraer OC de: {archivo}")
+
+        cola = queue.Queue()
+        for oc, archivos_oc in grupos.items():
+            cola.put((oc, archivos_oc))
+
+        resultados = []
+        lock = threading.Lock()
+        cantidad_hilos = min(self.tamano, len(grupos)) or 1
+        logger.info(f"🧵 Procesando {len(grupos)} OCs con {cantidad_hilos} sesiones SAP")
+
+        hilos = [
+            threading.Thread(
+                target=self._trabajador,
+                args=(indice, cola, procesar_archivo, resultados, lock),
+                name=f"sap-sesion-{indice}",
+                daemon=True,
+            )
+            for indice in range(cantidad_hilos)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        pendientes = cola.qsize()
+        if pendientes:
+            logger.error(f"❌ Quedaron {pendientes} OCs sin procesar: no hubo sesiones SAP disponibles")
+        return resultados
+
+    def _trabajador(self, indice, cola, procesar_archivo, resultados, lock):
+        if self.inicializar_hilo:
+            self.inicializar_hilo()
+        try:
+            try:
+                sesion = self.fabrica_sesion(indice)
+            except Exception as e:
+                logger.error(f"❌ Error obteniendo sesión SAP {indice}: {e}")
+                sesion = None
+            if sesion is None:
+                logger.error(f"❌ Sesión SAP {indice} no disponible, el trabajador no toma archivos")
+                return
+
+            while True:
+                try:
+                    oc, archivos_oc = cola.get_nowait()
+                except queue.Empty:
+                    break
+                for archivo in archivos_oc:
+                    resultado, error = None, None
+                    try:
+                        resultado = procesar_archivo(sesion, archivo, oc)
+                    except Exception as e:
+                        error = e
+                        logger.error(f"❌ Error procesando {archivo} en sesión {indice}: {e}")
+                    with lock:
+                        resultados.append(ResultadoArchivo(archivo, oc, indice, resultado, error))
+                cola.task_done()
+        finally:
+            if self.finalizar_hilo:
+                self.finalizar_hilo()
@@ -0,0 +1,89 @@
+"""
+Validación previa de las entregas contra la base (EKPO/MARA), antes de abrir SAP GUI.
+
+``validar_eans_excel_en_sap`` recién corre después de navegar a
+``ZMM_RECEP_DOCU``, cargar la OC y abrir el grid: unos 5 s de GUI por archivo
+para enterarse de que falta un EAN (la causa más común de
+``error_ean_no_encontrado``). Con los datos maestros que ``bot_runner`` ya
+trae en bloque (``prefetch_datos_maestros``, una consulta por lote de OCs) se
+descartan antes de tocar SAP los archivos que no pueden pasar nunca:
+
+- EANs del Excel que no están en ninguna posición de la OC (ni como EAN11 de
+  EKPO ni de MARA): mismo criterio que ``validar_eans_excel_en_sap``.
+- EANs repetidos (varios lotes) cuya suma supera lo pedido en la OC (MENGE):
+  la cantidad pendiente del grid nunca es mayor, así que la conciliación
+  contra el grid (``conciliacion.py``) los rechazaría igual. Los EANs de una
+  sola fila no se validan: SAP puede aceptarlos con tolerancia de exceso.
+- OC sin posiciones en la base: todavía no se replicó o liberó, va a la cola
+  de reintentos (clase ``datos_maestros``) sin abrir SAP.
+
+Si la base no responde o el Excel no se puede leer, el archivo sigue su curso
+normal y ``process_entrega`` hace sus propias validaciones.
+"""
+
+import logging
+from collections import namedtuple
+
+from grilla import normalizar_ean
+from lector_excel import leer_entrega_excel
+
+logger = logging.getLogger(__name__)
+
+# valida=False con motivo (texto de error para mover_archivo_a_errores),
+# eans_faltantes [ean] y eans_excedidos {ean: (cantidad Excel, cantidad OC)}
+Prevalidacion = namedtuple("Prevalidacion", ["valida", "motivo", "eans_faltantes", "eans_excedidos"])
+
+VALIDA = Prevalidacion(True, None, [], {})
+
+
+def prevalidar_entrega(df_excel, datos_maestros, oc):
+    """
+    Compara los EANs y cantidades del Excel con las posiciones de la OC en la base.
+
+    Args:
+        df_excel: DataFrame de ``leer_entrega_excel``
+        datos_maestros: DatosMaestrosOC del prefetch
+        oc: Número de orden de compra
+
+    Returns:
+        Prevalidacion
+    """
+    if df_excel.empty or oc not in datos_maestros:
+        return VALIDA
+    cantidades_oc = datos_maestros.cantidades_por_ean(oc)
+    if not cantidades_oc:
+        return Prevalidacion(False, f"OC sin posiciones pendientes en SAP: {oc} (sin posiciones en EKPO)", [], {})
+
+    # Una sola agregación por EAN normalizado: filas y cantidad total del Excel
+    por_ean = df_excel.groupby(df_excel['EAN'].map(normalizar_ean), sort=False)['Cant confirmada'].agg(['size', 'sum'])
+    por_ean = por_ean[por_ean.index != ""]
+
+    eans_faltantes = [ean for ean in por_ean.index if ean not in cantidades_oc]
+    if eans_faltantes:
+        return Prevalidacion(False, f"EANs faltantes en SAP: {eans_faltantes} (validación previa en base)",
+                             eans_faltantes, {})
+
+    repetidos = por_ean[por_ean['size'] > 1]
+    eans_excedidos = {
+        ean: (int(total), int(cantidades_oc[ean]))
+        for ean, total in repetidos['sum'].items()
+        if total > cantidades_oc[ean]
+    }
+    if eans_excedidos:
+        return Prevalidacion(False, f"Cantidades del Excel exceden la OC: {sorted(eans_excedidos)}", [], eans_excedidos)
+    return VALIDA
+
+
+def prevalidar_archivo(path_excel, oc, datos_maestros):
+    """
+    Lee el Excel y lo valida contra la OC; ante cualquier problema de lectura lo deja pasar.
+
+    Returns:
+        Prevalidacion
+    """
+    try:
+        df = leer_entrega_excel(path_excel)
+    except Exception as e:
+        logger.debug(f"Validación previa omitida para {path_excel}: {e}")
+        return VALIDA
+    return prevalidar_entrega(df, datos_maestros, oc)
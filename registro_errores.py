@@ -0,0 +1,322 @@
+"""
+Registro indexado (SQLite) de las entregas movidas a Errores.
+
+``verificar_archivo_en_errores`` recorría ``Errores/No_Procesados`` con
+``os.listdir`` y comparaba nombres con ``startswith`` en cada consulta; la
+carpeta crece sin límite. Cada vez que ``mover_archivo_a_errores`` mueve una
+entrega se registra acá por OC, número de entrega y hash del archivo, con el
+motivo, las fechas del primer y último error y la cantidad de intentos. Las
+búsquedas usan índices (O(log n)).
+
+La primera vez que se crea la base se importan los pares
+``<OC> <entrega>_ERROR_<AAAAMMDD_HHMMSS>.xlsx`` /
+``error_procesamiento_<OC>_<AAAAMMDD_HHMMSS>.txt`` ya existentes. También se
+puede importar a mano:
+
+    python registro_errores.py importar --carpeta Errores/No_Procesados
+    python registro_errores.py buscar --oc 5600025440
+"""
+
+import os
+import re
+import sys
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_BASE_DATOS = "registro_errores.sqlite3"
+FORMATO_TIMESTAMP = "%Y%m%d_%H%M%S"
+TAMANO_BLOQUE_HASH = 1024 * 1024
+
+PATRON_ENTREGA = re.compile(r"^(\d{8,12})\s+(\d+)")
+PATRON_EXCEL_ERROR = re.compile(r"^(?P<base>.+)_ERROR_(?P<ts>\d{8}_\d{6})\.xlsx$", re.IGNORECASE)
+PATRON_TXT_ERROR = re.compile(r"^error_procesamiento_(?P<oc>\d+)_(?P<ts>\d{8}_\d{6})\.txt$", re.IGNORECASE)
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS errores (
+        id INTEGER PRIMARY KEY,
+        oc TEXT NOT NULL,
+        entrega TEXT NOT NULL DEFAULT '',
+        hash TEXT NOT NULL DEFAULT '',
+        nombre_base TEXT NOT NULL,
+        motivo TEXT,
+        primer_error TEXT NOT NULL,
+        ultimo_error TEXT NOT NULL,
+        intentos INTEGER NOT NULL DEFAULT 1,
+        ruta_destino TEXT,
+        ruta_log TEXT
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS ix_errores_clave ON errores (oc, entrega, hash);
+    CREATE INDEX IF NOT EXISTS ix_errores_nombre ON errores (nombre_base);
+    CREATE INDEX IF NOT EXISTS ix_errores_hash ON errores (hash);
+    -- Cada Excel movido a Errores (una entrega puede fallar varias veces)
+    CREATE TABLE IF NOT EXISTS movimientos (
+        ruta_destino TEXT PRIMARY KEY,
+        error_id INTEGER NOT NULL REFERENCES errores (id),
+        fecha TEXT NOT NULL
+    );
+"""
+
+
+def hash_archivo(ruta):
+    """SHA-256 del contenido del archivo, leído por bloques."""
+    digest = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(TAMANO_BLOQUE_HASH), b""):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+def separar_nombre_entrega(nombre_archivo):
+    """
+    Obtiene OC y número de entrega de un nombre "<OC> <entrega>[.xlsx]".
+
+    Returns:
+        tuple: (oc, entrega); entrega es '' si el nombre no la incluye, ambos None si no hay OC
+    """
+    nombre_base = os.path.splitext(os.path.basename(nombre_archivo))[0]
+    coincidencia = PATRON_ENTREGA.match(nombre_base)
+    if coincidencia:
+        return coincidencia.group(1), coincidencia.group(2)
+    solo_oc = re.match(r"^(\d{8,12})", nombre_base)
+    return (solo_oc.group(1), "") if solo_oc else (None, None)
+
+
+def leer_log_error(ruta):
+    """Lee un error_procesamiento_*.txt; devuelve {'archivo_original', 'motivo', 'destino'}."""
+    datos = {}
+    claves = {"Archivo Original:": "archivo_original", "Error:": "motivo", "Archivo Movido a:": "destino"}
+    with open(ruta, encoding="utf-8", errors="replace") as f:
+        for linea in f:
+            for prefijo, clave in claves.items():
+                if linea.startswith(prefijo) and clave not in datos:
+                    datos[clave] = linea[len(prefijo):].strip()
+    return datos
+
+
+class RegistroErrores:
+    """
+    Base SQLite con una fila por (OC, entrega, hash) que terminó en Errores.
+
+    Es segura entre hilos (una conexión compartida protegida con un lock).
+
+    Args:
+        ruta: Archivo de la base (":memory:" para pruebas)
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        if ruta != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self.nueva = ruta == ":memory:" or not os.path.exists(ruta)
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(ESQUEMA)
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
+
+    def registrar(self, nombre_archivo, motivo, oc=None, entrega=None, hash_contenido=None,
+                  ruta_destino=None, ruta_log=None, fecha=None):
+        """
+        Registra un error de una entrega; si ya existía la misma (OC, entrega, hash) suma un intento.
+
+        Returns:
+            int: Cantidad de intentos fallidos de esa entrega
+        """
+        oc_nombre, entrega_nombre = separar_nombre_entrega(nombre_archivo)
+        oc = str(oc or oc_nombre or "")
+        entrega = str(entrega if entrega is not None else entrega_nombre or "")
+        momento = (fecha or datetime.now()).isoformat(timespec="seconds")
+        nombre_base = os.path.splitext(os.path.basename(nombre_archivo))[0]
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO errores (oc, entrega, hash, nombre_base, motivo, primer_error, ultimo_error,
+                                     intentos, ruta_destino, ruta_log)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?)
+                ON CONFLICT (oc, entrega, hash) DO UPDATE SET
+                    intentos = intentos + 1,
+                    motivo = excluded.motivo,
+                    primer_error = MIN(primer_error, excluded.primer_error),
+                    ultimo_error = MAX(ultimo_error, excluded.ultimo_error),
+                    ruta_destino = excluded.ruta_destino,
+                    ruta_log = excluded.ruta_log
+                """,
+                (oc, entrega, hash_contenido or "", nombre_base, motivo, momento, momento, ruta_destino, ruta_log),
+            )
+            fila = self._conn.execute(
+                "SELECT id, intentos FROM errores WHERE oc = ? AND entrega = ? AND hash = ?",
+                (oc, entrega, hash_contenido or ""),
+            ).fetchone()
+            if ruta_destino:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO movimientos (ruta_destino, error_id, fecha) VALUES (?, ?, ?)",
+                    (os.path.abspath(ruta_destino), fila["id"], momento),
+                )
+        return fila["intentos"]
+
+    def _consultar(self, condicion, parametros):
+        with self._lock:
+            filas = self._conn.execute(
+                f"SELECT * FROM errores WHERE {condicion} ORDER BY ultimo_error DESC",  # nosec B608 - condiciones fijas de este módulo
+                parametros,
+            ).fetchall()
+        return [dict(fila) for fila in filas]
+
+    def contiene_archivo(self, nombre_archivo):
+        """True si una entrega con ese nombre (sin extensión) ya fue movida a errores."""
+        nombre_base = os.path.splitext(os.path.basename(nombre_archivo))[0]
+        with self._lock:
+            fila = self._conn.execute("SELECT 1 FROM errores WHERE nombre_base = ? LIMIT 1", (nombre_base,)).fetchone()
+        return fila is not None
+
+    def buscar_por_hash(self, hash_contenido):
+        return self._consultar("hash = ?", (hash_contenido,))
+
+    def buscar_entrega(self, oc, entrega=None):
+        if entrega is None:
+            return self._consultar("oc = ?", (str(oc),))
+        return self._consultar("oc = ? AND entrega = ?", (str(oc), str(entrega)))
+
+    def intentos(self, oc, entrega, hash_contenido=""):
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT intentos FROM errores WHERE oc = ? AND entrega = ? AND hash = ?",
+                (str(oc), str(entrega), hash_contenido or ""),
+            ).fetchone()
+        return fila["intentos"] if fila else 0
+
+    def _registrado_destino(self, ruta_destino):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM movimientos WHERE ruta_destino = ?", (os.path.abspath(ruta_destino),)
+            ).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM errores").fetchone()[0]
+
+    def importar_carpeta(self, carpeta):
+        """
+        Importa los pares Excel/log que ``mover_archivo_a_errores`` dejó en la carpeta.
+
+        Los Excel ya registrados (tabla movimientos) se saltean, así que se puede correr más de una vez.
+
+        Returns:
+            int: Cantidad de entregas importadas
+        """
+        if not os.path.isdir(carpeta):
+            return 0
+        carpeta = os.path.abspath(carpeta)
+        logs = {}
+        excels = []
+        for entrada in os.scandir(carpeta):
+            if not entrada.is_file():
+                continue
+            coincidencia_txt = PATRON_TXT_ERROR.match(entrada.name)
+            if coincidencia_txt:
+                logs[(coincidencia_txt.group("oc"), coincidencia_txt.group("ts"))] = entrada.path
+                continue
+            coincidencia_xlsx = PATRON_EXCEL_ERROR.match(entrada.name)
+            if coincidencia_xlsx:
+                excels.append((entrada.path, coincidencia_xlsx.group("base"), coincidencia_xlsx.group("ts")))
+
+        importadas = 0
+        for ruta, nombre_base, marca in sorted(excels, key=lambda excel: excel[2]):
+            if self._registrado_destino(ruta):
+                continue
+            oc, entrega = separar_nombre_entrega(nombre_base)
+            ruta_log = logs.get((oc, marca))
+            motivo = None
+            if ruta_log:
+                try:
+                    motivo = leer_log_error(ruta_log).get("motivo")
+                except OSError as e:
+                    logger.warning(f"⚠️ No se pudo leer {ruta_log}: {e}")
+            try:
+                hash_contenido = hash_archivo(ruta)
+            except OSError as e:
+                logger.warning(f"⚠️ No se pudo leer {ruta}: {e}")
+                hash_contenido = ""
+            self.registrar(nombre_base, motivo or "(importado sin log de error)", oc=oc, entrega=entrega,
+                           hash_contenido=hash_contenido, ruta_destino=ruta, ruta_log=ruta_log,
+                           fecha=datetime.strptime(marca, FORMATO_TIMESTAMP))
+            importadas += 1
+        logger.info(f"📥 Registro de errores: {importadas} entregas importadas desde {carpeta}")
+        return importadas
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+
+def carpeta_errores_no_procesados():
+    """Carpeta donde mover_archivo_a_errores deja las entregas (relativa al directorio actual)."""
+    return os.path.join(os.getcwd(), "Errores", "No_Procesados")
+
+
+def obtener_registro_errores():
+    """
+    Devuelve el registro global (Errores/registro_errores.sqlite3), creándolo la primera vez.
+
+    Si la base no existía se importan los errores que ya estaban en Errores/No_Procesados.
+    """
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroErrores(os.path.join(os.getcwd(), "Errores", NOMBRE_BASE_DATOS))
+            if _registro.nueva:
+                _registro.importar_carpeta(carpeta_errores_no_procesados())
+        return _registro
+
+
+def registrar_registro_errores(registro):
+    """Reemplaza el registro global (p.ej. por uno en memoria o en otra carpeta)."""
+    global _registro
+    with _registro_lock:
+        _registro = registro
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Registro de entregas movidas a Errores")
+    parser.add_argument("--base", default=os.path.join("Errores", NOMBRE_BASE_DATOS))
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    importar = subcomandos.add_parser("importar", help="Importar los errores existentes de una carpeta")
+    importar.add_argument("--carpeta", default=os.path.join("Errores", "No_Procesados"))
+    buscar = subcomandos.add_parser("buscar", help="Buscar errores por OC, entrega o archivo")
+    buscar.add_argument("--oc")
+    buscar.add_argument("--entrega")
+    buscar.add_argument("--archivo", help="Excel cuyo contenido buscar por hash")
+    args = parser.parse_args(argumentos)
+
+    registro = RegistroErrores(args.base)
+    try:
+        if args.comando == "importar":
+            print(f"Importadas {registro.importar_carpeta(args.carpeta)} entregas; total en el registro: {len(registro)}")
+            return 0
+        if args.archivo:
+            filas = registro.buscar_por_hash(hash_archivo(args.archivo))
+        elif args.oc:
+            filas = registro.buscar_entrega(args.oc, args.entrega)
+        else:
+            parser.error("buscar requiere --oc o --archivo")
+        for fila in filas:
+            print(f"{fila['oc']} {fila['entrega']}  intentos={fila['intentos']}  "
+                  f"primero={fila['primer_error']}  último={fila['ultimo_error']}  {fila['motivo']}")
+        return 0 if filas else 1
+    finally:
+        registro.cerrar()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
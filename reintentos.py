@@ -0,0 +1,295 @@
+"""
+Clasificación de fallas y cola de reintentos con espera exponencial.
+
+Todos los caminos de error de ``process_entrega`` terminaban en
+``mover_archivo_a_errores``: un timeout de COM/SAP GUI recibía el mismo trato
+que un EAN faltante o un remito mal formado. Ahora cada falla se clasifica:
+
+- ``transitoria``: COM, SAP GUI, celdas de la grilla que no se pudieron escribir
+  o leer, timeouts.
+  Puede salir bien en el próximo intento.
+- ``datos_maestros``: la OC todavía no tiene posiciones en SAP (réplica o
+  liberación demorada). Puede salir bien más tarde.
+- ``datos``: Excel inválido, EANs que no están en la OC, remito mal formado...
+  Va a fallar igual: directo a errores (y ``huellas`` no la vuelve a intentar).
+- ``manual``: estado incierto, celdas que SAP muestra con otro valor o no
+  clasificado: directo a errores para revisar.
+
+Las dos primeras van a ``Errores/Reintentos`` y a una cola persistente
+(``Temp/cola_reintentos.sqlite3``) con espera exponencial y un máximo de
+intentos por clase; ``bot_runner`` las reintenta en los ciclos en que no
+llegaron archivos nuevos. Agotado el máximo, el archivo va a errores como antes.
+
+    python reintentos.py            # cola pendiente
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import logging
+import argparse
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from diario_errores import tipo_de_error
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_BASE_DATOS = "cola_reintentos.sqlite3"
+
+CLASE_TRANSITORIA = "transitoria"
+CLASE_DATOS_MAESTROS = "datos_maestros"
+CLASE_DATOS = "datos"
+CLASE_MANUAL = "manual"
+
+# Política por clase: maximo_intentos cuenta solo los reintentos (sin el intento original)
+Politica = namedtuple("Politica", ["reintentable", "maximo_intentos", "espera_inicial", "factor", "espera_maxima"])
+
+POLITICAS = {
+    CLASE_TRANSITORIA: Politica(True, 4, 120.0, 2.0, 3600.0),
+    CLASE_DATOS_MAESTROS: Politica(True, 6, 1800.0, 2.0, 6 * 3600.0),
+    CLASE_DATOS: Politica(False, 0, 0.0, 1.0, 0.0),
+    CLASE_MANUAL: Politica(False, 0, 0.0, 1.0, 0.0),
+}
+
+# Tipo de error (diario_errores.tipo_de_error) -> clase
+CLASES_POR_TIPO = {
+    "sap": CLASE_TRANSITORIA,
+    "carga_grid": CLASE_TRANSITORIA,
+    "escritura_grid": CLASE_TRANSITORIA,
+    "excepcion": CLASE_TRANSITORIA,
+    "oc_sin_posiciones": CLASE_DATOS_MAESTROS,
+    "excel_invalido": CLASE_DATOS,
+    "excel_sin_filas": CLASE_DATOS,
+    "remito_invalido": CLASE_DATOS,
+    "ean_no_encontrado": CLASE_DATOS,
+    "sin_filas_procesadas": CLASE_DATOS,
+    "cantidad_excedida": CLASE_DATOS,
+    "estado_incierto": CLASE_MANUAL,
+    "etiqueta_pendiente": CLASE_MANUAL,
+    "escritura_distinta": CLASE_MANUAL,
+}
+
+# Textos de errores de COM/SAP GUI que indican una falla pasajera aunque el tipo no se reconozca
+INDICIOS_TRANSITORIOS = ("com_error", "timeout", "rpc", "ocupad", "busy", "disconnected", "desconect")
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS reintentos (
+        huella TEXT PRIMARY KEY,
+        ruta TEXT NOT NULL,
+        nombre TEXT NOT NULL,
+        oc TEXT,
+        clase TEXT NOT NULL,
+        motivo TEXT,
+        intentos INTEGER NOT NULL DEFAULT 1,
+        proximo REAL NOT NULL,
+        en_proceso INTEGER NOT NULL DEFAULT 0,
+        actualizado TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_reintentos_proximo ON reintentos (en_proceso, proximo);
+"""
+
+Reintento = namedtuple("Reintento", ["huella", "ruta", "nombre", "oc", "clase", "motivo", "intentos", "proximo"])
+
+
+def clasificar_falla(motivo):
+    """
+    Clase de una falla a partir de su motivo.
+
+    Returns:
+        str: CLASE_TRANSITORIA, CLASE_DATOS_MAESTROS, CLASE_DATOS o CLASE_MANUAL
+    """
+    clase = CLASES_POR_TIPO.get(tipo_de_error(motivo))
+    if clase is not None:
+        return clase
+    texto = str(motivo or "").lower()
+    if any(indicio in texto for indicio in INDICIOS_TRANSITORIOS):
+        return CLASE_TRANSITORIA
+    return CLASE_MANUAL
+
+
+def espera_reintento(politica, intento):
+    """Segundos hasta el reintento número ``intento`` (1 = primer reintento)."""
+    return min(politica.espera_maxima, politica.espera_inicial * politica.factor ** (intento - 1))
+
+
+def carpeta_reintentos():
+    """Carpeta donde esperan los archivos a reintentar (junto a Errores/No_Procesados)."""
+    return os.path.join(os.getcwd(), "Errores", "Reintentos")
+
+
+class ColaReintentos:
+    """
+    Cola persistente (SQLite) de entregas a reintentar, una fila por huella de contenido.
+
+    Es segura entre hilos (una conexión compartida protegida con un lock).
+
+    Args:
+        ruta: Archivo de la base (":memory:" para pruebas)
+        politicas: {clase: Politica} (por defecto POLITICAS)
+        reloj: Función de tiempo (epoch, inyectable para pruebas)
+    """
+
+    def __init__(self, ruta, politicas=None, reloj=time.time):
+        self.ruta = ruta
+        self.politicas = politicas if politicas is not None else POLITICAS
+        self.reloj = reloj
+        self._lock = threading.Lock()
+        if ruta != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(ESQUEMA)
+            # Lo que quedó tomado por una corrida que se cortó vuelve a la cola
+            self._conn.execute("UPDATE reintentos SET en_proceso = 0 WHERE en_proceso = 1")
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _reintento(fila):
+        return Reintento(*(fila[campo] for campo in Reintento._fields))
+
+    def intentos(self, huella):
+        with self._lock:
+            fila = self._conn.execute("SELECT intentos FROM reintentos WHERE huella = ?", (huella,)).fetchone()
+        return fila["intentos"] if fila else 0
+
+    def programar(self, path_excel, oc, motivo, huella, carpeta=None):
+        """
+        Si la falla puede salir bien más adelante y queda presupuesto, mueve el Excel a la
+        carpeta de reintentos y lo agenda.
+
+        Args:
+            path_excel: Ruta del Excel que falló
+            oc: Número de orden de compra
+            motivo: Motivo del error
+            huella: Huella de contenido del Excel (clave de la cola)
+            carpeta: Carpeta de reintentos (por defecto Errores/Reintentos)
+
+        Returns:
+            Reintento agendado, o None si el archivo debe ir a errores
+        """
+        if not huella:
+            return None
+        clase = clasificar_falla(motivo)
+        politica = self.politicas.get(clase, POLITICAS[CLASE_MANUAL])
+        intento = self.intentos(huella) + 1
+        if not politica.reintentable or intento > politica.maximo_intentos:
+            self.quitar(huella)
+            if politica.reintentable:
+                logger.warning(f"⚠️ Se agotaron los {politica.maximo_intentos} reintentos ({clase}) de {os.path.basename(str(path_excel))}")
+            return None
+
+        carpeta = carpeta or carpeta_reintentos()
+        nombre = os.path.basename(str(path_excel))
+        destino = os.path.join(carpeta, nombre)
+        try:
+            os.makedirs(carpeta, exist_ok=True)
+            if os.path.abspath(str(path_excel)) != os.path.abspath(destino):
+                shutil.move(str(path_excel), destino)
+        except OSError as e:
+            logger.error(f"❌ No se pudo mover {nombre} a reintentos: {e}")
+            return None
+
+        proximo = self.reloj() + espera_reintento(politica, intento)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO reintentos (huella, ruta, nombre, oc, clase, motivo, intentos, proximo, en_proceso, actualizado)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+                ON CONFLICT (huella) DO UPDATE SET
+                    ruta = excluded.ruta, nombre = excluded.nombre, clase = excluded.clase, motivo = excluded.motivo,
+                    intentos = excluded.intentos, proximo = excluded.proximo, en_proceso = 0,
+                    actualizado = excluded.actualizado
+                """,
+                (huella, destino, nombre, str(oc), clase, motivo, intento, proximo,
+                 datetime.now().isoformat(timespec="seconds")),
+            )
+        return Reintento(huella, destino, nombre, str(oc), clase, motivo, intento, proximo)
+
+    def tomar_vencidos(self, limite=None):
+        """
+        Marca como en proceso y devuelve los reintentos cuyo turno ya llegó.
+
+        Args:
+            limite: Máximo de reintentos a tomar (None = todos)
+
+        Returns:
+            list[Reintento]: Del más atrasado al más reciente
+        """
+        consulta = "SELECT * FROM reintentos WHERE en_proceso = 0 AND proximo <= ? ORDER BY proximo"
+        parametros = (self.reloj(),)
+        if limite is not None:
+            consulta += " LIMIT ?"
+            parametros += (int(limite),)
+        with self._lock, self._conn:
+            filas = self._conn.execute(consulta, parametros).fetchall()
+            self._conn.executemany("UPDATE reintentos SET en_proceso = 1 WHERE huella = ?",
+                                   [(fila["huella"],) for fila in filas])
+        return [self._reintento(fila) for fila in filas]
+
+    def quitar(self, huella):
+        """Saca una entrega de la cola (salió bien o va definitivamente a errores)."""
+        if not huella:
+            return
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM reintentos WHERE huella = ?", (huella,))
+
+    def pendientes(self):
+        with self._lock:
+            filas = self._conn.execute("SELECT * FROM reintentos ORDER BY proximo").fetchall()
+        return [self._reintento(fila) for fila in filas]
+
+
+_cola = None
+_cola_lock = threading.Lock()
+
+
+def obtener_cola_reintentos():
+    """Devuelve la cola global (Temp/cola_reintentos.sqlite3, relativa al directorio actual)."""
+    global _cola
+    with _cola_lock:
+        if _cola is None:
+            _cola = ColaReintentos(os.path.join(os.getcwd(), "Temp", NOMBRE_BASE_DATOS))
+        return _cola
+
+
+def registrar_cola_reintentos(cola):
+    """Reemplaza la cola global (p.ej. por una en memoria o en otra carpeta)."""
+    global _cola
+    with _cola_lock:
+        _cola = cola
+
+
+def quitar_reintento(huella):
+    """Saca la entrega de la cola global sin interrumpir el procesamiento si falla (llamar al terminar bien)."""
+    try:
+        obtener_cola_reintentos().quitar(huella)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo quitar la entrega de la cola de reintentos: {e}")
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Cola de reintentos de entregas")
+    parser.add_argument("--base", default=os.path.join("Temp", NOMBRE_BASE_DATOS))
+    args = parser.parse_args(argumentos)
+
+    cola = ColaReintentos(args.base)
+    try:
+        for reintento in cola.pendientes():
+            proximo = datetime.fromtimestamp(reintento.proximo).isoformat(timespec="seconds")
+            print(f"{proximo}  {reintento.nombre}  {reintento.clase}  intento {reintento.intentos}  {reintento.motivo}")
+        return 0
+    finally:
+        cola.cerrar()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,24 @@
 import os
-import time
 import logging
-import pandas as pd
-import win32com.client
 from dotenv import load_dotenv
 from abrirsap import ingresarsap
 from utils import consultarCadenaFrio
-import pythoncom
+from grilla import GridSnapshot, asegurar_snapshot, normalizar_ean, normalize_sap_number
+from esperas import esperar_filas, esperar_hasta, esperar_sesion_libre
+from lector_excel import leer_entrega_excel
+from plan_entrega import preparar_plan_entrega
+from escritor_grid import EscritorGrid
+from planificador_filas import ejecutar_inserciones, verificar_asignaciones
+from conciliacion import conciliar_entrega
+from backend_sap import obtener_backend
+from tiempos import cronometrar, etapa, anotar, anotar_total
+from registro_errores import hash_archivo, obtener_registro_errores
+from huellas import huella_dataframe, registrar_resultado, RESULTADO_OK, RESULTADO_ERROR
+from diario_errores import diario_errores, registrar_intento, intento_actual, anotar_error, anotar_ok
+from etiquetas_pdf import CARPETA_ETIQUETAS, RecolectorEtiquetas, obtener_recolector
+from reintentos import obtener_cola_reintentos, quitar_reintento
+from estado_entrega import (AvanceEntrega, obtener_registro_estados, PARSEADO, NAVEGADO, GRID_CARGADO, CONFIRMADO,
+                            POPUP_REMITO, ETIQUETA, REANUDAR_ETIQUETA, REANUDAR_INCIERTO)
 import shutil
 from datetime import datetime
 # Configuración de logging
@@ -21,6 +33,9 @@ try:
 except Exception as e:
     logger.warning("No se pudo cargar .env: %s", e)
 
+# Veces que se busca el PDF de una entrega ya generada antes de dejarla para reimprimir a mano
+MAXIMO_ESPERAS_ETIQUETA = 3
+
 
 
 def get_sap_session(sesionsap: int = 0):
@@ -31,14 +46,16 @@ def get_sap_session(sesionsap: int = 0):
         sesionsap: Índice de la sesión SAP a utilizar
         
     Returns:
-        CDispatch: Objeto de sesión SAP o None si falla
+        CDispatch: Objeto de sesión SAP (del backend registrado) o None si falla o si
+        no existe esa sesión (nunca se cae en otra: dos hilos manejarían la misma)
     """
-    pythoncom.CoInitialize()
+    backend = obtener_backend()
+    backend.inicializar_hilo()
     
     try:
         try:
-            SapGuiAuto = win32com.client.GetObject('SAPGUI')
-            if not isinstance(SapGuiAuto, win32com.client.CDispatch):
+            SapGuiAuto = backend.obtener_sapgui()
+            if not backend.es_objeto(SapGuiAuto):
                 print("No se pudo obtener el objeto SAPGUI. Asegúrate de que SAP GUI está abierto.")
                 return None
         except Exception as e:
@@ -48,7 +65,7 @@ def get_sap_session(sesionsap: int = 0):
             
         try:
             application = SapGuiAuto.GetScriptingEngine
-            if not isinstance(application, win32com.client.CDispatch):
+            if not backend.es_objeto(application):
                 print("No se pudo obtener el ScriptingEngine.")
                 return None
         except Exception as e:
@@ -61,7 +78,7 @@ def get_sap_session(sesionsap: int = 0):
                 print("No hay conexiones SAP activas. Inicia sesión en SAP primero.")
                 return None
             connection = application.Children(0)
-            if not isinstance(connection, win32com.client.CDispatch):
+            if not backend.es_objeto(connection):
                 print("No se pudo obtener la conexión SAP.")
                 return None
         except Exception as e:
@@ -74,9 +91,9 @@ def get_sap_session(sesionsap: int = 0):
             if session_count == 0:
                 print("No hay sesiones disponibles en la conexión")
                 return None
-            if sesionsap >= session_count:
+            if not 0 <= sesionsap < session_count:
                 print(f"Índice de sesión {sesionsap} no válido. Solo hay {session_count} sesiones.")
-                sesionsap = 0
+                return None
             session = connection.Children(sesionsap)
         except Exception as e:
             print(f"Error al acceder a las sesiones: {e}")
@@ -105,85 +122,45 @@ def get_sap_session(sesionsap: int = 0):
         return None
 
 
-
-def normalize_sap_number(value):
+def abrir_sesiones_sap(session, cantidad, timeout=None):
     """
-    Normaliza valores numéricos devueltos por SAP que pueden venir en formato científico o decimal.
-    Maneja números con formato europeo (punto como separador de miles).
+    Abre sesiones adicionales en la conexión de la sesión dada hasta tener ``cantidad``.
     
     Args:
-        value: Valor devuelto por SAP (puede ser string, float, int, etc.)
+        session: Sesión SAP ya autenticada
+        cantidad: Cantidad total de sesiones deseada (SAP GUI permite hasta 6)
+        timeout: Segundos máximos de espera por cada sesión nueva (por defecto según esperas.py)
         
     Returns:
-        str: Valor normalizado como string entero
+        int: Cantidad de sesiones disponibles en la conexión
     """
     try:
-        # Convertir a string primero
-        str_value = str(value).strip()
-        
-        # Si está vacío, retornar "0"
-        if not str_value:
-            return "0"
-
-        # Si es un número en formato científico (ej: "1.0E+3")
-        if 'E' in str_value.upper() or 'e' in str_value:
-            try:
-                float_val = float(str_value)
-                return str(int(float_val))
-            except:
-                return str_value
-        
-        # Manejar formato europeo (punto como separador de miles)
-        # Ejemplo: "1.000" -> 1000, "1.500" -> 1500
-        if '.' in str_value and ',' not in str_value:
-            # Verificar si es formato europeo (punto como separador de miles)
-            # Si tiene más de 3 dígitos después del punto, es formato europeo
-            parts = str_value.split('.')
-            if len(parts) == 2 and len(parts[1]) == 3:
-                # Es formato europeo: "1.000" -> 1000
-                try:
-                    # Remover el punto y convertir a entero
-                    clean_value = str_value.replace('.', '')
-                    int_val = int(clean_value)
-                    return str(int_val)
-                except:
-                    pass
-        
-        # Si es un float con decimales (ej: "1000.0")
-        if '.' in str_value:
-            try:
-                float_val = float(str_value)
-                return str(int(float_val))
-            except:
-                return str_value
-        
-        # Si es un entero normal
-        try:
-            int_val = int(float(str_value))
-            return str(int_val)
-        except:
-            return str_value
-            
+        connection = session.Parent
+        while connection.Children.Count < cantidad:
+            sesiones_antes = connection.Children.Count
+            session.createSession()
+            if not esperar_hasta(lambda: connection.Children.Count > sesiones_antes, "sesion_creada", timeout):
+                logger.warning(f"⚠️ No se pudo abrir la sesión SAP {sesiones_antes + 1}")
+                break
+        return connection.Children.Count
     except Exception as e:
-        logger.warning(f"Error normalizando valor SAP '{value}': {e}")
-        return str(value)
+        logger.error(f"❌ Error abriendo sesiones SAP adicionales: {e}")
+        return 1
+
 
 
-def find_row_by_ean(grid, ean_to_find, start_index=0):
+def find_row_by_ean(grid, ean_to_find, start_index=0, snapshot=None):
     """
     Recorre el grid buscando el EAN en la columna ZZEAN13.
     Devuelve el índice de fila donde coincide, o None si no lo encuentra.
     """
-    total = grid.RowCount
-    for offset in range(total):
-        idx = (start_index + offset) % total
-        try:
-            current = grid.getCellValue(idx, "ZZEAN13").strip()
-        except Exception:
-            continue
-        if current == ean_to_find.strip():
-            return idx
-    return None
+    snapshot = asegurar_snapshot(grid, snapshot)
+    filas = snapshot.filas_con_ean(ean_to_find)
+    if not filas:
+        return None
+    # Primera fila desde start_index; si no hay, se da la vuelta al grid
+    siguiente = snapshot.indice.primera_fila(ean_to_find, start_index)
+    return siguiente if siguiente is not None else filas[0]
 
 
 def get_quantity_column_name(grid):
@@ -217,28 +194,8 @@ def get_quantity_column_name(grid):
     return "MENGE"
 
 
-def debug_grid_columns(grid):
-    """
-    Función de debug para listar todas las columnas disponibles en el grid.
-    """
-    try:
-        logger.info("🔍 DEBUG: Listando columnas disponibles en el grid...")
-        # Intentar obtener información de las primeras filas para detectar columnas
-        for row_idx in range(min(3, grid.RowCount)):
-            logger.info(f"Fila {row_idx}:")
-            for col_idx in range(20):  # Probar hasta 20 columnas
-                try:
-                    col_name = f"Col{col_idx}"
-                    value = grid.getCellValue(row_idx, col_name)
-                    if value:
-                        logger.info(f"  {col_name}: {value}")
-                except:
-                    continue
-    except Exception as e:
-        logger.error(f"Error en debug_grid_columns: {e}")
-
 
-def find_row_by_ean_and_quantity(grid, ean_to_find, expected_quantity, start_index=0):
+def find_row_by_ean_and_quantity(grid, ean_to_find, expected_quantity, start_index=0, snapshot=None):
     """
     Recorre el grid buscando el EAN en la columna ZZEAN13 y valida la cantidad pendiente.
     Devuelve el índice de fila donde coincide, o None si no lo encuentra.
@@ -248,41 +205,38 @@ def find_row_by_ean_and_quantity(grid, ean_to_find, expected_quantity, start_ind
         ean_to_find: EAN a buscar
         expected_quantity: Cantidad esperada (del Excel)
         start_index: Índice inicial para la búsqueda
+        snapshot: GridSnapshot compartido (opcional)
         
     Returns:
         int: Índice de fila donde coincide, o None si no lo encuentra
     """
-    # Determinar el nombre de la columna de cantidad
-    quantity_column = get_quantity_column_name(grid)
+    snapshot = asegurar_snapshot(grid, snapshot)
+    
+    # Filas del EAN en el orden de recorrido desde start_index (con vuelta al inicio)
+    filas = snapshot.filas_con_ean(ean_to_find)
+    filas = [f for f in filas if f >= start_index] + [f for f in filas if f < start_index]
+    expected_quantity_str = str(int(expected_quantity))
     
-    total = grid.RowCount
-    for offset in range(total):
-        idx = (start_index + offset) % total
+    for idx in filas:
         try:
-            # Obtener EAN de la fila
-            current_ean = grid.getCellValue(idx, "ZZEAN13").strip()
+            # Obtener cantidad pendiente de SAP usando la columna correcta
+            sap_quantity = snapshot.valor(idx, "CANT_PEND")
+            sap_quantity_normalized = normalize_sap_number(sap_quantity)
             
-            # Si el EAN coincide, validar cantidad pendiente
-            if current_ean == ean_to_find.strip():
-                # Obtener cantidad pendiente de SAP usando la columna correcta
-                sap_quantity = grid.getCellValue(idx, "CANT_PEND")
-                sap_quantity_normalized = normalize_sap_number(sap_quantity)
-                expected_quantity_str = str(int(expected_quantity))
-                
-                logger.info(f"EAN encontrado: {current_ean}")
-                logger.info(f"Cantidad SAP (original): {sap_quantity}")
-                logger.info(f"Cantidad SAP (normalizada): {sap_quantity_normalized}")
-                logger.info(f"Cantidad esperada (Excel): {expected_quantity_str}")
+            logger.debug(f"EAN encontrado: {snapshot.ean(idx)}")
+            logger.debug(f"Cantidad SAP (original): {sap_quantity}")
+            logger.debug(f"Cantidad SAP (normalizada): {sap_quantity_normalized}")
+            logger.debug(f"Cantidad esperada (Excel): {expected_quantity_str}")
+            
+            # Comparar cantidades normalizadas
+            if sap_quantity_normalized == expected_quantity_str:
+                logger.debug(f"✅ Cantidad pendiente válida: {sap_quantity_normalized}")
+                return idx
+            else:
+                logger.warning(f"❌ Cantidad pendiente no coincide: SAP={sap_quantity_normalized}, Excel={expected_quantity_str}")
+                # Continuar buscando en caso de que haya otra fila con el mismo EAN
+                continue
                 
-                # Comparar cantidades normalizadas
-                if sap_quantity_normalized == expected_quantity_str:
-                    logger.info(f"✅ Cantidad pendiente válida: {sap_quantity_normalized}")
-                    return idx
-                else:
-                    logger.warning(f"❌ Cantidad pendiente no coincide: SAP={sap_quantity_normalized}, Excel={expected_quantity_str}")
-                    # Continuar buscando en caso de que haya otra fila con el mismo EAN
-                    continue
-                    
         except Exception as e:
             logger.warning(f"Error accediendo a fila {idx}: {e}")
             continue
@@ -292,7 +246,10 @@ def find_row_by_ean_and_quantity(grid, ean_to_find, expected_quantity, start_ind
 
 def registrar_error_ean_no_encontrado(oc, ean_no_encontrado, path_excel):
     """
-    Registra el error de EAN no encontrado en un archivo de log específico.
+    Registra el error de EAN no encontrado en el diario de errores.
+    
+    Dentro de ``process_entrega`` los EANs se juntan en el registro del intento
+    (uno por OC con todos los EANs faltantes, ver diario_errores.py).
     
     Args:
         oc: Número de orden de compra
@@ -300,32 +257,8 @@ def registrar_error_ean_no_encontrado(oc, ean_no_encontrado, path_excel):
         path_excel: Ruta del archivo Excel
     """
     try:
-        import os
-        from datetime import datetime
-        
-        # Crear directorio de errores si no existe
-        error_dir = os.path.join(os.getcwd(), "Errores")
-        os.makedirs(error_dir, exist_ok=True)
-        
-        # Crear archivo de error específico para EAN no encontrado
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        error_file = os.path.join(error_dir, f"error_ean_no_encontrado_{oc}_{timestamp}.txt")
-        
-        with open(error_file, "w", encoding="utf-8") as f:
-            f.write("ERROR DE EAN NO ENCONTRADO - OC CANCELADA\n")
-            f.write("=" * 50 + "\n")
-            f.write(f"OC: {oc}\n")
-            f.write(f"Fecha: {datetime.now()}\n")
-            f.write(f"EAN no encontrado: {ean_no_encontrado}\n")
-            f.write(f"Archivo Excel: {path_excel}\n")
-            f.write(f"Motivo: EAN del Excel no existe en ninguna fila de SAP\n")
-            f.write(f"Estado: OC cancelada - flujo cortado\n")
-            f.write("=" * 50 + "\n")
-            f.write("\nEl sistema requiere que todos los EANs del Excel existan en SAP.\n")
-            f.write("Esta OC ha sido cancelada debido a EANs no encontrados.\n")
-            f.write("Se procede con la siguiente orden de compra.\n")
-        
-        logger.info(f"📝 Error de EAN no encontrado registrado en: {error_file}")
+        anotar_error(oc, path_excel, ean_no_encontrado=ean_no_encontrado)
+        logger.debug(f"📝 EAN no encontrado anotado en el diario de errores: {ean_no_encontrado}")
         
     except Exception as e:
         logger.error(f"❌ Error registrando error de EAN no encontrado para OC {oc}: {e}")
@@ -333,7 +266,7 @@ def registrar_error_ean_no_encontrado(oc, ean_no_encontrado, path_excel):
 
 def registrar_error_ean_repetido(oc, ean_repetido, motivo, path_excel):
     """
-    Registra el error de EAN repetido en un archivo de log específico.
+    Registra el error de EAN repetido en el diario de errores.
     
     Args:
         oc: Número de orden de compra
@@ -342,172 +275,13 @@ def registrar_error_ean_repetido(oc, ean_repetido, motivo, path_excel):
         path_excel: Ruta del archivo Excel
     """
     try:
-        import os
-        from datetime import datetime
-        
-        # Crear directorio de errores si no existe
-        error_dir = os.path.join(os.getcwd(), "Errores")
-        os.makedirs(error_dir, exist_ok=True)
-        
-        # Crear archivo de error específico para EAN repetido
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        error_file = os.path.join(error_dir, f"error_ean_repetido_{oc}_{timestamp}.txt")
-        
-        with open(error_file, "w", encoding="utf-8") as f:
-            f.write("ERROR DE EAN REPETIDO - OC CANCELADA\n")
-            f.write("=" * 50 + "\n")
-            f.write(f"OC: {oc}\n")
-            f.write(f"Fecha: {datetime.now()}\n")
-            f.write(f"EAN repetido: {ean_repetido}\n")
-            f.write(f"Archivo Excel: {path_excel}\n")
-            f.write(f"Motivo: {motivo}\n")
-            f.write(f"Estado: OC cancelada - flujo cortado\n")
-            f.write("=" * 50 + "\n")
-            f.write("\nEl sistema requiere que los EANs repetidos cumplan con las validaciones.\n")
-            f.write("Esta OC ha sido cancelada debido a problemas con EANs repetidos.\n")
-            f.write("Se procede con la siguiente orden de compra.\n")
-        
-        logger.info(f"📝 Error de EAN repetido registrado en: {error_file}")
+        anotar_error(oc, path_excel, motivo=motivo, ean_repetido=ean_repetido)
+        logger.debug(f"📝 EAN repetido anotado en el diario de errores: {ean_repetido}")
         
     except Exception as e:
         logger.error(f"❌ Error registrando error de EAN repetido para OC {oc}: {e}")
 
 
-def find_best_sap_row_for_ean(grid, ean_to_find, expected_quantity):
-    """
-    Busca la mejor fila de SAP para un EAN específico, considerando cantidad pendiente.
-    
-    Args:
-        grid: Grid de SAP
-        ean_to_find: EAN a buscar
-        expected_quantity: Cantidad esperada del Excel
-        
-    Returns:
-        tuple: (fila_encontrada, cantidad_sap, mensaje) o (None, None, mensaje_error)
-    """
-    try:
-        total_rows = grid.RowCount
-        filas_coincidentes = []
-        
-        # Buscar todas las filas que coincidan con el EAN
-        logger.info(f"🔍 Buscando EAN '{ean_to_find}' en {total_rows} filas de SAP...")
-        for sap_idx in range(total_rows):
-            try:
-                ean_sap = grid.getCellValue(sap_idx, "ZZEAN13").strip()
-                logger.info(f"   - Fila {sap_idx}: EAN SAP='{ean_sap}' vs EAN buscado='{ean_to_find}'")
-                if ean_sap == ean_to_find.strip():
-                    logger.info(f"     ✅ EAN encontrado en fila {sap_idx}")
-                    # Obtener cantidad pendiente de SAP usando el campo correcto
-                    sap_quantity = grid.getCellValue(sap_idx, "CANT_PEND")
-                    sap_quantity_normalized = normalize_sap_number(sap_quantity)
-                    
-                    filas_coincidentes.append({
-                        'fila': sap_idx,
-                        'cantidad_sap': sap_quantity_normalized,
-                        'cantidad_original': sap_quantity
-                    })
-                    
-            except Exception as e:
-                logger.warning(f"Error accediendo a fila SAP {sap_idx}: {e}")
-                continue
-        
-        if not filas_coincidentes:
-            return None, None, f"EAN '{ean_to_find}' no encontrado en ninguna fila de SAP"
-        
-        # Si solo hay una fila, usarla
-        if len(filas_coincidentes) == 1:
-            fila = filas_coincidentes[0]
-            return fila['fila'], fila['cantidad_sap'], f"EAN encontrado en fila {fila['fila']}"
-        
-        # Si hay múltiples filas, buscar la que coincida con la cantidad
-        expected_quantity_str = str(int(expected_quantity))
-        for fila in filas_coincidentes:
-            if fila['cantidad_sap'] == expected_quantity_str:
-                return fila['fila'], fila['cantidad_sap'], f"EAN y cantidad coinciden en fila {fila['fila']}"
-        
-        # Si ninguna coincide con la cantidad, usar la primera y registrar advertencia
-        primera_fila = filas_coincidentes[0]
-        logger.warning(f"⚠️ Múltiples filas para EAN '{ean_to_find}'. Usando primera fila {primera_fila['fila']}")
-        return primera_fila['fila'], primera_fila['cantidad_sap'], f"Múltiples filas encontradas, usando primera"
-        
-    except Exception as e:
-        logger.error(f"Error en find_best_sap_row_for_ean: {e}")
-        return None, None, f"Error interno: {e}"
-
-
-def validar_cantidades_ean_repetido(grid, ean, total_cantidad_excel):
-    """
-    Valida que la suma de cantidades de un EAN repetido no exceda la cantidad solicitada en SAP.
-    
-    Args:
-        grid: Grid de SAP
-        ean: EAN a validar
-        total_cantidad_excel: Suma total de cantidades del Excel para este EAN
-        
-    Returns:
-        tuple: (es_valido, cantidad_sap, mensaje)
-    """
-    try:
-        # Buscar todas las filas de SAP que contengan este EAN
-        filas_sap_ean = []
-        total_rows = grid.RowCount
-        
-        logger.info(f"🔍 Buscando EAN {ean} en {total_rows} filas de SAP")
-        
-        # Debug: Listar columnas disponibles
-        debug_grid_columns(grid)
-        
-        for sap_idx in range(total_rows):
-            try:
-                # Buscar EAN en la columna original
-                ean_sap = grid.getCellValue(sap_idx, "ZZEAN13").strip()
-                
-                if ean_sap == ean.strip():
-                    # Obtener cantidad pendiente de SAP usando el campo correcto
-                    cantidad_sap = grid.getCellValue(sap_idx, "CANT_PEND")
-                    
-                    logger.info(f"📊 Fila {sap_idx}: EAN={ean_sap}, Campo cantidad=0,CANT_PEND, Valor={cantidad_sap}")
-                    
-                    if cantidad_sap:
-                        cantidad_sap_normalizada = normalize_sap_number(cantidad_sap)
-                        filas_sap_ean.append({
-                            'fila': sap_idx,
-                            'cantidad': int(cantidad_sap_normalizada),
-                            'cantidad_original': cantidad_sap,
-                            'columna_cantidad': "CANT_PEND"
-                        })
-                        logger.info(f"✅ EAN {ean} encontrado en fila {sap_idx}, cantidad: {cantidad_sap} -> {cantidad_sap_normalizada}")
-                    else:
-                        logger.warning(f"⚠️ EAN {ean} encontrado en fila {sap_idx} pero cantidad vacía")
-                    
-            except Exception as e:
-                logger.warning(f"Error accediendo a fila SAP {sap_idx}: {e}")
-                continue
-        
-        if not filas_sap_ean:
-            return False, 0, f"EAN {ean} no encontrado en SAP"
-        
-        # Calcular cantidad total solicitada en SAP
-        cantidad_total_sap = sum(fila['cantidad'] for fila in filas_sap_ean)
-        
-        logger.info(f"📊 Validación EAN {ean}:")
-        logger.info(f"  - Cantidad Excel: {total_cantidad_excel}")
-        logger.info(f"  - Cantidad SAP total: {cantidad_total_sap}")
-        logger.info(f"  - Filas SAP encontradas: {len(filas_sap_ean)}")
-        for fila in filas_sap_ean:
-            logger.info(f"    - Fila {fila['fila']}: {fila['cantidad_original']} -> {fila['cantidad']} (col: {fila['columna_cantidad']})")
-        
-        # Validar que la cantidad del Excel no exceda la solicitada
-        if total_cantidad_excel > cantidad_total_sap:
-            return False, cantidad_total_sap, f"Cantidad Excel ({total_cantidad_excel}) excede cantidad SAP ({cantidad_total_sap})"
-        elif total_cantidad_excel == cantidad_total_sap:
-            return True, cantidad_total_sap, f"Cantidades coinciden: Excel={total_cantidad_excel}, SAP={cantidad_total_sap}"
-        else:
-            return True, cantidad_total_sap, f"Cantidad Excel ({total_cantidad_excel}) menor a SAP ({cantidad_total_sap}) - OK"
-            
-    except Exception as e:
-        logger.error(f"Error validando cantidades para EAN {ean}: {e}")
-        return False, 0, f"Error en validación: {e}"
 
 
 def detectar_eans_repetidos_en_excel(df_excel):
@@ -523,22 +297,21 @@ def detectar_eans_repetidos_en_excel(df_excel):
     try:
         eans_repetidos = {}
         
-        # Agrupar por EAN y obtener todas las filas para cada EAN
-        for ean, grupo in df_excel.groupby('EAN'):
-            ean_str = str(ean).strip()
-            if len(grupo) > 1:
-                eans_repetidos[ean_str] = {
-                    'filas': grupo.index.tolist(),
-                    'cantidades': grupo['Cant confirmada'].tolist(),
-                    'lotes': grupo['Lote estuche'].tolist(),
-                    'fechas_vencimiento': grupo['Fecha Vencimiento'].tolist(),
-                    'total_cantidad': grupo['Cant confirmada'].sum()
+        # Agrupar por EAN normalizado (un solo groupby, fechas ya formateadas)
+        for ean, plan_ean in preparar_plan_entrega(df_excel).items():
+            if len(plan_ean.filas_excel) > 1:
+                eans_repetidos[ean] = {
+                    'filas': plan_ean.filas_excel,
+                    'cantidades': plan_ean.cantidades,
+                    'lotes': plan_ean.lotes,
+                    'fechas_vencimiento': plan_ean.vencimientos,
+                    'total_cantidad': plan_ean.total_cantidad
                 }
         
         if eans_repetidos:
             logger.info(f"🔍 EANs repetidos detectados: {list(eans_repetidos.keys())}")
             for ean, info in eans_repetidos.items():
-                logger.info(f"   - EAN {ean}: {len(info['filas'])} filas, total cantidad: {info['total_cantidad']}")
+                logger.debug(f"   - EAN {ean}: {len(info['filas'])} filas, total cantidad: {info['total_cantidad']}")
         
         return eans_repetidos
         
@@ -547,7 +320,7 @@ def detectar_eans_repetidos_en_excel(df_excel):
         return {}
 
 
-def agregar_fila_sap(grid, session, fila_actual):
+def agregar_fila_sap(grid, session, fila_actual, snapshot=None):
     """
     Agrega una nueva fila en el grid de SAP usando el botón de agregar lote.
     
@@ -555,34 +328,32 @@ def agregar_fila_sap(grid, session, fila_actual):
         grid: Grid de SAP
         session: Sesión de SAP
         fila_actual: Índice de la fila actual donde estoy parado
+        snapshot: GridSnapshot a actualizar con la fila insertada (opcional)
         
     Returns:
         tuple: (True, nueva_fila_index) si se agregó exitosamente, (False, None) en caso contrario
     """
     try:
-        logger.info(f"➕ Agregando nueva fila en SAP desde fila actual: {fila_actual}")
+        logger.debug(f"➕ Agregando nueva fila en SAP desde fila actual: {fila_actual}")
         
         # Obtener el número de filas antes de agregar
         filas_antes = grid.RowCount
-        logger.info(f"📊 Filas antes de agregar: {filas_antes}")
+        logger.debug(f"📊 Filas antes de agregar: {filas_antes}")
         
         # Ejecutar el script exacto para agregar fila
-        logger.info(f"🔧 Ejecutando script de agregar fila...")
+        logger.debug(f"🔧 Ejecutando script de agregar fila...")
         try:
-            time.sleep(1)
+            esperar_sesion_libre(session)
             session.findById("wnd[0]/usr/cntlGRID1/shellcont/shell").setCurrentCell( fila_actual,"")
-            logger.info(f"✅ currentCellColumn ejecutado")
+            logger.debug(f"✅ currentCellColumn ejecutado")
             session.findById("wnd[0]/usr/cntlGRID1/shellcont/shell").selectedRows = str(fila_actual)
-            logger.info(f"✅ selectedRows ejecutado")
+            logger.debug(f"✅ selectedRows ejecutado")
             # Verificar si el botón existe antes de presionarlo
             try:
-                time.sleep(1)
                 btn = session.findById("wnd[0]/tbar[1]/btn[7]")
-                logger.info(f"🔍 Botón encontrado: {btn.text if hasattr(btn, 'text') else 'Sin texto'}")
-                time.sleep(1)
+                logger.debug(f"🔍 Botón encontrado: {btn.text if hasattr(btn, 'text') else 'Sin texto'}")
                 btn.press()
-                time.sleep(1)
-                logger.info(f"✅ btn[7] presionado")
+                logger.debug(f"✅ btn[7] presionado")
             except Exception as e:
                 logger.error(f"❌ Error con el botón btn[7]: {e}")
                 # Intentar listar todos los botones disponibles
@@ -602,12 +373,13 @@ def agregar_fila_sap(grid, session, fila_actual):
             return False, None
         
         # Esperar a que se agregue la fila y SAP actualice el grid
-        logger.info(f"⏳ Esperando 3 segundos para que SAP actualice el grid...")
-        time.sleep(3)
+        logger.debug(f"⏳ Esperando a que SAP actualice el grid...")
+        esperar_sesion_libre(session)
+        esperar_filas(grid, filas_antes)
         
         # Obtener el número de filas después de agregar
         filas_despues = grid.RowCount
-        logger.info(f"📊 Filas después de agregar: {filas_despues}")
+        logger.debug(f"📊 Filas después de agregar: {filas_despues}")
         
         # Verificar si el grid se actualizó
         if filas_despues == filas_antes:
@@ -623,7 +395,10 @@ def agregar_fila_sap(grid, session, fila_actual):
         if filas_despues > filas_antes:
             # La nueva fila siempre será la siguiente a la fila actual
             nueva_fila_index = fila_actual + 1
-            logger.info(f"✅ Nueva fila agregada exitosamente. Índice de nueva fila: {nueva_fila_index}")
+            if snapshot is not None:
+                # Desplazar el índice en memoria en lugar de releer el grid
+                snapshot.registrar_insercion(fila_actual)
+            logger.debug(f"✅ Nueva fila agregada exitosamente. Índice de nueva fila: {nueva_fila_index}")
             return True, nueva_fila_index
         else:
             logger.error(f"❌ No se detectó incremento en el número de filas")
@@ -634,111 +409,8 @@ def agregar_fila_sap(grid, session, fila_actual):
         return False, None
 
 
-def procesar_ean_repetido(grid, session, ean, filas_excel, cantidades, lotes, fechas_vencimiento):
-    """
-    Procesa un EAN que aparece en múltiples filas del Excel.
-    
-    Args:
-        grid: Grid de SAP
-        session: Sesión de SAP
-        ean: EAN a procesar
-        filas_excel: Lista de índices de filas del Excel
-        cantidades: Lista de cantidades confirmadas
-        lotes: Lista de lotes de estuche
-        fechas_vencimiento: Lista de fechas de vencimiento
-        
-    Returns:
-        bool: True si se procesó exitosamente, False en caso contrario
-    """
-    try:
-        logger.info(f"🔄 Procesando EAN repetido: {ean}")
-        logger.info(f"   - Filas Excel: {filas_excel}")
-        logger.info(f"   - Cantidades: {cantidades}")
-        logger.info(f"   - Lotes: {lotes}")
-        
-        # Validar cantidades antes de procesar
-        total_cantidad_excel = sum(cantidades)
-        es_valido, cantidad_sap, mensaje_validacion = validar_cantidades_ean_repetido(grid, ean, total_cantidad_excel)
-        
-        if not es_valido:
-            logger.error(f"❌ Validación de cantidades falló para EAN {ean}: {mensaje_validacion}")
-            return False
-        
-        logger.info(f"✅ Validación de cantidades exitosa: {mensaje_validacion}")
-        
-        # Buscar la fila original en SAP para este EAN
-        fila_sap_original, cantidad_sap, mensaje = find_best_sap_row_for_ean(
-            grid, ean, cantidades[0]  # Usar la primera cantidad como referencia
-        )
-        
-        if fila_sap_original is None:
-            logger.error(f"❌ No se encontró fila SAP para EAN {ean}")
-            return False
-        
-        logger.info(f"📝 Fila SAP original encontrada: {fila_sap_original}")
-        
-        # Procesar la primera fila del Excel en la fila original de SAP
-        try:
-            logger.info(f"📝 Cargando primera fila del Excel en fila SAP {fila_sap_original}")
-            grid.modifyCell(fila_sap_original, "CANTIDAD", str(int(cantidades[0])))
-            time.sleep(0.5)
-            grid.modifyCell(fila_sap_original, "CHARG", str(lotes[0]))
-            time.sleep(0.5)
-            fecha_venc = pd.to_datetime(fechas_vencimiento[0]).strftime("%d.%m.%Y")
-            grid.modifyCell(fila_sap_original, "VENCIMIENTO", fecha_venc)
-            time.sleep(0.5)
-            logger.info(f"✅ Primera fila procesada exitosamente")
-            
-        except Exception as e:
-            logger.error(f"❌ Error procesando primera fila: {e}")
-            return False
-        
-        # Procesar las filas adicionales del Excel
-        for i in range(1, len(filas_excel)):
-            try:
-                logger.info(f"📝 Procesando fila adicional {i+1} del Excel")
-                
-                # Agregar nueva fila en SAP
-                logger.info(f"🔍 Estado del grid antes de agregar fila para EAN {ean}: {grid.RowCount} filas")
-                exito, nueva_fila_sap = agregar_fila_sap(grid, session, fila_sap_original)
-                if not exito:
-                    logger.error(f"❌ No se pudo agregar fila adicional para EAN {ean}")
-                    return False
-                
-                logger.info(f"📝 Nueva fila SAP creada: {nueva_fila_sap}")
-                logger.info(f"🔍 Estado del grid después de agregar fila para EAN {ean}: {grid.RowCount} filas")
-                
-                # Verificar la cantidad que viene por defecto en la nueva fila
-                try:
-                    cantidad_por_defecto = grid.getCellValue(nueva_fila_sap, "CANT_PEND")
-                    logger.info(f"📊 Nueva fila {nueva_fila_sap}: cantidad por defecto = {cantidad_por_defecto}")
-                except Exception as e:
-                    logger.warning(f"⚠️ No se pudo leer cantidad por defecto: {e}")
-                
-                # Cargar datos en la nueva fila
-                grid.modifyCell(nueva_fila_sap, "CANTIDAD", str(int(cantidades[i])))
-                time.sleep(0.5)
-                grid.modifyCell(nueva_fila_sap, "CHARG", str(lotes[i]))
-                time.sleep(0.5)
-                fecha_venc = pd.to_datetime(fechas_vencimiento[i]).strftime("%d.%m.%Y")
-                grid.modifyCell(nueva_fila_sap, "VENCIMIENTO", fecha_venc)
-                time.sleep(0.5)
-                
-                logger.info(f"✅ Fila adicional {i+1} procesada exitosamente")
-                
-            except Exception as e:
-                logger.error(f"❌ Error procesando fila adicional {i+1}: {e}")
-                return False
-        
-        logger.info(f"✅ EAN repetido {ean} procesado completamente")
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ Error procesando EAN repetido {ean}: {e}")
-        return False
-
 
-def validar_eans_excel_en_sap(grid, df_excel, oc):
+def validar_eans_excel_en_sap(grid, df_excel, oc, snapshot=None):
     """
     Valida que todos los EANs del Excel existan en el grid de SAP antes del procesamiento.
 
@@ -746,42 +418,35 @@ def validar_eans_excel_en_sap(grid, df_excel, oc):
         grid: Grid de SAP
         df_excel: DataFrame del Excel
         oc: Número de orden de compra
+        snapshot: GridSnapshot compartido (opcional)
         
     Returns:
         tuple: (todos_encontrados, eans_faltantes, mensaje)
     """
     try:
-        total_rows_sap = grid.RowCount
+        snapshot = asegurar_snapshot(grid, snapshot)
         eans_excel = set()
-        eans_sap = set()
         eans_faltantes = []
 
-        # Obtener todos los EANs del Excel
-        logger.info(f"🔍 Leyendo EANs del Excel...")
-        for _, row in df_excel.iterrows():
-            ean_excel = str(row.get('EAN', '')).strip()
-            if ean_excel:
-                eans_excel.add(ean_excel)
-                logger.info(f"   - Excel: EAN='{ean_excel}'")
+        # Obtener todos los EANs del Excel (normalizados de una vez sobre la columna)
+        logger.debug(f"🔍 Leyendo EANs del Excel...")
+        if 'EAN' in df_excel.columns:
+            for ean_excel in df_excel['EAN'].map(normalizar_ean).unique():
+                if ean_excel:
+                    eans_excel.add(ean_excel)
+                    logger.debug(f"   - Excel: EAN='{ean_excel}'")
 
         # Obtener todos los EANs de SAP
-        for sap_idx in range(total_rows_sap):
-            try:
-                ean_sap = grid.getCellValue(sap_idx, "ZZEAN13").strip()
-                if ean_sap:
-                    eans_sap.add(ean_sap)
-            except Exception as e:
-                logger.warning(f"Error accediendo a fila SAP {sap_idx}: {e}")
-                continue
+        eans_sap = snapshot.eans()
         
         # Verificar qué EANs del Excel no están en SAP
-        logger.info(f"🔍 Comparando EANs del Excel con SAP...")
+        logger.debug(f"🔍 Comparando EANs del Excel con SAP...")
         for ean_excel in eans_excel:
-            logger.info(f"   - Verificando EAN Excel '{ean_excel}' en SAP...")
+            logger.debug(f"   - Verificando EAN Excel '{ean_excel}' en SAP...")
             if ean_excel in eans_sap:
-                logger.info(f"     ✅ EAN '{ean_excel}' encontrado en SAP")
+                logger.debug(f"     ✅ EAN '{ean_excel}' encontrado en SAP")
             else:
-                logger.info(f"     ❌ EAN '{ean_excel}' NO encontrado en SAP")
+                logger.debug(f"     ❌ EAN '{ean_excel}' NO encontrado en SAP")
                 eans_faltantes.append(ean_excel)
         
         todos_encontrados = len(eans_faltantes) == 0
@@ -804,148 +469,95 @@ def validar_eans_excel_en_sap(grid, df_excel, oc):
         return False, [], f"Error en validación: {e}"
 
 
-def buscar_ean_en_sap_desde_fila(grid, ean_buscar, fila_inicio):
+
+
+def reanudar_entrega(avance, path_excel, oc):
     """
-    Busca un EAN en SAP desde una fila específica hacia adelante.
+    Continúa un archivo que quedó a medio procesar según su último estado guardado.
     
     Args:
-        grid: Grid de SAP
-        ean_buscar: EAN a buscar
-        fila_inicio: Fila desde donde empezar a buscar
+        avance: AvanceEntrega del archivo
+        path_excel: Ruta del archivo Excel
+        oc: Número de orden de compra
         
     Returns:
-        int: Índice de la fila donde se encontró el EAN, o None si no se encontró
+        bool: True si el archivo quedó resuelto (no hay que correr el flujo de SAP)
     """
-    try:
-        total_filas = grid.RowCount
-        logger.info(f"🔍 Buscando EAN '{ean_buscar}' desde fila {fila_inicio} hasta {total_filas-1}")
-        
-        for fila in range(fila_inicio, total_filas):
-            try:
-                ean_sap = grid.getCellValue(fila, "ZZEAN13").strip()
-                if ean_sap == ean_buscar.strip():
-                    logger.info(f"✅ EAN '{ean_buscar}' encontrado en fila {fila}")
-                    return fila
-            except Exception as e:
-                logger.warning(f"⚠️ Error accediendo a fila {fila}: {e}")
-                continue
-        
-        logger.warning(f"❌ EAN '{ean_buscar}' no encontrado desde fila {fila_inicio}")
-        return None
-        
-    except Exception as e:
-        logger.error(f"❌ Error buscando EAN '{ean_buscar}': {e}")
-        return None
+    reanudacion = avance.reanudacion()
+    if reanudacion is None:
+        return False
+    anterior = avance.anterior
+    
+    if reanudacion == REANUDAR_ETIQUETA:
+        # La entrega ya existe en SAP: nunca se vuelve a cargar
+        avance.completar(anterior["estado"], remito=anterior["remito"])
+        logger.info(f"♻️ OC {oc}: entrega ya generada (remito {avance.remito}), no se vuelve a cargar; "
+                    f"solo se recolecta la etiqueta")
+        if cerrar_entrega_generada(avance, path_excel, oc):
+            anotar_total(resultado="reanudada")
+        return True
+    
+    if reanudacion == REANUDAR_INCIERTO:
+        error_msg = (f"Estado incierto: el procesamiento se cortó generando el remito {anterior['remito']}; "
+                     f"verificar en SAP si la entrega se creó antes de reprocesar")
+        logger.error(f"❌ {error_msg}")
+        if os.path.exists(path_excel):
+            mover_archivo_a_errores(path_excel, oc, error_msg)
+        avance.terminar()
+        return True
+    
+    logger.info(f"♻️ OC {oc}: se retoma desde el Excel (último estado guardado: {anterior['estado'] or 'ninguno'}); "
+                f"la carga en pantalla de SAP no sobrevive al reinicio")
+    return False
 
 
-def procesar_ean_secuencial_simple(grid, session, ean, filas_excel, cantidades, lotes, fechas_vencimiento):
+def cerrar_entrega_generada(avance, path_excel, oc):
     """
-    Procesa un EAN de forma secuencial usando búsqueda desde fila 0.
+    Cierra una entrega que ya existe en SAP (retomada o cortada después de generar el remito).
+    
+    Espera el PDF en el recolector, que también encuentra el que ya estaba en la
+    carpeta, y recién con la etiqueta recolectada marca la huella como procesada
+    y borra el estado. Si la impresión estaba confirmada (estado ETIQUETA) y el
+    PDF no apareció, el estado queda guardado y en el próximo ciclo solo se
+    vuelve a buscar la etiqueta, hasta MAXIMO_ESPERAS_ETIQUETA veces. Si se
+    cortó antes de confirmar la impresión puede no haber PDF: queda anotada para
+    reimprimir a mano.
     
     Args:
-        grid: Grid de SAP
-        session: Sesión de SAP
-        ean: EAN a procesar
-        filas_excel: Lista de índices de filas del Excel
-        cantidades: Lista de cantidades confirmadas
-        lotes: Lista de lotes de estuche
-        fechas_vencimiento: Lista de fechas de vencimiento
+        avance: AvanceEntrega de la entrega (ya generada)
+        path_excel: Ruta del archivo Excel
+        oc: Número de orden de compra
         
     Returns:
-        bool: True si se procesó exitosamente, False en caso contrario
+        bool: True si la entrega quedó cerrada (huella ok y estado borrado)
     """
-    try:
-        logger.info(f"🔄 Procesando EAN secuencial simple: {ean}")
-        logger.info(f"   - Filas Excel: {filas_excel}")
-        logger.info(f"   - Cantidades: {cantidades}")
-        logger.info(f"   - Lotes: {lotes}")
-        
-        # Si solo hay una fila, procesar normalmente
-        if len(filas_excel) == 1:
-            logger.info(f"📝 EAN {ean} tiene solo una fila, procesando normalmente")
-            return True
-        
-        # Si hay múltiples filas, validar cantidades primero
-        total_cantidad_excel = sum(cantidades)
-        es_valido, cantidad_sap, mensaje_validacion = validar_cantidades_ean_repetido(grid, ean, total_cantidad_excel)
-        
-        if not es_valido:
-            logger.error(f"❌ Validación de cantidades falló para EAN {ean}: {mensaje_validacion}")
-            return False
-        
-        logger.info(f"✅ Validación de cantidades exitosa: {mensaje_validacion}")
-        
-        # Buscar la primera fila de SAP para este EAN
-        fila_sap_actual = buscar_ean_en_sap_desde_fila(grid, ean, 0)
-        
-        if fila_sap_actual is None:
-            logger.error(f"❌ No se encontró fila SAP para EAN {ean}")
-            return False
-        
-        logger.info(f"📝 Primera fila SAP encontrada: {fila_sap_actual}")
-        
-        # Procesar la primera fila del Excel en la fila original de SAP
-        try:
-            logger.info(f"📝 Cargando primera fila del Excel en fila SAP {fila_sap_actual}")
-            grid.modifyCell(fila_sap_actual, "CANTIDAD", str(int(cantidades[0])))
-            time.sleep(0.5)
-            grid.modifyCell(fila_sap_actual, "CHARG", str(lotes[0]))
-            time.sleep(0.5)
-            fecha_venc = pd.to_datetime(fechas_vencimiento[0]).strftime("%d.%m.%Y")
-            grid.modifyCell(fila_sap_actual, "VENCIMIENTO", fecha_venc)
-            time.sleep(0.5)
-            logger.info(f"✅ Primera fila procesada exitosamente")
-            
-        except Exception as e:
-            logger.error(f"❌ Error procesando primera fila: {e}")
+    remito = avance.remito
+    recolector = obtener_recolector()
+    recolector.encargar(remito, oc=oc)
+    # El recolector resuelve cada remito a más tardar en espera_maxima; el doble es solo un resguardo
+    if recolector.esperar(remito, recolector.espera_maxima * 2):
+        motivo = None
+    elif avance.estado != ETIQUETA:
+        motivo = f"Etiqueta pendiente del remito {remito}: se cortó antes de imprimir"
+    else:
+        intentos = avance.anterior["intentos"] + 1 if avance.anterior else 1
+        if intentos < MAXIMO_ESPERAS_ETIQUETA:
+            logger.warning(f"⚠️ OC {oc}: no apareció el PDF de la etiqueta {remito}; el estado queda guardado "
+                           f"y se vuelve a buscar en el próximo ciclo ({intentos}/{MAXIMO_ESPERAS_ETIQUETA})")
             return False
-        
-        # Procesar las filas adicionales del Excel (lotes adicionales)
-        for i in range(1, len(filas_excel)):
-            try:
-                logger.info(f"📝 Procesando lote adicional {i+1} del Excel para EAN {ean}")
-                
-                # Agregar nueva fila en SAP
-                logger.info(f"🔍 Estado del grid antes de agregar fila para EAN {ean}: {grid.RowCount} filas")
-                exito, nueva_fila_sap = agregar_fila_sap(grid, session, fila_sap_actual)
-                if not exito:
-                    logger.error(f"❌ No se pudo agregar fila adicional para EAN {ean}")
-                    return False
-                
-                logger.info(f"📝 Nueva fila SAP creada: {nueva_fila_sap}")
-                logger.info(f"🔍 Estado del grid después de agregar fila para EAN {ean}: {grid.RowCount} filas")
-                
-                # Verificar la cantidad que viene por defecto en la nueva fila
-                try:
-                    cantidad_por_defecto = grid.getCellValue(nueva_fila_sap, "CANT_PEND")
-                    logger.info(f"📊 Nueva fila {nueva_fila_sap}: cantidad por defecto = {cantidad_por_defecto}")
-                except Exception as e:
-                    logger.warning(f"⚠️ No se pudo leer cantidad por defecto: {e}")
-                
-                # Cargar datos en la nueva fila
-                grid.modifyCell(nueva_fila_sap, "CANTIDAD", str(int(cantidades[i])))
-                time.sleep(0.5)
-                grid.modifyCell(nueva_fila_sap, "CHARG", str(lotes[i]))
-                time.sleep(0.5)
-                fecha_venc = pd.to_datetime(fechas_vencimiento[i]).strftime("%d.%m.%Y")
-                grid.modifyCell(nueva_fila_sap, "VENCIMIENTO", fecha_venc)
-                time.sleep(0.5)
-                
-                logger.info(f"✅ Lote adicional {i+1} procesado exitosamente")
-                
-            except Exception as e:
-                logger.error(f"❌ Error procesando lote adicional {i+1}: {e}")
-                return False
-        
-        logger.info(f"✅ EAN {ean} procesado completamente con {len(filas_excel)} lotes")
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ Error procesando EAN secuencial simple {ean}: {e}")
-        return False
+        motivo = f"Etiqueta pendiente del remito {remito}: no apareció el PDF en {intentos} intentos"
+    if motivo is not None:
+        logger.warning(f"⚠️ OC {oc}: reimprimir la etiqueta del remito {remito} desde SAP")
+        anotar_error(oc, path_excel, motivo=motivo)
+    registrar_resultado(path_excel, RESULTADO_OK, oc=oc, huella=avance.huella)
+    quitar_reintento(avance.huella)
+    avance.terminar()
+    return True
 
 
-def process_entrega(session, path_excel, oc):
+@cronometrar("process_entrega", session="session", oc="oc", archivo="path_excel")
+@registrar_intento(oc="oc", archivo="path_excel")
+def process_entrega(session, path_excel, oc, datos_maestros=None, huella=None):
     """
     Procesa un Excel y carga dinámicamente los datos en SAP GUI.
     Implementa validación exhaustiva de EAN: busca cada EAN del Excel en todas las filas de SAP
@@ -955,20 +567,42 @@ def process_entrega(session, path_excel, oc):
     - Si cualquier error ocurre durante el procesamiento, el archivo se mueve a carpeta de errores
     - Se registra el error en un archivo de log específico
     - Se continúa con la siguiente orden de compra
+    
+    Args:
+        session: Sesión SAP
+        path_excel: Ruta del archivo Excel de la entrega
+        oc: Número de orden de compra
+        datos_maestros: DatosMaestrosOC del prefetch (opcional). Si la OC no está, se consulta la base.
+        huella: Huella de contenido ya calculada por bot_runner (opcional, ver huellas.py)
+    
+    Cada etapa (lectura, navegación, escaneo del grid, inserciones, escritura,
+    popup de remito, PDF) queda registrada en el log de tiempos (ver tiempos.py)
+    y cada llamada deja un registro en el diario de errores (ver diario_errores.py).
     """
-    import pandas as pd
-    import time
-    from utils import consultarCadenaFrio
-    import logging
     import traceback
-    logger = logging.getLogger(__name__)
+    avance = None
 
     try:
         logger.info(f"🚀 Iniciando procesamiento de OC {oc} - Archivo: {path_excel}")
         
-        # 1. Leer Excel y filtrar filas válidas
-        df = pd.read_excel(path_excel)
-        df = df[df['Fecha Vencimiento'].notna()]
+        # 1. Leer Excel (solo las columnas usadas, ya tipadas y sin filas sin vencimiento)
+        etapa("lectura_excel")
+        try:
+            df = leer_entrega_excel(path_excel)
+        except ValueError as e:
+            error_msg = f"Excel de entrega inválido: {e}"
+            logger.error(error_msg)
+            if os.path.exists(path_excel):
+                exito = mover_archivo_a_errores(path_excel, oc, error_msg)
+                if exito:
+                    logger.info(f"✅ Archivo movido exitosamente a errores")
+                else:
+                    logger.error(f"❌ Error moviendo archivo a errores")
+            else:
+                logger.warning(f"⚠️ Archivo no encontrado para mover a errores: {path_excel}")
+            return
+        anotar(filas=len(df))
+        anotar_total(filas=len(df))
         if df.empty:
             error_msg = f"El archivo {path_excel} no contiene filas válidas."
             logger.error(error_msg)
@@ -982,6 +616,13 @@ def process_entrega(session, path_excel, oc):
                 logger.warning(f"⚠️ Archivo no encontrado para mover a errores: {path_excel}")
             return
 
+        # Punto de control: si el archivo quedó a medio procesar, seguir desde el último estado seguro
+        huella = huella or huella_dataframe(df, path_excel, oc)
+        avance = AvanceEntrega(huella, path_excel, oc)
+        if reanudar_entrega(avance, path_excel, oc):
+            return
+        avance.completar(PARSEADO)
+
         # 2. Extraer remito
         row = df.iloc[0]
         remito_completo = row['Remito y Nro. Entrega']
@@ -1028,33 +669,51 @@ def process_entrega(session, path_excel, oc):
             return
 
         # 3. Navegar a la transacción SAP
+        etapa("navegacion_sap")
         session.findById("wnd[0]/tbar[0]/okcd").text = "/nZMM_RECEP_DOCU"
         session.findById("wnd[0]").sendVKey(0)
-        time.sleep(1)
+        esperar_sesion_libre(session)
 
         # Cargar OC en SAP
         session.findById("wnd[0]/usr/ctxtSO_EBELN-LOW").text = oc
         session.findById("wnd[0]/usr/ctxtSO_EBELN-LOW").caretPosition = len(oc)
         session.findById("wnd[0]/tbar[1]/btn[8]").press()
-        time.sleep(1)
+        esperar_sesion_libre(session)
         session.findById("wnd[0]/tbar[1]/btn[20]").press()
-        time.sleep(1)
+        esperar_sesion_libre(session)
+        avance.completar(NAVEGADO)
 
         # 4. Consultar cadena de frio
+        etapa("datos_maestros")
         try:
-            frio = consultarCadenaFrio(oc)
+            if datos_maestros is not None and oc in datos_maestros:
+                frio = datos_maestros.es_cadena_frio(oc)
+            else:
+                frio = consultarCadenaFrio(oc)
         except Exception as e:
             logger.warning(f"No se pudo consultar cadena de frio: {e}")
             frio = False
 
         # 5. VALIDACIÓN EXHAUSTIVA DE EAN Y CARGA DE DATOS
+        etapa("escaneo_grid")
         grid = session.findById("wnd[0]/usr/cntlGRID1/shellcont/shell")
-        total_rows_sap = grid.RowCount
+        # Un único snapshot del grid para todas las búsquedas de esta pantalla
+        snapshot = GridSnapshot(grid)
+        total_rows_sap = snapshot.RowCount
+        anotar(filas=total_rows_sap)
         logger.info(f"📊 Grid SAP tiene {total_rows_sap} filas")
         
+        # Sin posiciones la OC todavía no se liberó o no llegó a SAP: se reintenta más tarde (ver reintentos.py)
+        if total_rows_sap == 0:
+            error_msg = f"OC sin posiciones pendientes en SAP: {oc}"
+            logger.error(f"❌ {error_msg}")
+            if os.path.exists(path_excel):
+                mover_archivo_a_errores(path_excel, oc, error_msg)
+            return
+        
         # VALIDACIÓN PREVIA: Verificar que todos los EANs del Excel existan en SAP
         logger.info(f"🔍 Iniciando validación previa de EANs para OC {oc}")
-        todos_encontrados, eans_faltantes, mensaje_validacion = validar_eans_excel_en_sap(grid, df, oc)
+        todos_encontrados, eans_faltantes, mensaje_validacion = validar_eans_excel_en_sap(grid, df, oc, snapshot)
         
         if not todos_encontrados:
             logger.error(f"❌ {mensaje_validacion}")
@@ -1077,106 +736,38 @@ def process_entrega(session, path_excel, oc):
         
         logger.info(f"✅ {mensaje_validacion}")
         
-        # Contadores para logging
-        eans_encontrados = 0
-        eans_no_encontrados = 0
-        filas_procesadas = 0
-        eans_con_error = []
+        # Conciliación de todas las líneas contra el grid en una sola pasada (ver conciliacion.py):
+        # fila de origen de cada EAN, sobre-entregas y fila final de cada línea
+        etapa("conciliacion")
+        conciliacion = conciliar_entrega(snapshot, df)
+        eans_encontrados = len(conciliacion.totales)
+        filas_procesadas = len(conciliacion.plan.asignaciones) if conciliacion.plan is not None else 0
         
-        # Procesar cada EAN del Excel secuencialmente
-        eans_procesados = set()  # Para evitar procesar el mismo EAN múltiples veces
-        
-        for excel_idx, excel_row in df.iterrows():
-            ean_excel = str(excel_row.get('EAN', '')).strip()
-            logger.info(f"🔍 Procesando fila Excel {excel_idx}: EAN='{ean_excel}'")
-            
-            # Evitar procesar el mismo EAN múltiples veces
-            if ean_excel in eans_procesados:
-                logger.info(f"⏭️ EAN {ean_excel} ya procesado, saltando...")
-                continue
-            
-            # Verificar si este EAN tiene filas adicionales (es repetido)
-            filas_mismo_ean = df[df['EAN'].astype(str).str.strip() == ean_excel.strip()]
-            
-            logger.info(f"🔍 EAN '{ean_excel}' encontrado en {len(filas_mismo_ean)} filas del Excel")
-            
-            if len(filas_mismo_ean) > 1:
-                # EAN repetido en Excel - procesar múltiples lotes
-                logger.info(f"🔄 EAN repetido detectado: {ean_excel} con {len(filas_mismo_ean)} lotes en Excel")
-                
-                # Preparar datos para procesamiento secuencial
-                filas_excel = filas_mismo_ean.index.tolist()
-                cantidades = filas_mismo_ean['Cant confirmada'].tolist()
-                lotes = filas_mismo_ean['Lote estuche'].tolist()
-                fechas_vencimiento = filas_mismo_ean['Fecha Vencimiento'].tolist()
-                
-                # Procesar EAN repetido usando búsqueda secuencial
-                if procesar_ean_secuencial_simple(grid, session, ean_excel, filas_excel, cantidades, lotes, fechas_vencimiento):
-                    logger.info(f"✅ EAN repetido {ean_excel} procesado con éxito.")
-                    eans_encontrados += 1
-                    filas_procesadas += len(filas_mismo_ean)
-                    eans_procesados.add(ean_excel)
-                else:
-                    logger.error(f"❌ Error procesando EAN repetido {ean_excel}.")
-                    eans_con_error.append(ean_excel)
-                    registrar_error_ean_repetido(oc, ean_excel, "Error en procesamiento de EAN repetido", path_excel)
-                
-            else:
-                # EAN individual en Excel - procesar normalmente
-                logger.info(f"📝 EAN individual detectado: {ean_excel}")
-                cantidad_confirmada = str(int(excel_row['Cant confirmada']))
-                lote_estuche = excel_row['Lote estuche']
-                fecha_vencimiento = pd.to_datetime(excel_row['Fecha Vencimiento'], dayfirst=True).strftime("%d.%m.%Y")
-                
-                # Buscar este EAN en SAP desde fila 0
-                fila_sap_encontrada = buscar_ean_en_sap_desde_fila(grid, ean_excel, 0)
-                
-                if fila_sap_encontrada is None:
-                    logger.error(f"❌ EAN '{ean_excel}' no encontrado en SAP")
-                    eans_no_encontrados += 1
-                    eans_con_error.append(ean_excel)
-                    continue
-                
-                # Cargar datos en la fila encontrada
-                try:
-                    logger.info(f"📝 Cargando datos en fila SAP {fila_sap_encontrada}")
-                    grid.modifyCell(fila_sap_encontrada, "CANTIDAD", cantidad_confirmada)
-                    time.sleep(0.5)
-                    grid.modifyCell(fila_sap_encontrada, "CHARG", lote_estuche)
-                    time.sleep(0.5)
-                    grid.modifyCell(fila_sap_encontrada, "VENCIMIENTO", fecha_vencimiento)
-                    time.sleep(0.5)
-                    filas_procesadas += 1
-                    eans_encontrados += 1
-                    logger.info(f"✅ Datos cargados exitosamente en fila SAP {fila_sap_encontrada}")
-                    eans_procesados.add(ean_excel)
-                    
-                except Exception as e:
-                    logger.error(f"❌ Error cargando datos en fila SAP {fila_sap_encontrada}: {e}")
-                    continue
-        
-        logger.info(f"🔍 Bucle de procesamiento completado. Total filas Excel: {len(df)}")
-        logger.info(f"🔍 EANs procesados: {eans_procesados}")
+        logger.info(f"🔍 Conciliación completada. Total filas Excel: {len(df)}")
         
         # Resumen del procesamiento
         logger.info(f"📊 RESUMEN PROCESAMIENTO:")
         logger.info(f"   - EANs encontrados: {eans_encontrados}")
-        logger.info(f"   - EANs no encontrados: {eans_no_encontrados}")
         logger.info(f"   - Filas procesadas: {filas_procesadas}")
         
-        # Si hay EANs no encontrados, registrar error y abortar
-        if eans_con_error:
-            logger.error(f"❌ OC {oc} tiene EANs no encontrados: {eans_con_error}")
-            for ean_error in eans_con_error:
-                registrar_error_ean_no_encontrado(oc, ean_error, path_excel)
-            logger.error(f"❌ Abortando procesamiento de OC {oc} debido a EANs no encontrados")
+        # Los EANs faltantes ya los rechazó validar_eans_excel_en_sap con este mismo snapshot:
+        # los conflictos que quedan son EANs repetidos cuya suma excede lo pendiente
+        if conciliacion.conflictos:
+            eans_excedidos = []
+            for conflicto in conciliacion.conflictos:
+                eans_excedidos.append(conflicto.ean)
+                mensaje_validacion = (f"Cantidad Excel ({conflicto.cantidad_excel}) excede cantidad SAP "
+                                      f"({conflicto.cantidad_sap})")
+                logger.error(f"❌ Validación de cantidades falló para EAN {conflicto.ean}: {mensaje_validacion}")
+                registrar_error_ean_repetido(oc, conflicto.ean, mensaje_validacion, path_excel)
+            logger.error(f"❌ Abortando procesamiento de OC {oc}: cantidades que exceden lo pendiente en {eans_excedidos}")
             
-            # Mover archivo a errores por EANs no encontrados
-            error_msg = f"EANs no encontrados en SAP: {eans_con_error}"
+            # Mover archivo a errores por cantidades excedidas
+            error_msg = f"Cantidades del Excel exceden lo pendiente en SAP: {eans_excedidos}"
             if os.path.exists(path_excel):
                 exito = mover_archivo_a_errores(path_excel, oc, error_msg)
                 if exito:
-                    logger.info(f"✅ Archivo movido exitosamente a errores por EANs no encontrados")
+                    logger.info(f"✅ Archivo movido exitosamente a errores por cantidades excedidas")
                 else:
                     logger.error(f"❌ Error moviendo archivo a errores")
             else:
@@ -1199,9 +790,61 @@ def process_entrega(session, path_excel, oc):
                 logger.warning(f"⚠️ Archivo no encontrado para mover a errores: {path_excel}")
             return
         
+        # Agregar todas las filas de lote de abajo hacia arriba, así las filas de arriba no se corren
+        etapa("inserciones")
+        plan_filas = conciliacion.plan
+        anotar(filas=plan_filas.filas_agregadas)
+        if plan_filas.filas_agregadas:
+            logger.info(f"➕ Agregando {plan_filas.filas_agregadas} filas de lote para {len(plan_filas.inserciones)} EANs repetidos")
+            exito, insercion_fallida = ejecutar_inserciones(
+                plan_filas.inserciones,
+                lambda fila: agregar_fila_sap(grid, session, fila, snapshot)[0],
+            )
+            if not exito:
+                registrar_error_ean_repetido(oc, insercion_fallida.ean, "No se pudo agregar fila de lote", path_excel)
+                raise RuntimeError(f"No se pudieron agregar las filas de lote del EAN {insercion_fallida.ean}")
+            
+            # Confirmar contra el grid que cada línea cae en una fila de su EAN
+            desalineadas = verificar_asignaciones(
+                plan_filas.asignaciones, lambda fila: normalizar_ean(grid.getCellValue(fila, "ZZEAN13"))
+            )
+            if desalineadas:
+                raise RuntimeError(f"Filas del grid desalineadas tras insertar lotes: {[(a.fila, a.ean) for a in desalineadas]}")
+        
+        # Cargar todas las líneas en una sola pasada
+        etapa("escritura_grid", filas=len(plan_filas.asignaciones))
+        escritor = EscritorGrid(grid, session)
+        for asignacion in plan_filas.asignaciones:
+            escritor.agregar_linea(asignacion.fila, asignacion.cantidad, asignacion.lote, asignacion.vencimiento, asignacion.ean)
+        
+        # Escribir todas las celdas en lote y verificar que SAP las tomó
+        resultado_escritura = escritor.aplicar()
+        if resultado_escritura.fallidas:
+            distintas = [f for f in resultado_escritura.fallidas if f.leido is not None]
+            if distintas:
+                # SAP tomó la celda pero muestra otro valor (lo corrigió o recortó): reintentar daría lo mismo
+                celdas = [f"fila {f.fila} {f.columna}='{f.esperado}' muestra '{f.leido}' (EAN {f.etiqueta})" for f in distintas]
+                error_msg = f"SAP muestra otro valor en {len(celdas)} celdas escritas: {celdas}"
+            else:
+                celdas = [f"fila {f.fila} {f.columna}='{f.esperado}' (EAN {f.etiqueta})" for f in resultado_escritura.fallidas]
+                error_msg = f"SAP no reflejó {len(celdas)} celdas escritas: {celdas}"
+            logger.error(f"❌ {error_msg}")
+            if os.path.exists(path_excel):
+                exito = mover_archivo_a_errores(path_excel, oc, error_msg)
+                if exito:
+                    logger.info(f"✅ Archivo movido exitosamente a errores por celdas no confirmadas")
+                else:
+                    logger.error(f"❌ Error moviendo archivo a errores")
+            else:
+                logger.warning(f"⚠️ Archivo no encontrado para mover a errores: {path_excel}")
+            return
+        avance.completar(GRID_CARGADO)
+        
         # Presionar Enter para confirmar cambios
         grid.pressEnter()
-        time.sleep(1)
+        snapshot.invalidar()
+        esperar_sesion_libre(session)
+        avance.completar(CONFIRMADO)
         
     except Exception as e:
         logger.critical(f"Error al cargar datos en la grilla SAP: {e}")
@@ -1220,46 +863,68 @@ def process_entrega(session, path_excel, oc):
 
     # 6. Completar datos de remito y bultos
     try:
+        etapa("popup_remito")
         session.findById("wnd[0]/tbar[1]/btn[21]").press()
+        esperar_sesion_libre(session)
         session.findById("wnd[1]/usr/txtGV_0100_REMITO1").text = remito1
-        time.sleep(0.5)
         session.findById("wnd[1]/usr/txtGV_0100_REMITO2").text = remito2
-        time.sleep(0.5)
         
         try:
             session.findById("wnd[1]/usr/txtGV_0100_BULTOS_FRIO").text = "1"
-            time.sleep(0.5)
         except Exception:
             logger.info("No hay campo BULTOS_SECO")
         try:
             session.findById("wnd[1]/usr/txtGV_0100_BULTOS_SECO").text = "1"
-            time.sleep(0.5)
         except Exception:
             logger.info("No hay campo BULTOS_FRIO")
 
         session.findById("wnd[1]/usr/txtGV_0100_FACTURA1").setFocus()
         session.findById("wnd[1]/usr/txtGV_0100_FACTURA1").caretPosition = 0
-        time.sleep(0.5)
+        remito = f"R{remito1+remito2}"
+        # Desde acá la entrega puede quedar creada en SAP: se guarda antes de generar
+        avance.iniciar(POPUP_REMITO, remito=remito)
         session.findById("wnd[1]/usr/btnBOT_GENERAR").press()
+        esperar_sesion_libre(session)
         session.findById("wnd[1]/tbar[0]/btn[0]").press()
-        time.sleep(1)
-        remito = f"R{remito1+remito2}"
+        esperar_sesion_libre(session)
+        avance.completar(POPUP_REMITO)
         session.findById("wnd[1]/usr/txtSSFPP-TDCOVTITLE").text = remito
         session.findById("wnd[1]/tbar[0]/btn[86]").press()
+        avance.completar(ETIQUETA)
         logger.info(f"✅ Entrega creada en SAP para OC {oc}")
         
-        # Esperar un poco para que se genere el PDF completamente
-        time.sleep(3)
-        
-        # Renombrar el archivo PDF de la etiqueta
-        logger.info(f"🔄 Iniciando renombrado de PDF para OC {oc}")
-        # Buscar en la carpeta de Downloads donde SAP guarda los PDFs
-        carpeta_pdfs = r"C:\Users\recepcion1\Documents\Etiquetas Entregas Entrantes Farmanet"
-        renombrar_pdf_etiqueta(remito, carpeta_pdfs)
-        
+        # El PDF de la etiqueta se espera y renombra en segundo plano (ver etiquetas_pdf.py)
+        etapa("etiqueta_pdf")
+        obtener_recolector().encargar(remito, oc=oc)
+        logger.info(f"🏷️ Etiqueta {remito} encargada al recolector de PDF")
+        
+        # Recordar la huella para no volver a cargar esta misma entrega
+        registrar_resultado(path_excel, RESULTADO_OK, oc=oc, huella=huella)
+        quitar_reintento(huella)
+        avance.terminar()
+        anotar_ok()
+        anotar_total(resultado="ok")
         logger.info(f"✅ Procesamiento completado exitosamente para OC {oc}")
         
     except Exception as e:
+        # La entrega ya existe en SAP: no se mueve a errores (reprocesarla la duplicaría)
+        if avance is not None and avance.generada:
+            logger.error(f"❌ Error después de generar la entrega de OC {oc} (remito {avance.remito}): {e}")
+            logger.warning(f"⚠️ La entrega ya está en SAP; revisar la etiqueta del remito {avance.remito}")
+            anotar_error(oc, path_excel, motivo=f"Etiqueta pendiente del remito {avance.remito}: {e}")
+            cerrar_entrega_generada(avance, path_excel, oc)
+            return
+
+        # Error con BOT_GENERAR ya presionado: SAP pudo crear la entrega y reintentarla la duplicaría
+        if avance is not None and avance.en_curso == POPUP_REMITO:
+            error_msg = (f"Estado incierto: error generando el remito {avance.remito} de OC {oc} ({e}); "
+                         f"verificar en SAP si la entrega se creó antes de reprocesar")
+            logger.critical(f"❌ {error_msg}")
+            if os.path.exists(path_excel):
+                mover_archivo_a_errores(path_excel, oc, error_msg)
+            avance.terminar()
+            return
+
         # MANEJO DE ERRORES GLOBAL - Cualquier error no capturado
         error_msg = f"Error crítico en procesamiento de SAP para OC {oc}: {str(e)}"
         logger.critical(error_msg)
@@ -1283,7 +948,7 @@ def process_entrega(session, path_excel, oc):
 
 def crear_resumen_eans_repetidos(oc, eans_repetidos_excel, path_excel):
     """
-    Crea un archivo de resumen detallado del procesamiento de EANs repetidos.
+    Agrega el resumen del procesamiento de EANs repetidos al registro del intento en el diario.
     
     Args:
         oc: Número de orden de compra
@@ -1291,40 +956,15 @@ def crear_resumen_eans_repetidos(oc, eans_repetidos_excel, path_excel):
         path_excel: Ruta del archivo Excel
     """
     try:
-        import os
-        from datetime import datetime
-        
-        # Crear directorio de resúmenes si no existe
-        resumen_dir = os.path.join(os.getcwd(), "Resumenes")
-        os.makedirs(resumen_dir, exist_ok=True)
-        
-        # Crear archivo de resumen
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        resumen_file = os.path.join(resumen_dir, f"resumen_eans_repetidos_{oc}_{timestamp}.txt")
-        
-        with open(resumen_file, "w", encoding="utf-8") as f:
-            f.write("RESUMEN DE EANs REPETIDOS PROCESADOS\n")
-            f.write("=" * 50 + "\n")
-            f.write(f"OC: {oc}\n")
-            f.write(f"Fecha: {datetime.now()}\n")
-            f.write(f"Archivo Excel: {path_excel}\n")
-            f.write(f"Total EANs repetidos: {len(eans_repetidos_excel)}\n")
-            f.write("=" * 50 + "\n\n")
-            
-            for ean, info in eans_repetidos_excel.items():
-                f.write(f"EAN: {ean}\n")
-                f.write(f"  - Filas Excel: {info['filas']}\n")
-                f.write(f"  - Cantidades: {info['cantidades']}\n")
-                f.write(f"  - Lotes: {info['lotes']}\n")
-                f.write(f"  - Total cantidad: {info['total_cantidad']}\n")
-                f.write(f"  - Fechas vencimiento: {[pd.to_datetime(fecha).strftime('%d.%m.%Y') for fecha in info['fechas_vencimiento']]}\n")
-                f.write("\n")
-            
-            f.write("=" * 50 + "\n")
-            f.write("PROCESAMIENTO COMPLETADO EXITOSAMENTE\n")
-            f.write("Todos los EANs repetidos fueron procesados correctamente.\n")
-        
-        logger.info(f"📋 Resumen de EANs repetidos creado en: {resumen_file}")
+        intento = intento_actual()
+        if intento is None:
+            logger.debug(f"Resumen de EANs repetidos de OC {oc} fuera de process_entrega, no se registra")
+            return
+        intento.resumen_repetidos = {
+            str(ean): {clave: info.get(clave) for clave in ("filas", "cantidades", "lotes", "total_cantidad", "fechas_vencimiento")}
+            for ean, info in eans_repetidos_excel.items()
+        }
+        logger.info(f"📋 Resumen de {len(eans_repetidos_excel)} EANs repetidos agregado al diario ({path_excel})")
         
     except Exception as e:
         logger.error(f"❌ Error creando resumen de EANs repetidos para OC {oc}: {e}")
@@ -1334,13 +974,15 @@ def mover_archivo_a_errores(path_excel, oc, error_descripcion):
     """
     Mueve un archivo Excel a la carpeta de errores para evitar reprocesamiento.
     Una OC puede tener múltiples entregas, por lo que movemos específicamente
-    el archivo de la entrega que falló.
+    el archivo de la entrega que falló. Si la falla puede salir bien más tarde
+    (ver reintentos.py) el archivo va a Errores/Reintentos y se agenda.
     
     Args:
         path_excel: Ruta del archivo Excel
         oc: Número de orden de compra
         error_descripcion: Descripción del error que causó el fallo
     """
+    anotar_total(resultado="error")
     try:
         # Crear directorio de errores si no existe
         error_dir = os.path.join(os.getcwd(), "Errores")
@@ -1369,6 +1011,38 @@ def mover_archivo_a_errores(path_excel, oc, error_descripcion):
         logger.info(f"🔍 Archivo encontrado, procediendo a mover: {path_excel}")
         logger.info(f"📂 Destino: {ruta_destino}")
         
+        # Hash del contenido para el registro de errores (antes de mover)
+        try:
+            hash_contenido = hash_archivo(path_excel)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo calcular el hash de {path_excel}: {e}")
+            hash_contenido = ""
+        
+        # Huella del contenido con el motivo (para no reintentar lo que va a fallar igual);
+        # el archivo sale del flujo, así que se olvida su punto de control
+        huella = registrar_resultado(path_excel, RESULTADO_ERROR, error_descripcion, oc=oc)
+        if huella:
+            try:
+                obtener_registro_estados().borrar(huella)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo borrar el estado guardado de {path_excel}: {e}")
+
+        # Fallas que pueden salir bien más tarde (SAP, datos maestros demorados) van a la cola de reintentos
+        try:
+            reintento = obtener_cola_reintentos().programar(path_excel, oc, error_descripcion, huella)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo agendar el reintento de {path_excel}: {e}")
+            reintento = None
+        if reintento is not None:
+            proximo = datetime.fromtimestamp(reintento.proximo)
+            anotar_error(oc, path_excel, motivo=error_descripcion, destino=reintento.ruta, reintento={
+                "clase": reintento.clase, "intento": reintento.intentos,
+                "proximo": proximo.isoformat(timespec="seconds"),
+            })
+            logger.info(f"🔁 Falla {reintento.clase}: reintento {reintento.intentos} de {nombre_archivo} "
+                        f"a las {proximo:%H:%M:%S} ({reintento.ruta})")
+            return True
+
         # Mover el archivo
         try:
             shutil.move(path_excel, ruta_destino)
@@ -1385,25 +1059,21 @@ def mover_archivo_a_errores(path_excel, oc, error_descripcion):
             logger.error(f"❌ Error moviendo archivo: {e}")
             return False
         
-        # Crear archivo de log del error con información específica de la entrega
-        log_error_file = os.path.join(no_procesados_dir, f"error_procesamiento_{oc}_{timestamp}.txt")
-        
-        with open(log_error_file, "w", encoding="utf-8") as f:
-            f.write("ERROR EN PROCESAMIENTO DE SAP - ENTREGA NO PROCESADA\n")
-            f.write("=" * 60 + "\n")
-            f.write(f"OC: {oc}\n")
-            f.write(f"Archivo Original: {nombre_archivo}\n")
-            f.write(f"Fecha Error: {datetime.now()}\n")
-            f.write(f"Archivo Movido a: {ruta_destino}\n")
-            f.write(f"Error: {error_descripcion}\n")
-            f.write("=" * 60 + "\n")
-            f.write("\nESTA ENTREGA ESPECÍFICA HA SIDO MOVIDA A ERRORES.\n")
-            f.write("No se volverá a procesar automáticamente.\n")
-            f.write("Revisar manualmente antes de reprocesar.\n")
-            f.write("Se continúa con la siguiente entrega/OC.\n")
+        # Un registro por intento en el diario de errores (los .txt son una vista opcional)
+        anotar_error(oc, path_excel, motivo=error_descripcion, destino=ruta_destino)
+        
+        # Registrar en el índice de errores (OC, entrega, hash)
+        try:
+            intentos = obtener_registro_errores().registrar(
+                nombre_archivo, error_descripcion, oc=oc, hash_contenido=hash_contenido,
+                ruta_destino=ruta_destino, ruta_log=diario_errores.ruta,
+            )
+            logger.info(f"🗂️ Error registrado (intento {intentos} de esta entrega)")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo registrar el error en el registro de errores: {e}")
         
         logger.info(f"📁 Archivo movido a errores: {ruta_destino}")
-        logger.info(f"📝 Log de error creado: {log_error_file}")
+        logger.info(f"📝 Error anotado en el diario: {diario_errores.ruta}")
         logger.info(f"🔄 Esta entrega específica no se reprocesará automáticamente")
         
         return True
@@ -1413,10 +1083,36 @@ def mover_archivo_a_errores(path_excel, oc, error_descripcion):
         return False
 
 
+@cronometrar("rechazo_previo", oc="oc", archivo="path_excel")
+@registrar_intento(oc="oc", archivo="path_excel")
+def rechazar_entrega_prevalidada(path_excel, oc, prevalidacion):
+    """
+    Manda a errores (o a reintentos) una entrega que no pasó la validación previa en base, sin tocar SAP.
+
+    Args:
+        path_excel: Ruta del archivo Excel
+        oc: Número de orden de compra
+        prevalidacion: Prevalidacion con el motivo y los EANs con problemas (ver prevalidacion.py)
+
+    Returns:
+        bool: True si el archivo se movió
+    """
+    logger.error(f"❌ OC {oc} rechazada antes de abrir SAP: {prevalidacion.motivo}")
+    for ean_faltante in prevalidacion.eans_faltantes:
+        registrar_error_ean_no_encontrado(oc, ean_faltante, path_excel)
+    for ean_excedido, (cantidad_excel, cantidad_oc) in prevalidacion.eans_excedidos.items():
+        registrar_error_ean_repetido(
+            oc, ean_excedido, f"Cantidad Excel ({cantidad_excel}) excede cantidad de la OC ({cantidad_oc})", path_excel
+        )
+    return mover_archivo_a_errores(path_excel, oc, prevalidacion.motivo)
+
+
 def verificar_archivo_en_errores(nombre_archivo):
     """
     Verifica si un archivo ya está en la carpeta de errores para evitar reprocesamiento.
     
+    Consulta el registro indexado de errores en lugar de recorrer Errores/No_Procesados.
+    
     Args:
         nombre_archivo: Nombre del archivo a verificar
         
@@ -1424,20 +1120,9 @@ def verificar_archivo_en_errores(nombre_archivo):
         bool: True si el archivo está en errores, False en caso contrario
     """
     try:
-        # Buscar en la carpeta de errores
-        error_dir = os.path.join(os.getcwd(), "Errores", "No_Procesados")
-        
-        if not os.path.exists(error_dir):
-            return False
-        
-        # Buscar archivos que contengan el nombre base del archivo
-        nombre_base = os.path.splitext(nombre_archivo)[0]
-        
-        for archivo in os.listdir(error_dir):
-            if archivo.startswith(nombre_base) and archivo.endswith('.xlsx'):
-                logger.info(f"⚠️ Archivo ya está en errores: {archivo}")
-                return True
-        
+        if obtener_registro_errores().contiene_archivo(nombre_archivo):
+            logger.info(f"⚠️ Archivo ya está en errores: {nombre_archivo}")
+            return True
         return False
         
     except Exception as e:
@@ -1446,16 +1131,17 @@ def verificar_archivo_en_errores(nombre_archivo):
 
 
 def cerrar_sap(sesionsap):
-    SapGuiAuto = win32com.client.GetObject('SAPGUI')
-    if not type(SapGuiAuto) == win32com.client.CDispatch:
+    backend = obtener_backend()
+    SapGuiAuto = backend.obtener_sapgui()
+    if not backend.es_objeto(SapGuiAuto):
         return
     application = SapGuiAuto.GetScriptingEngine
 
     connection = application.Children(0)
-    if not type(connection) == win32com.client.CDispatch:
+    if not backend.es_objeto(connection):
         return
     session = connection.Children(sesionsap)
-    if not type(session) == win32com.client.CDispatch:
+    if not backend.es_objeto(session):
         return
     try:
         session.findById("wnd[0]/tbar[0]/okcd").text = "/nex"
@@ -1465,75 +1151,30 @@ def cerrar_sap(sesionsap):
         pass
 
 
-def renombrar_pdf_etiqueta(remito, carpeta):
+def renombrar_pdf_etiqueta(remito, carpeta=None, timeout=None):
     """
-    Busca un archivo PDF que contenga el remito en la carpeta especificada y lo renombra.
+    Espera el PDF que contiene el remito y lo renombra a ``<remito>.pdf``.
+    
+    Versión sincrónica del recolector de etiquetas (``process_entrega`` solo lo
+    encarga y sigue); sirve para renombrar a mano una etiqueta puntual.
     
     Args:
         remito: String del remito a buscar (ej: "R011402180514")
-        carpeta: Ruta de la carpeta donde buscar
+        carpeta: Ruta de la carpeta de etiquetas (por defecto CARPETA_ETIQUETAS)
+        timeout: Segundos máximos de espera (por defecto la espera del recolector)
         
     Returns:
         bool: True si se renombró exitosamente, False en caso contrario
     """
     try:
-        import os
-        import glob
-        import shutil
-        from datetime import datetime
-        
-        logger.info(f"🔍 Buscando PDF con remito '{remito}' en carpeta: {carpeta}")
-        
-        # Verificar que la carpeta existe
-        if not os.path.exists(carpeta):
-            logger.warning(f"⚠️ Carpeta no encontrada: {carpeta}")
-            return False
-        
-        # Buscar archivos PDF en la carpeta
-        patron_pdf = os.path.join(carpeta, "*.pdf")
-        archivos_pdf = glob.glob(patron_pdf)
-        
-        if not archivos_pdf:
-            logger.warning(f"⚠️ No se encontraron archivos PDF en la carpeta: {carpeta}")
-            return False
-        
-        # Buscar archivo que contenga el remito
-        archivo_encontrado = None
-        for archivo in archivos_pdf:
-            nombre_archivo = os.path.basename(archivo)
-            if remito in nombre_archivo:
-                archivo_encontrado = archivo
-                logger.info(f"✅ Archivo encontrado: {nombre_archivo}")
-                break
-        
-        if not archivo_encontrado:
-            logger.info(f"ℹ️ No se encontró archivo que contenga el remito '{remito}'")
-            return False
-        
-        # Generar nuevo nombre con solo el remito
-        extension = os.path.splitext(archivo_encontrado)[1]
-        nuevo_nombre = f"{remito}{extension}"
-        ruta_destino = os.path.join(carpeta, nuevo_nombre)
-        
-        # Verificar si el archivo de destino ya existe
-        if os.path.exists(ruta_destino):
-            logger.warning(f"⚠️ El archivo de destino ya existe: {nuevo_nombre}")
-            return False
-        
+        propio = carpeta is not None and os.path.abspath(carpeta) != os.path.abspath(CARPETA_ETIQUETAS)
+        recolector = RecolectorEtiquetas(carpeta) if propio else obtener_recolector()
+        recolector.encargar(remito)
         try:
-            # Renombrar el archivo
-            os.rename(archivo_encontrado, ruta_destino)
-            
-            logger.info(f"✅ Archivo renombrado exitosamente:")
-            logger.info(f"   - Original: {os.path.basename(archivo_encontrado)}")
-            logger.info(f"   - Nuevo: {nuevo_nombre}")
-            logger.info(f"   - Remito: {remito}")
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Error renombrando archivo: {e}")
-            return False
+            return recolector.esperar(remito, timeout)
+        finally:
+            if propio:
+                recolector.detener()
             
     except Exception as e:
         logger.error(f"❌ Error en renombrar_pdf_etiqueta: {e}")
@@ -0,0 +1,146 @@
+"""
+Gestor de una sesión SAP autenticada que se mantiene viva entre ciclos del scheduler.
+
+Antes cada ciclo lanzaba saplogon.exe, esperaba el scripting (hasta 10x2 s),
+hacía login y al final cerraba todo. El gestor reutiliza la sesión abierta,
+envía una transacción liviana como keep-alive y solo vuelve a hacer login
+cuando la sesión murió o expiró.
+"""
+
+import time
+import logging
+
+from abrirsap import ingresarsap, iniciar_sesion_en
+
+logger = logging.getLogger(__name__)
+
+# Segundos sin actividad tras los que se envía el keep-alive
+INTERVALO_KEEPALIVE = 240
+# Programa de la pantalla de login de SAP
+PROGRAMA_LOGIN = "SAPMSYST"
+
+
+def sesion_activa(session):
+    """
+    Verifica si una sesión SAP sigue viva y autenticada.
+
+    Una sesión expirada o desconectada vuelve a la pantalla de login (programa
+    SAPMSYST, sin usuario) o lanza una excepción COM al acceder a ``Info``.
+    """
+    if session is None:
+        return False
+    try:
+        info = session.Info
+        if not info.User:
+            return False
+        if info.Program == PROGRAMA_LOGIN:
+            return False
+        return True
+    except Exception as e:
+        logger.info(f"ℹ️ Sesión SAP no disponible: {e}")
+        return False
+
+
+def en_pantalla_login(session):
+    """True si la sesión existe pero está en la pantalla de login."""
+    try:
+        return session is not None and session.Info.Program == PROGRAMA_LOGIN
+    except Exception:
+        return False
+
+
+class GestorSesionSAP:
+    """
+    Mantiene una sesión SAP autenticada entre ciclos del scheduler.
+
+    Args:
+        ambiente: Ambiente SAP (QAS/PRD)
+        usuario: Usuario SAP
+        clave: Clave SAP
+        obtener_sesion: Función () -> sesión SAP ya abierta o None (por defecto sap.get_sap_session)
+        login: Función (ambiente, usuario, clave) que abre SAP GUI y hace login (por defecto ingresarsap)
+        intervalo_keepalive: Segundos sin actividad tras los que se envía el keep-alive
+        reloj: Función de tiempo monotónico (inyectable para pruebas)
+    """
+
+    def __init__(self, ambiente, usuario, clave, obtener_sesion=None, login=ingresarsap,
+                 intervalo_keepalive=INTERVALO_KEEPALIVE, reloj=time.monotonic):
+        self.ambiente = ambiente
+        self.usuario = usuario
+        self.clave = clave
+        self._obtener_sesion = obtener_sesion
+        self._login = login
+        self.intervalo_keepalive = intervalo_keepalive
+        self.reloj = reloj
+        self.session = None
+        self._ultima_actividad = 0.0
+        self.logins = 0
+
+    def _sesion_abierta(self):
+        if self._obtener_sesion is None:
+            from sap import get_sap_session
+            return get_sap_session()
+        return self._obtener_sesion()
+
+    def obtener_sesion(self):
+        """
+        Devuelve una sesión autenticada, reutilizando la actual si sigue viva.
+
+        Returns:
+            Sesión SAP o None si no se pudo autenticar
+        """
+        if sesion_activa(self.session):
+            self.registrar_actividad()
+            return self.session
+
+        # SAP GUI puede seguir abierto de un ciclo o proceso anterior
+        session = self._sesion_abierta()
+        if sesion_activa(session):
+            logger.info("♻️ Reutilizando sesión SAP ya autenticada")
+        elif en_pantalla_login(session):
+            logger.info("🔑 Sesión SAP en pantalla de login, reingresando credenciales")
+            iniciar_sesion_en(session, self.usuario, self.clave)
+            self.logins += 1
+        else:
+            logger.info("🔧 Abriendo SAP GUI...")
+            self._login(self.ambiente, self.usuario, self.clave)
+            self.logins += 1
+            session = self._sesion_abierta()
+
+        if not sesion_activa(session):
+            logger.error("❌ No se pudo obtener una sesión SAP autenticada")
+            self.session = None
+            return None
+
+        self.session = session
+        self.registrar_actividad()
+        return session
+
+    def registrar_actividad(self):
+        self._ultima_actividad = self.reloj()
+
+    def keepalive(self):
+        """
+        Envía una transacción liviana si la sesión estuvo inactiva más de ``intervalo_keepalive``.
+
+        Returns:
+            bool: True si la sesión sigue viva
+        """
+        if self.session is None:
+            return False
+        if self.reloj() - self._ultima_actividad < self.intervalo_keepalive:
+            return True
+        if not sesion_activa(self.session):
+            logger.warning("⚠️ La sesión SAP expiró, se volverá a ingresar en el próximo ciclo")
+            self.session = None
+            return False
+        try:
+            self.session.findById("wnd[0]/tbar[0]/okcd").text = "/n"
+            self.session.findById("wnd[0]").sendVKey(0)
+            self.registrar_actividad()
+            logger.info("💓 Keep-alive enviado a SAP")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Error enviando keep-alive a SAP: {e}")
+            self.session = None
+            return False
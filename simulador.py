@@ -0,0 +1,569 @@
+"""
+Simulador en memoria del scripting de SAP GUI para ZMM_RECEP_DOCU.
+
+Permite correr sap.py sin SAP (Linux, CI, benchmarks) registrando un
+``backend_sap.BackendSimulado(SapGuiSimulado(...))``. Reproduce la jerarquía
+SAPGUI -> motor de scripting -> conexiones -> sesiones, la pantalla de login,
+la transacción ZMM_RECEP_DOCU (selección por OC con btn[8], grid de
+posiciones, partición de lote con btn[7]) y los popups de remito (btn[21])
+e impresión de la etiqueta (btn[86]).
+
+Cada llamada COM simulada se cuenta, se puede registrar en una
+``TrazaLlamadas`` y puede tener una latencia propia (``latencias``, bloqueante,
+como el viaje entre procesos). Además ``latencia`` hace que los cambios tarden
+en verse y que ``Busy`` quede en True mientras tanto, igual que en SAP GUI.
+Con ``fallas`` un botón falla una vez después de hacer su efecto, como un
+timeout de COM cuando SAP ya procesó el clic, y con ``formatos`` el grid
+devuelve lo escrito con el formato del usuario SAP.
+"""
+
+import os
+import time
+from collections import Counter, namedtuple
+
+ID_GRID = "wnd[0]/usr/cntlGRID1/shellcont/shell"
+ID_VENTANA = "wnd[0]"
+ID_OKCODE = "wnd[0]/tbar[0]/okcd"
+ID_USUARIO = "wnd[0]/usr/txtRSYST-BNAME"
+ID_CLAVE = "wnd[0]/usr/pwdRSYST-BCODE"
+ID_CAMPO_OC = "wnd[0]/usr/ctxtSO_EBELN-LOW"
+ID_BOTON_EJECUTAR = "wnd[0]/tbar[1]/btn[8]"
+ID_BOTON_AGREGAR_LOTE = "wnd[0]/tbar[1]/btn[7]"
+ID_BOTON_REMITO = "wnd[0]/tbar[1]/btn[21]"
+ID_BOTON_GENERAR = "wnd[1]/usr/btnBOT_GENERAR"
+ID_BOTON_CONFIRMAR_POPUP = "wnd[1]/tbar[0]/btn[0]"
+ID_TITULO_IMPRESION = "wnd[1]/usr/txtSSFPP-TDCOVTITLE"
+ID_BOTON_IMPRIMIR = "wnd[1]/tbar[0]/btn[86]"
+
+TRANSACCION = "ZMM_RECEP_DOCU"
+PROGRAMA_LOGIN = "SAPMSYST"
+
+# Columnas del grid de posiciones de la OC
+COLUMNAS_GRID = ("ZZEAN13", "MATNR", "CANT_PEND", "CANTIDAD", "CHARG", "VENCIMIENTO")
+# Columnas que se limpian en la fila nueva creada por btn[7]
+COLUMNAS_EDITABLES = ("CANTIDAD", "CHARG", "VENCIMIENTO")
+
+# Controles de cada popup (wnd[1]); fuera de su popup findById falla como en SAP GUI
+CONTROLES_POPUP = {
+    "remito": {
+        "wnd[1]", "wnd[1]/usr/txtGV_0100_REMITO1", "wnd[1]/usr/txtGV_0100_REMITO2",
+        "wnd[1]/usr/txtGV_0100_BULTOS_FRIO", "wnd[1]/usr/txtGV_0100_BULTOS_SECO",
+        "wnd[1]/usr/txtGV_0100_FACTURA1", ID_BOTON_GENERAR,
+    },
+    "mensaje": {"wnd[1]", ID_BOTON_CONFIRMAR_POPUP},
+    "impresion": {"wnd[1]", ID_TITULO_IMPRESION, ID_BOTON_IMPRIMIR},
+}
+
+LlamadaSAP = namedtuple("LlamadaSAP", ["instante", "objeto", "metodo", "argumentos"])
+
+
+class TrazaLlamadas:
+    """Registro ordenado de todas las llamadas COM simuladas."""
+
+    def __init__(self, reloj=time.monotonic):
+        self.reloj = reloj
+        self.llamadas = []
+
+    def registrar(self, objeto, metodo, argumentos=()):
+        self.llamadas.append(LlamadaSAP(self.reloj(), objeto, metodo, tuple(argumentos)))
+
+    def contar(self):
+        """Cantidad de llamadas por método."""
+        return Counter(llamada.metodo for llamada in self.llamadas)
+
+    def reiniciar(self):
+        self.llamadas = []
+
+    def __len__(self):
+        return len(self.llamadas)
+
+    def __iter__(self):
+        return iter(self.llamadas)
+
+
+class EntornoSimulado:
+    """
+    Configuración compartida por todos los objetos de un SAP GUI simulado.
+
+    Args:
+        ordenes: {oc: [filas del grid]} que carga btn[8] (ver ``generar_orden``). Con None el
+            grid no se recarga al navegar (sesiones armadas sobre un FakeGrid ya cargado)
+        latencia: Segundos que tardan en verse los cambios (Busy queda en True mientras tanto)
+        latencias: {método: segundos} de latencia bloqueante por llamada; "*" es el valor por defecto
+        traza: TrazaLlamadas donde registrar cada llamada (opcional)
+        reloj: Función de tiempo monotónico
+        dormir: Función de espera (inyectable para pruebas)
+        carpeta_etiquetas: Carpeta donde btn[86] deja el PDF de la etiqueta (opcional)
+        fallas: {id del botón: excepción} que press() lanza una sola vez, después de hacer su efecto
+        formatos: {columna: función(valor) -> str} con que el grid guarda lo escrito con
+            ``modifyCell``, como SAP al aplicar el formato del usuario ("10" -> "10,000")
+    """
+
+    def __init__(self, ordenes=None, latencia=0.0, latencias=None, traza=None, reloj=time.monotonic,
+                 dormir=time.sleep, carpeta_etiquetas=None, fallas=None, formatos=None):
+        self.ordenes = ordenes
+        self.latencia = latencia
+        self.latencias = dict(latencias or {})
+        self.traza = traza
+        self.reloj = reloj
+        self.dormir = dormir
+        self.carpeta_etiquetas = carpeta_etiquetas
+        self.fallas = dict(fallas or {})
+        self.formatos = dict(formatos or {})
+
+    def llamada(self, contador, objeto, metodo, argumentos=()):
+        """Cuenta, registra y demora una llamada COM simulada."""
+        contador[metodo] += 1
+        if self.traza is not None:
+            self.traza.registrar(objeto, metodo, argumentos)
+        demora = self.latencias.get(metodo, self.latencias.get("*", 0.0))
+        if demora > 0:
+            self.dormir(demora)
+
+
+def generar_orden(eans, cantidad_pendiente=100):
+    """Filas del grid de una OC con una posición por EAN."""
+    return [
+        {
+            "ZZEAN13": str(ean),
+            "MATNR": f"{10000000 + posicion}",
+            "CANT_PEND": str(cantidad_pendiente),
+            "CANTIDAD": "",
+            "CHARG": "",
+            "VENCIMIENTO": "",
+        }
+        for posicion, ean in enumerate(eans)
+    ]
+
+
+class FakeGrid:
+    """
+    Grid en memoria con la misma interfaz que el GuiGridView de SAP.
+
+    Args:
+        filas: Lista de diccionarios {columna: valor}, una entrada por fila del grid.
+        columnas: Columnas válidas. Si no se indican, se toman de las filas.
+        latencia: Segundos que tarda en verse un cambio (modifyCell, inserción).
+        reloj: Función de tiempo monotónico (inyectable para pruebas).
+        rechazar: Función (fila, columna, valor) -> bool. Si devuelve True el
+            ``modifyCell`` se ignora sin error, como cuando SAP descarta un valor inválido.
+        entorno: EntornoSimulado compartido (traza y latencia por llamada)
+    """
+
+    def __init__(self, filas=None, columnas=None, latencia=0.0, reloj=time.monotonic, rechazar=None, entorno=None):
+        self.entorno = entorno if entorno is not None else EntornoSimulado(latencia=latencia, reloj=reloj)
+        self.filas = []
+        self.columnas = list(columnas) if columnas is not None else []
+        self.latencia = latencia
+        self.reloj = reloj
+        self.rechazar = rechazar
+        self.llamadas = Counter()
+        self.current_cell = None
+        self._selected_rows = ""
+        self._pendientes = []
+        self.cargar(filas or [], columnas)
+
+    def cargar(self, filas, columnas=None):
+        """Reemplaza el contenido del grid (lo que hace btn[8] al seleccionar una OC)."""
+        self.filas = [dict(fila) for fila in filas]
+        if columnas is None and not self.columnas:
+            for fila in self.filas:
+                for columna in fila:
+                    if columna not in self.columnas:
+                        self.columnas.append(columna)
+        self._pendientes = []
+        self._selected_rows = ""
+
+    @property
+    def total_llamadas(self):
+        return sum(self.llamadas.values())
+
+    def reiniciar_contadores(self):
+        self.llamadas.clear()
+
+    def _llamada(self, metodo, *argumentos):
+        self.entorno.llamada(self.llamadas, ID_GRID, metodo, argumentos)
+
+    # --- Latencia -------------------------------------------------------------------------
+
+    def _programar(self, accion):
+        """Ejecuta la acción ahora o, si hay latencia, cuando venza."""
+        if self.latencia <= 0:
+            accion()
+        else:
+            self._pendientes.append((self.reloj() + self.latencia, accion))
+
+    def _aplicar_pendientes(self):
+        if not self._pendientes:
+            return
+        ahora = self.reloj()
+        vencidas = [accion for vence, accion in self._pendientes if vence <= ahora]
+        self._pendientes = [(vence, accion) for vence, accion in self._pendientes if vence > ahora]
+        for accion in vencidas:
+            accion()
+
+    @property
+    def ocupado(self):
+        """True mientras queden cambios sin aplicar."""
+        self._aplicar_pendientes()
+        return bool(self._pendientes)
+
+    # --- Interfaz GuiGridView -------------------------------------------------------------
+
+    @property
+    def RowCount(self):
+        self._llamada("RowCount")
+        self._aplicar_pendientes()
+        return len(self.filas)
+
+    def _validar_celda(self, fila, columna):
+        if columna not in self.columnas:
+            raise Exception(f"Columna desconocida: {columna}")
+        if not 0 <= fila < len(self.filas):
+            raise Exception(f"Fila fuera de rango: {fila}")
+
+    def getCellValue(self, fila, columna):
+        self._llamada("getCellValue", fila, columna)
+        self._aplicar_pendientes()
+        self._validar_celda(fila, columna)
+        return self.filas[fila].get(columna, "")
+
+    def modifyCell(self, fila, columna, valor):
+        self._llamada("modifyCell", fila, columna, valor)
+        self._aplicar_pendientes()
+        self._validar_celda(fila, columna)
+
+        formato = self.entorno.formatos.get(columna, str)
+
+        def aplicar():
+            self.filas[fila][columna] = formato(valor)
+
+        if self.rechazar is not None and self.rechazar(fila, columna, valor):
+            return
+        self._programar(aplicar)
+
+    def setCurrentCell(self, fila, columna):
+        self._llamada("setCurrentCell", fila, columna)
+        self.current_cell = (fila, columna)
+
+    @property
+    def selectedRows(self):
+        self._llamada("selectedRows")
+        return self._selected_rows
+
+    @selectedRows.setter
+    def selectedRows(self, valor):
+        self._llamada("selectedRows", valor)
+        self._selected_rows = str(valor)
+
+    def pressEnter(self):
+        self._llamada("pressEnter")
+
+    # --- Operaciones de la transacción ----------------------------------------------------
+
+    def insertar_fila(self, despues_de):
+        """
+        Inserta una fila de lote después de ``despues_de`` copiando EAN y datos de la
+        posición y dejando vacías las columnas editables (lo que hace btn[7]).
+
+        La fila nueva es una partición de la misma posición: la cantidad pendiente
+        sigue en la fila de origen y la nueva muestra CANT_PEND vacío, así nada
+        que la lea después de la inserción cuenta dos veces lo pendiente.
+        """
+        def aplicar():
+            nueva = dict(self.filas[despues_de])
+            for columna in COLUMNAS_EDITABLES + ("CANT_PEND",):
+                if columna in nueva:
+                    nueva[columna] = ""
+            self.filas.insert(despues_de + 1, nueva)
+
+        self._programar(aplicar)
+
+
+class ControlSimulado:
+    """Control genérico (campo de texto, botón, ventana) devuelto por ``findById``."""
+
+    def __init__(self, sesion, id_control):
+        self.sesion = sesion
+        self.id = id_control
+        self._text = ""
+        self.caretPosition = 0
+
+    @property
+    def text(self):
+        self.sesion._llamada("text", self.id)
+        return self._text
+
+    @text.setter
+    def text(self, valor):
+        self.sesion._llamada("text=", self.id, valor)
+        self._text = str(valor)
+
+    def press(self):
+        self.sesion._llamada("press", self.id)
+        self.sesion.registrar_accion("press", self.id)
+        self.sesion._presionar(self.id)
+        falla = self.sesion.entorno.fallas.pop(self.id, None)
+        if falla is not None:
+            raise falla
+
+    def sendVKey(self, tecla):
+        self.sesion._llamada("sendVKey", self.id, tecla)
+        self.sesion.registrar_accion("sendVKey", self.id)
+        self.sesion._tecla(self.id, tecla)
+
+    def setFocus(self):
+        self.sesion._llamada("setFocus", self.id)
+        self.sesion.registrar_accion("setFocus", self.id)
+
+
+class InfoSesion:
+    """Equivalente a GuiSessionInfo."""
+
+    def __init__(self, sesion):
+        self._sesion = sesion
+
+    @property
+    def User(self):
+        return self._sesion.usuario
+
+    @property
+    def Program(self):
+        return self._sesion.programa
+
+    @property
+    def Transaction(self):
+        return self._sesion.transaccion
+
+    @property
+    def ScreenName(self):
+        return self._sesion.pantalla
+
+    @property
+    def SystemName(self):
+        return "SIM"
+
+
+class ColeccionSimulada(list):
+    """Colección COM (Children): ``Count`` y acceso por índice con ``coleccion(i)``."""
+
+    @property
+    def Count(self):
+        return len(self)
+
+    def __call__(self, indice):
+        return self[indice]
+
+    def Item(self, indice):
+        return self[indice]
+
+
+class SesionSimulada:
+    """
+    Sesión SAP GUI simulada sobre la transacción ZMM_RECEP_DOCU.
+
+    ``Busy`` es True mientras el grid tiene cambios pendientes o no pasó la
+    latencia desde la última acción, lo que permite medir cuánto se ahorra al
+    esperar condiciones en vez de dormir tiempos fijos.
+
+    Args:
+        grid: FakeGrid a usar (por defecto uno vacío que btn[8] carga con la OC)
+        latencia: Segundos que tardan en verse los cambios
+        reloj: Función de tiempo monotónico
+        entorno: EntornoSimulado compartido con el resto del SAP GUI simulado
+        conexion: ConexionSimulada a la que pertenece (opcional)
+        autenticada: False para empezar en la pantalla de login
+    """
+
+    Type = "GuiSession"
+
+    def __init__(self, grid=None, latencia=0.0, reloj=time.monotonic, entorno=None, conexion=None, autenticada=True):
+        self.entorno = entorno if entorno is not None else EntornoSimulado(latencia=latencia, reloj=reloj)
+        self.reloj = self.entorno.reloj
+        self.latencia = self.entorno.latencia
+        self.grid = grid if grid is not None else FakeGrid(latencia=self.latencia, reloj=self.reloj,
+                                                           columnas=COLUMNAS_GRID, entorno=self.entorno)
+        self.Parent = conexion
+        self.llamadas = Counter()
+        self.Info = InfoSesion(self)
+        self.usuario = "SIMULADO" if autenticada else ""
+        self.programa = "SAPLSMTR_NAVIGATION" if autenticada else PROGRAMA_LOGIN
+        self.transaccion = "SESSION_MANAGER" if autenticada else "S000"
+        self.pantalla = "inicial" if autenticada else "login"
+        self.popup = None
+        self.oc = None
+        self.entregas = []
+        self.etiquetas = []
+        self._controles = {}
+        self._ocupada_hasta = 0.0
+
+    def _llamada(self, metodo, *argumentos):
+        objeto = argumentos[0] if argumentos else "session"
+        self.entorno.llamada(self.llamadas, objeto, metodo, argumentos[1:])
+
+    @property
+    def total_llamadas(self):
+        """Llamadas COM hechas sobre la sesión, sus controles y el grid."""
+        propias = sum(cantidad for metodo, cantidad in self.llamadas.items() if not metodo.startswith("accion:"))
+        return propias + self.grid.total_llamadas
+
+    def registrar_accion(self, tipo, id_control):
+        self.llamadas[f"accion:{tipo}"] += 1
+        self._ocupada_hasta = self.reloj() + self.latencia
+
+    @property
+    def Busy(self):
+        self._llamada("Busy")
+        return self.reloj() < self._ocupada_hasta or self.grid.ocupado
+
+    def _control(self, id_control):
+        if id_control not in self._controles:
+            self._controles[id_control] = ControlSimulado(self, id_control)
+        return self._controles[id_control]
+
+    def findById(self, id_control):
+        self._llamada("findById", id_control)
+        if id_control == ID_GRID:
+            return self.grid
+        if id_control.startswith("wnd[1]"):
+            if self.popup is None or id_control not in CONTROLES_POPUP[self.popup]:
+                raise Exception(f"The control could not be found by id: {id_control}")
+        return self._control(id_control)
+
+    def createSession(self):
+        self._llamada("createSession")
+        if self.Parent is not None:
+            self.Parent.agregar_sesion(autenticada=True)
+
+    # --- Comportamiento de la transacción -------------------------------------------------
+
+    def _tecla(self, id_control, tecla):
+        if id_control != ID_VENTANA or tecla != 0:
+            return
+        if self.programa == PROGRAMA_LOGIN:
+            usuario = self._control(ID_USUARIO)._text
+            if usuario and self._control(ID_CLAVE)._text:
+                self.usuario = usuario
+                self.programa = "SAPLSMTR_NAVIGATION"
+                self.transaccion = "SESSION_MANAGER"
+                self.pantalla = "inicial"
+            return
+        okcode = self._control(ID_OKCODE)
+        comando = okcode._text.strip()
+        okcode._text = ""
+        if comando.lower() == f"/n{TRANSACCION}".lower():
+            self.transaccion = TRANSACCION
+            self.programa = "ZMM_RECEP_DOCU"
+            self.pantalla = "seleccion"
+            self.popup = None
+            if self.entorno.ordenes is not None:
+                self.grid.cargar([])
+        elif comando.lower() == "/nex":
+            if self.Parent is not None:
+                self.Parent.cerrar_sesion(self)
+            self.usuario = ""
+            self.programa = PROGRAMA_LOGIN
+            self.pantalla = "cerrada"
+        elif comando.lower() == "/n":
+            self.transaccion = "SESSION_MANAGER"
+            self.programa = "SAPLSMTR_NAVIGATION"
+            self.pantalla = "inicial"
+            self.popup = None
+
+    def _texto_popup(self, sufijo):
+        return self._control(f"wnd[1]/usr/txtGV_0100_{sufijo}")._text
+
+    def _presionar(self, id_control):
+        if id_control == ID_BOTON_EJECUTAR and self.pantalla == "seleccion":
+            self.oc = self._control(ID_CAMPO_OC)._text.strip()
+            if self.entorno.ordenes is not None:
+                self.grid.cargar(self.entorno.ordenes.get(self.oc, []))
+            self.pantalla = "grid"
+        elif id_control == ID_BOTON_AGREGAR_LOTE:
+            seleccion = str(self.grid._selected_rows).split(",")[0].strip()
+            if seleccion.isdigit():
+                self.grid.insertar_fila(int(seleccion))
+        elif id_control == ID_BOTON_REMITO and self.pantalla == "grid":
+            for sufijo in ("REMITO1", "REMITO2", "BULTOS_FRIO", "BULTOS_SECO", "FACTURA1"):
+                self._control(f"wnd[1]/usr/txtGV_0100_{sufijo}")._text = ""
+            self.popup = "remito"
+        elif id_control == ID_BOTON_GENERAR and self.popup == "remito":
+            self.entregas.append({
+                "oc": self.oc,
+                "remito1": self._texto_popup("REMITO1"),
+                "remito2": self._texto_popup("REMITO2"),
+                "bultos_frio": self._texto_popup("BULTOS_FRIO"),
+                "bultos_seco": self._texto_popup("BULTOS_SECO"),
+                "lineas": [dict(fila) for fila in self.grid.filas if fila.get("CANTIDAD")],
+            })
+            self.popup = "mensaje"
+        elif id_control == ID_BOTON_CONFIRMAR_POPUP and self.popup == "mensaje":
+            self._control(ID_TITULO_IMPRESION)._text = ""
+            self.popup = "impresion"
+        elif id_control == ID_BOTON_IMPRIMIR and self.popup == "impresion":
+            titulo = self._control(ID_TITULO_IMPRESION)._text
+            self.etiquetas.append(titulo)
+            carpeta = self.entorno.carpeta_etiquetas
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+                with open(os.path.join(carpeta, f"Etiqueta {titulo}.pdf"), "wb") as f:
+                    f.write(b"%PDF-1.4 simulado\n")
+            self.popup = None
+            self.pantalla = "inicial"
+
+
+class ConexionSimulada:
+    """Conexión de SAP GUI (GuiConnection) con sus sesiones."""
+
+    def __init__(self, motor, descripcion="S/4 - PRD", autenticada=True):
+        self.motor = motor
+        self.Description = descripcion
+        self.Children = ColeccionSimulada()
+        self.agregar_sesion(autenticada)
+
+    def agregar_sesion(self, autenticada=True):
+        sesion = SesionSimulada(entorno=self.motor.entorno, conexion=self, autenticada=autenticada)
+        self.Children.append(sesion)
+        return sesion
+
+    def cerrar_sesion(self, sesion):
+        if sesion in self.Children:
+            self.Children.remove(sesion)
+
+
+class MotorSimulado:
+    """Motor de scripting (GuiApplication)."""
+
+    def __init__(self, entorno):
+        self.entorno = entorno
+        self.Children = ColeccionSimulada()
+
+    def OpenConnection(self, descripcion, sincronico=True):
+        """Abre una conexión nueva con una sesión en la pantalla de login."""
+        conexion = ConexionSimulada(self, descripcion, autenticada=False)
+        self.Children.append(conexion)
+        return conexion
+
+
+class SapGuiSimulado:
+    """
+    Objeto SAPGUI simulado, punto de entrada para ``backend_sap.BackendSimulado``.
+
+    Args:
+        sesion_abierta: True para arrancar con una conexión y una sesión ya autenticadas
+        **configuracion: Argumentos de EntornoSimulado (ordenes, latencia, latencias, traza, ...)
+    """
+
+    def __init__(self, sesion_abierta=True, **configuracion):
+        self.entorno = EntornoSimulado(**configuracion)
+        self.motor = MotorSimulado(self.entorno)
+        if sesion_abierta:
+            self.motor.Children.append(ConexionSimulada(self.motor))
+
+    @property
+    def GetScriptingEngine(self):
+        return self.motor
+
+    def sesiones(self):
+        """Todas las sesiones abiertas de todas las conexiones."""
+        return [sesion for conexion in self.motor.Children for sesion in conexion.Children]
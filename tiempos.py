@@ -0,0 +1,319 @@
+"""
+Registro estructurado de tiempos por etapa.
+
+``process_entrega``, ``procesar_excel_files`` e ``ingresarsap`` se cronometran
+por etapas (lectura del Excel, navegación, escaneo del grid, escritura, popup
+de remito, espera del PDF...). Cada etapa terminada escribe una línea JSON en
+``Logs/tiempos_AAAAMMDD.jsonl`` con OC, archivo, etapa, duración, llamadas
+COM y filas, así se puede ver en qué se fue el tiempo de una entrega lenta.
+
+Uso dentro de una función decorada con ``cronometrar``:
+
+    @cronometrar("process_entrega", session="session", oc="oc", archivo="path_excel")
+    def process_entrega(session, path_excel, oc, datos_maestros=None):
+        etapa("lectura_excel")
+        ...
+        anotar(filas=len(df))
+        etapa("navegacion_sap")
+
+Resumen p50/p95 por etapa de los registros de un día:
+
+    python tiempos.py --fecha 2026-10-17 --carpeta Logs
+"""
+
+import os
+import sys
+import json
+import time
+import inspect
+import logging
+import argparse
+import threading
+import contextvars
+from functools import wraps
+from datetime import datetime
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+PREFIJO_ARCHIVO = "tiempos"
+
+
+class RegistroTiempos:
+    """
+    Escribe los registros de tiempos como JSON lines, un archivo por día.
+
+    Args:
+        carpeta: Carpeta de destino; None deshabilita el registro (p.ej. al importar sap.py en pruebas)
+    """
+
+    def __init__(self, carpeta=None):
+        self._lock = threading.Lock()
+        self.configurar(carpeta)
+
+    @property
+    def habilitado(self):
+        return bool(self.carpeta)
+
+    def configurar(self, carpeta):
+        self.carpeta = str(carpeta) if carpeta else None
+        if self.carpeta:
+            os.makedirs(self.carpeta, exist_ok=True)
+
+    def ruta(self, fecha=None):
+        fecha = fecha or datetime.now()
+        return os.path.join(self.carpeta, f"{PREFIJO_ARCHIVO}_{fecha.strftime('%Y%m%d')}.jsonl")
+
+    def escribir(self, registro):
+        if not self.habilitado:
+            return
+        linea = json.dumps(registro, ensure_ascii=False, default=str)
+        try:
+            with self._lock:
+                with open(self.ruta(), "a", encoding="utf-8") as f:
+                    f.write(linea + "\n")
+        except OSError as e:
+            logger.debug(f"No se pudo escribir el registro de tiempos: {e}")
+
+
+# Registro global; bot_runner lo apunta a Logs/ al arrancar (o la variable de entorno TIEMPOS_DIR)
+registro_tiempos = RegistroTiempos(os.getenv("TIEMPOS_DIR") or None)
+
+# Etapas en curso del hilo/contexto actual (las funciones cronometradas pueden anidarse)
+_etapas_actuales = contextvars.ContextVar("etapas_actuales", default=None)
+
+
+def contar_llamadas_com(session):
+    """Llamadas COM hechas hasta ahora sobre la sesión, si el backend las cuenta (el simulado sí, COM no)."""
+    if session is None:
+        return None
+    try:
+        from backend_sap import obtener_backend
+        return obtener_backend().contar_llamadas(session)
+    except Exception:
+        return None
+
+
+class Tramo:
+    """
+    Mide una etapa y escribe su registro al terminar.
+
+    Args:
+        etapa: Nombre de la etapa
+        session: Sesión SAP para contar las llamadas COM de la etapa (opcional)
+        registro: RegistroTiempos de destino (por defecto el global)
+        **campos: Campos adicionales del registro (oc, archivo, filas...)
+    """
+
+    def __init__(self, etapa, session=None, registro=None, **campos):
+        self.etapa = etapa
+        self.session = session
+        self.registro = registro if registro is not None else registro_tiempos
+        self.campos = campos
+        self._inicio = None
+        self._com_inicial = None
+
+    def iniciar(self):
+        self._inicio = time.perf_counter()
+        self._com_inicial = contar_llamadas_com(self.session)
+        return self
+
+    def anotar(self, **campos):
+        self.campos.update(campos)
+
+    def terminar(self, ok=True):
+        """Cierra la etapa y devuelve el registro escrito."""
+        duracion = time.perf_counter() - self._inicio
+        com_final = contar_llamadas_com(self.session)
+        llamadas = com_final - self._com_inicial if com_final is not None and self._com_inicial is not None else None
+        archivo = self.campos.get("archivo")
+        registro = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "etapa": self.etapa,
+            "duracion": round(duracion, 4),
+            **self.campos,
+            "archivo": os.path.basename(str(archivo)) if archivo else None,
+            "llamadas_com": llamadas,
+            "ok": ok,
+            "hilo": threading.current_thread().name,
+        }
+        self.registro.escribir(registro)
+        return registro
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, tipo, valor, traza):
+        self.terminar(ok=tipo is None)
+        return False
+
+
+class Etapas:
+    """
+    Etapas consecutivas de una función larga: al empezar una etapa se cierra la anterior.
+
+    Además del registro de cada etapa escribe uno de la función completa (``total``).
+    """
+
+    def __init__(self, nombre, session=None, registro=None, **campos):
+        self.session = session
+        self.registro = registro
+        self.campos = campos
+        self.total = Tramo(nombre, session, registro, **campos)
+        self.actual = None
+
+    def etapa(self, nombre, **campos):
+        self._cerrar_actual(ok=True)
+        self.actual = Tramo(nombre, self.session, self.registro, **{**self.campos, **campos}).iniciar()
+
+    def _cerrar_actual(self, ok):
+        if self.actual is not None:
+            self.actual.terminar(ok)
+            self.actual = None
+
+    def __enter__(self):
+        self.total.iniciar()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self._cerrar_actual(ok=tipo is None)
+        self.total.terminar(ok=tipo is None)
+        return False
+
+
+def cronometrar(nombre, **parametros):
+    """
+    Decorador que mide la función completa y habilita ``etapa``/``anotar`` dentro de ella.
+
+    Args:
+        nombre: Nombre del registro total
+        **parametros: {campo: nombre del parámetro de la función} a copiar en cada registro.
+            El campo ``session`` se usa para contar llamadas COM en vez de escribirse.
+    """
+    def decorador(funcion):
+        firma = inspect.signature(funcion)
+
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            argumentos = firma.bind_partial(*args, **kwargs).arguments
+            campos = {campo: argumentos.get(parametro) for campo, parametro in parametros.items()}
+            session = campos.pop("session", None)
+            etapas = Etapas(nombre, session, **campos)
+            token = _etapas_actuales.set(etapas)
+            try:
+                with etapas:
+                    return funcion(*args, **kwargs)
+            finally:
+                _etapas_actuales.reset(token)
+        return envoltura
+    return decorador
+
+
+def etapa(nombre, **campos):
+    """Empieza una etapa de la función cronometrada en curso (cerrando la anterior); sin función en curso no hace nada."""
+    etapas = _etapas_actuales.get()
+    if etapas is not None:
+        etapas.etapa(nombre, **campos)
+
+
+def anotar(**campos):
+    """Agrega campos (p.ej. ``filas``) al registro de la etapa en curso."""
+    etapas = _etapas_actuales.get()
+    if etapas is not None and etapas.actual is not None:
+        etapas.actual.anotar(**campos)
+
+
+def anotar_total(**campos):
+    """Agrega campos (p.ej. ``resultado``) al registro total de la función cronometrada en curso."""
+    etapas = _etapas_actuales.get()
+    if etapas is not None:
+        etapas.total.anotar(**campos)
+
+
+# --- Agregación ---------------------------------------------------------------------------
+
+def leer_registros(rutas):
+    """Lee los registros de uno o más archivos JSON lines, salteando líneas corruptas."""
+    for ruta in rutas:
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    yield json.loads(linea)
+                except json.JSONDecodeError:
+                    logger.debug(f"Línea inválida en {ruta}: {linea[:80]}")
+
+
+def percentil(valores_ordenados, fraccion):
+    """Percentil por rango más cercano (mismo criterio que RegistroEsperas)."""
+    posicion = min(len(valores_ordenados) - 1, int(round(fraccion * (len(valores_ordenados) - 1))))
+    return valores_ordenados[posicion]
+
+
+def resumir(registros):
+    """
+    Estadísticas por etapa.
+
+    Returns:
+        dict: {etapa: {'cantidad', 'fallidas', 'p50', 'p95', 'maximo', 'total', 'llamadas_com', 'filas'}}
+    """
+    por_etapa = defaultdict(list)
+    for registro in registros:
+        por_etapa[registro.get("etapa", "?")].append(registro)
+
+    resumen = {}
+    for nombre, lista in por_etapa.items():
+        duraciones = sorted(float(r.get("duracion") or 0.0) for r in lista)
+        resumen[nombre] = {
+            "cantidad": len(lista),
+            "fallidas": sum(1 for r in lista if r.get("ok") is False),
+            "p50": percentil(duraciones, 0.50),
+            "p95": percentil(duraciones, 0.95),
+            "maximo": duraciones[-1],
+            "total": sum(duraciones),
+            "llamadas_com": sum(r.get("llamadas_com") or 0 for r in lista),
+            "filas": sum(r.get("filas") or 0 for r in lista),
+        }
+    return resumen
+
+
+def imprimir_resumen(resumen):
+    print(f"{'etapa':<24}{'n':>6}{'fallas':>8}{'p50 (s)':>10}{'p95 (s)':>10}{'máx (s)':>10}{'total (s)':>11}{'COM':>9}{'filas':>8}")
+    for nombre, datos in sorted(resumen.items(), key=lambda item: -item[1]["total"]):
+        print(f"{nombre:<24}{datos['cantidad']:>6}{datos['fallidas']:>8}{datos['p50']:>10.3f}{datos['p95']:>10.3f}"
+              f"{datos['maximo']:>10.3f}{datos['total']:>11.1f}{datos['llamadas_com']:>9}{datos['filas']:>8}")
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Resumen p50/p95 por etapa de los registros de tiempos")
+    parser.add_argument("archivos", nargs="*", help="Archivos .jsonl (por defecto el del día en --carpeta)")
+    parser.add_argument("--carpeta", default=os.getenv("TIEMPOS_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Logs"))
+    parser.add_argument("--fecha", help="Día a resumir (AAAA-MM-DD), por defecto hoy")
+    parser.add_argument("--oc", help="Solo los registros de esta OC")
+    parser.add_argument("--json", action="store_true", help="Imprimir el resumen como JSON")
+    args = parser.parse_args(argumentos)
+
+    rutas = args.archivos
+    if not rutas:
+        fecha = datetime.strptime(args.fecha, "%Y-%m-%d") if args.fecha else datetime.now()
+        rutas = [RegistroTiempos(args.carpeta).ruta(fecha)]
+    faltantes = [ruta for ruta in rutas if not os.path.exists(ruta)]
+    if faltantes:
+        print(f"No existe: {', '.join(faltantes)}", file=sys.stderr)
+        return 1
+
+    registros = leer_registros(rutas)
+    if args.oc:
+        registros = (r for r in registros if str(r.get("oc")) == args.oc)
+    resumen = resumir(registros)
+    if args.json:
+        print(json.dumps(resumen, indent=2, ensure_ascii=False))
+    else:
+        imprimir_resumen(resumen)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,11 @@
 import os
 import pandas as pd
 import logging
-from conn import connection
+from conn import obtener_pool
+from cache_oc import cache_por_oc
+from grilla import normalizar_ean
+
+logger = logging.getLogger(__name__)
 
 def setup_logging(bot_name, log_file=None):
     """Configurar logging para un bot específico"""
@@ -26,6 +30,7 @@ def ensure_directories():
         if not os.path.exists(directory):
             os.makedirs(directory)
 
+@cache_por_oc
 def consultarCadenaFrio(oc_numero: str) -> bool:
     """
     Devuelve True si la orden de compra es de cadena de frío, False si es seco.
@@ -36,14 +41,14 @@ def consultarCadenaFrio(oc_numero: str) -> bool:
     Retorna:
     - bool: True si es frío, False si es seco.
     """
-    conn = connection('PRD')
     query = f"""
         SELECT m.ZZCADENA_FRIO, m.MATNR
         FROM EKPO e
         JOIN MARA m ON m.MATNR = e.MATNR 
         WHERE e.EBELN = '{oc_numero}'
     """
-    df_oc = pd.read_sql_query(query, conn)
+    with obtener_pool('PRD').conexion() as conn:
+        df_oc = pd.read_sql_query(query, conn)
 
     # Verifica si al menos un valor en la columna es 'X'
     if (df_oc["ZZCADENA_FRIO"] == 'X').any():
@@ -52,17 +57,19 @@ def consultarCadenaFrio(oc_numero: str) -> bool:
         return False
     
 
+@cache_por_oc
 def devolverEanOC(oc_numero):
-    conn = connection('PRD')
     query = f"""
         SELECT DISTINCT e.EAN11, e.MENGE
         FROM MARA m
         JOIN EKPO e ON m.MANDT = e.MANDT
         WHERE e.EBELN = '{oc_numero}'
         """
-    df_ean = pd.read_sql_query(query, conn)
+    with obtener_pool('PRD').conexion() as conn:
+        df_ean = pd.read_sql_query(query, conn)
     return df_ean
 
+@cache_por_oc
 def obtener_mapping_ean_material(oc_numero):
     """
     Obtiene el mapeo entre EAN y código de material para una OC.
@@ -73,7 +80,6 @@ def obtener_mapping_ean_material(oc_numero):
     Returns:
         dict: Diccionario {EAN: MATNR}
     """
-    conn = connection('PRD')
     query = f"""
         SELECT DISTINCT 
             m.EAN11,
@@ -83,30 +89,131 @@ def obtener_mapping_ean_material(oc_numero):
         WHERE e.EBELN = '{oc_numero}'
         AND m.EAN11 IS NOT NULL
     """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    with obtener_pool('PRD').conexion() as conn:
+        df = pd.read_sql_query(query, conn)
     
     return dict(zip(df['EAN11'], df['MATNR']))
 
 
+# Cantidad máxima de OCs por consulta IN (...) en el prefetch
+TAMANO_LOTE_OC = 500
+
+COLUMNAS_DATOS_MAESTROS = ['EBELN', 'EBELP', 'MATNR', 'EAN11_POS', 'MENGE', 'EAN11_MAT', 'ZZCADENA_FRIO']
+
+
+class DatosMaestrosOC:
+    """
+    Datos maestros de varias OCs obtenidos en bloque antes de procesar la cola.
+
+    Args:
+        df: DataFrame con columnas EBELN, EBELP, MATNR, EAN11_POS, MENGE, EAN11_MAT, ZZCADENA_FRIO
+        ocs: OCs consultadas (las que no tienen posiciones quedan registradas igual)
+    """
+
+    def __init__(self, df, ocs):
+        self.ocs = {str(oc) for oc in ocs}
+        self._por_oc = {str(oc): grupo for oc, grupo in df.groupby('EBELN')} if not df.empty else {}
+
+    def __contains__(self, oc_numero):
+        return str(oc_numero) in self.ocs
+
+    def _posiciones(self, oc_numero):
+        return self._por_oc.get(str(oc_numero), pd.DataFrame(columns=COLUMNAS_DATOS_MAESTROS))
+
+    def es_cadena_frio(self, oc_numero):
+        """Equivalente a consultarCadenaFrio para una OC del prefetch."""
+        return bool((self._posiciones(oc_numero)['ZZCADENA_FRIO'] == 'X').any())
+
+    def eans_oc(self, oc_numero):
+        """EAN11/MENGE de las posiciones de la OC (como devolverEanOC)."""
+        df = self._posiciones(oc_numero)[['EAN11_POS', 'MENGE']].rename(columns={'EAN11_POS': 'EAN11'})
+        return df.drop_duplicates().reset_index(drop=True)
+
+    def mapping_ean_material(self, oc_numero):
+        """Diccionario {EAN: MATNR} de la OC (como obtener_mapping_ean_material)."""
+        df = self._posiciones(oc_numero)
+        df = df[df['EAN11_MAT'].notna()]
+        return dict(zip(df['EAN11_MAT'], df['MATNR']))
+
+    def cantidades_por_ean(self, oc_numero):
+        """Diccionario {EAN normalizado: MENGE total} de la OC, por EAN11 de la posición o del material."""
+        cantidades = {}
+        contadas = set()  # (posición, EAN): cada posición suma una vez aunque el JOIN la repita
+        columnas = ['EBELP', 'EAN11_POS', 'EAN11_MAT', 'MENGE']
+        for posicion, ean_pos, ean_mat, menge in self._posiciones(oc_numero)[columnas].itertuples(index=False, name=None):
+            for ean in {normalizar_ean(ean) for ean in (ean_pos, ean_mat) if pd.notna(ean)} - {""}:
+                if (posicion, ean) in contadas:
+                    continue
+                contadas.add((posicion, ean))
+                cantidades[ean] = cantidades.get(ean, 0.0) + (float(menge) if pd.notna(menge) else 0.0)
+        return cantidades
+
+
+def prefetch_datos_maestros(oc_numeros, ambiente='PRD', tamano_lote=TAMANO_LOTE_OC):
+    """
+    Consulta en bloque cadena de frío, EAN11, MATNR y MENGE de todas las OCs dadas.
+    
+    Usa una consulta parametrizada con IN (...) por cada lote de ``tamano_lote`` OCs,
+    en lugar de una consulta por archivo.
+    
+    Args:
+        oc_numeros: Números de OC a consultar
+        ambiente: Ambiente de base de datos (QAS/PRD)
+        tamano_lote: Cantidad máxima de OCs por consulta
+        
+    Returns:
+        DatosMaestrosOC: Datos de todas las OCs consultadas
+    """
+    ocs = sorted({str(oc) for oc in oc_numeros if oc})
+    if not ocs:
+        return DatosMaestrosOC(pd.DataFrame(columns=COLUMNAS_DATOS_MAESTROS), [])
+    
+    partes = []
+    with obtener_pool(ambiente).conexion() as conn:
+        for inicio in range(0, len(ocs), tamano_lote):
+            lote = ocs[inicio:inicio + tamano_lote]
+            marcadores = ", ".join("?" for _ in lote)
+            query = f"""
+                SELECT e.EBELN, e.EBELP, e.MATNR, e.EAN11 AS EAN11_POS, e.MENGE,
+                       m.EAN11 AS EAN11_MAT, m.ZZCADENA_FRIO
+                FROM EKPO e
+                JOIN MARA m ON e.MATNR = m.MATNR AND e.MANDT = m.MANDT
+                WHERE e.EBELN IN ({marcadores})
+            """  # nosec B608 - solo se interpolan marcadores "?", los valores van como parámetros
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query, lote)
+                filas = cursor.fetchall()
+            finally:
+                cursor.close()
+            partes.append(pd.DataFrame([tuple(fila) for fila in filas], columns=COLUMNAS_DATOS_MAESTROS))
+    
+    df = pd.concat(partes, ignore_index=True)
+    df['EBELN'] = df['EBELN'].astype(str)
+    logger.info(f"📦 Prefetch de datos maestros: {len(ocs)} OCs, {len(df)} posiciones en {len(partes)} consultas")
+    return DatosMaestrosOC(df, ocs)
+
+
 def validar_estructura_excel(df_excel):
     """
     Valida que el Excel tenga las columnas requeridas.
     
     Args:
-        df_excel: DataFrame del Excel
+        df_excel: DataFrame del Excel, o la lista de encabezados de la hoja
         
     Returns:
         tuple: (es_valido, mensaje_error)
     """
     columnas_requeridas = [
         'Remito y Nro. Entrega',
+        'EAN',
         'Cant confirmada',
         'Lote estuche',
         'Fecha Vencimiento'
     ]
     
-    columnas_faltantes = [col for col in columnas_requeridas if col not in df_excel.columns]
+    columnas = list(getattr(df_excel, 'columns', df_excel))
+    columnas_faltantes = [col for col in columnas_requeridas if col not in columnas]
     
     if columnas_faltantes:
         return False, f"Columnas faltantes en Excel: {', '.join(columnas_faltantes)}"
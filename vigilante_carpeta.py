@@ -0,0 +1,267 @@
+"""
+Ingesta por eventos de la carpeta no_procesados.
+
+El scheduler revisaba la carpeta cada 5 minutos (con un tick de 30 s), de modo
+que una entrega podía esperar más de 5 minutos antes de procesarse. El
+vigilante recibe los eventos del sistema de archivos con watchdog (si está
+instalado) y, como respaldo, vuelve a listar la carpeta cada cierto tiempo.
+Un archivo recién copiado no se entrega hasta que su tamaño y fecha de
+modificación se mantienen sin cambios durante ``espera_estable`` segundos,
+para no abrir Excels a medio escribir.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from pathlib import Path
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # watchdog es opcional: sin él se usa solo el sondeo
+    Observer = None
+    FileSystemEventHandler = object
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES_EXCEL = (".xlsx", ".xls")
+ESPERA_ESTABLE = 2.0  # segundos con tamaño y mtime sin cambios
+INTERVALO_VERIFICACION = 0.5  # cada cuánto se revisan los archivos en observación
+INTERVALO_RESPALDO = 60.0  # relistado de respaldo cuando hay eventos de watchdog
+INTERVALO_SONDEO = 5.0  # sondeo principal cuando watchdog no está disponible
+
+
+def es_excel(ruta):
+    """True si la ruta es un Excel de entrega (se ignoran los archivos de bloqueo ~$ de Office)."""
+    nombre = os.path.basename(str(ruta))
+    return nombre.lower().endswith(EXTENSIONES_EXCEL) and not nombre.startswith("~$")
+
+
+def listar_excel(carpeta):
+    """
+    Lista los Excel de la carpeta en una sola pasada (antes eran dos glob, *.xlsx y *.xls).
+
+    Returns:
+        list[Path]: Archivos ordenados por nombre
+    """
+    try:
+        with os.scandir(carpeta) as entradas:
+            return sorted(Path(e.path) for e in entradas if e.is_file() and es_excel(e.name))
+    except FileNotFoundError:
+        return []
+
+
+def firma_archivo(ruta):
+    """(tamaño, mtime) del archivo, o None si ya no existe."""
+    try:
+        stat = os.stat(ruta)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+class EstabilizadorArchivos:
+    """
+    Debounce de archivos que se están escribiendo.
+
+    Args:
+        espera_estable: Segundos que tamaño y mtime deben mantenerse iguales
+        reloj: Función de tiempo monotónico (inyectable para pruebas)
+    """
+
+    def __init__(self, espera_estable=ESPERA_ESTABLE, reloj=time.monotonic):
+        self.espera_estable = espera_estable
+        self.reloj = reloj
+        self._observados = {}  # ruta -> ((tamaño, mtime), desde)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._observados)
+
+    def observar(self, ruta):
+        """Empieza a observar un archivo; los cambios posteriores los detecta ``listos``."""
+        with self._lock:
+            self._observados.setdefault(Path(ruta), (None, self.reloj()))
+
+    def olvidar(self, ruta):
+        with self._lock:
+            self._observados.pop(Path(ruta), None)
+
+    def listos(self):
+        """
+        Revisa los archivos observados y devuelve los que ya están estables.
+
+        Los archivos que desaparecieron se dejan de observar; los estables se
+        quitan de la observación al devolverlos.
+
+        Returns:
+            list[Path]: Archivos listos para procesar
+        """
+        ahora = self.reloj()
+        listos = []
+        with self._lock:
+            for ruta, (firma_anterior, desde) in list(self._observados.items()):
+                firma = firma_archivo(ruta)
+                if firma is None:
+                    del self._observados[ruta]
+                    continue
+                if firma != firma_anterior:
+                    self._observados[ruta] = (firma, ahora)
+                elif firma[0] > 0 and ahora - desde >= self.espera_estable:
+                    del self._observados[ruta]
+                    listos.append(ruta)
+        return sorted(listos)
+
+
+class _ManejadorEventos(FileSystemEventHandler):
+    """Traduce los eventos de watchdog en archivos a observar."""
+
+    def __init__(self, vigilante):
+        super().__init__()
+        self.vigilante = vigilante
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.vigilante.notificar(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.vigilante.notificar(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.vigilante.notificar(event.dest_path)
+
+
+class VigilanteCarpeta:
+    """
+    Vigila una carpeta y pone en ``cola`` los Excel nuevos una vez estables.
+
+    Un archivo ya encolado no se vuelve a encolar mientras siga igual: si el
+    procesamiento falla y queda en la carpeta no se reintenta en bucle, pero
+    si se reemplaza (otro tamaño/mtime) o se vuelve a copiar, sí.
+
+    Args:
+        carpeta: Carpeta a vigilar (no_procesados)
+        cola: queue.Queue donde se dejan las rutas listas (por defecto una nueva)
+        espera_estable: Segundos de debounce para archivos a medio escribir
+        intervalo_sondeo: Cada cuánto relistar la carpeta (por defecto INTERVALO_RESPALDO
+            con watchdog, INTERVALO_SONDEO sin él)
+        usar_watchdog: False para forzar el modo sondeo
+        reloj: Función de tiempo monotónico (inyectable para pruebas)
+    """
+
+    def __init__(self, carpeta, cola=None, espera_estable=ESPERA_ESTABLE, intervalo_sondeo=None,
+                 usar_watchdog=True, reloj=time.monotonic):
+        self.carpeta = Path(carpeta)
+        self.cola = cola if cola is not None else queue.Queue()
+        self._intervalo_sondeo = intervalo_sondeo
+        self.usar_watchdog = usar_watchdog and Observer is not None
+        self.reloj = reloj
+        self.estabilizador = EstabilizadorArchivos(espera_estable, reloj)
+        self._entregados = {}  # ruta -> firma con la que se encoló
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._observer = None
+
+    @property
+    def modo(self):
+        return "eventos" if self.usar_watchdog else "sondeo"
+
+    @property
+    def intervalo_sondeo(self):
+        if self._intervalo_sondeo is not None:
+            return self._intervalo_sondeo
+        return INTERVALO_RESPALDO if self.usar_watchdog else INTERVALO_SONDEO
+
+    def notificar(self, ruta):
+        """Registra un archivo nuevo o modificado (llamado por watchdog o por el sondeo)."""
+        ruta = Path(ruta)
+        if not es_excel(ruta):
+            return
+        with self._lock:
+            if ruta in self._entregados:
+                if self._entregados[ruta] == firma_archivo(ruta):
+                    return
+                del self._entregados[ruta]
+        self.estabilizador.observar(ruta)
+
+    def escanear(self):
+        """Observa todos los Excel presentes en la carpeta y olvida los que ya no están."""
+        presentes = listar_excel(self.carpeta)
+        with self._lock:
+            for ruta in set(self._entregados) - set(presentes):
+                del self._entregados[ruta]
+        for ruta in presentes:
+            self.notificar(ruta)
+
+    def verificar(self):
+        """
+        Encola los archivos que ya están estables.
+
+        Returns:
+            int: Cantidad de archivos encolados
+        """
+        listos = self.estabilizador.listos()
+        encolados = 0
+        for ruta in listos:
+            firma = firma_archivo(ruta)
+            if firma is None:
+                continue
+            with self._lock:
+                if self._entregados.get(ruta) == firma:
+                    continue
+                self._entregados[ruta] = firma
+            self.cola.put(ruta)
+            encolados += 1
+        return encolados
+
+    def liberar(self, ruta):
+        """Permite volver a encolar un archivo aunque no haya cambiado (p.ej. para reintentarlo)."""
+        with self._lock:
+            self._entregados.pop(Path(ruta), None)
+
+    def iniciar(self):
+        """Arranca el observador de watchdog (si hay) y el hilo de verificación."""
+        self.carpeta.mkdir(parents=True, exist_ok=True)
+        if self.usar_watchdog:
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_ManejadorEventos(self), str(self.carpeta), recursive=False)
+                self._observer.start()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo iniciar watchdog, se usa sondeo: {e}")
+                self._observer = None
+                self.usar_watchdog = False
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="vigilante-no_procesados", daemon=True)
+        self._hilo.start()
+        logger.info(f"👀 Vigilando {self.carpeta} (modo {self.modo})")
+
+    def detener(self):
+        self._detener.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
+
+    def _bucle(self):
+        # Los archivos que ya estaban antes de arrancar no generan eventos
+        self.escanear()
+        ultimo_escaneo = self.reloj()
+        while not self._detener.is_set():
+            if self.reloj() - ultimo_escaneo >= self.intervalo_sondeo:
+                self.escanear()
+                ultimo_escaneo = self.reloj()
+            try:
+                self.verificar()
+            except Exception as e:
+                logger.error(f"❌ Error verificando archivos de {self.carpeta}: {e}")
+            self._detener.wait(INTERVALO_VERIFICACION)